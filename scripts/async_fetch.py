@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import os
+import random
+from typing import Callable, Dict, Iterable, List, Set, Tuple, Union
+
+from playwright.async_api import async_playwright
+from playwright.async_api import Error, TimeoutError
+
+import metrics
+from throttle import AdaptiveThrottle, get_throttle, parse_retry_after, THROTTLE_STATUSES
+
+
+# Selectors of elements that are only present once a page is fully rendered
+BOOK_PAGE_SELECTOR = 'h1[data-testid="bookTitle"]'
+BOOK_LIST_SELECTOR = 'table.tableList'
+
+
+class AsyncFetcher:
+    """Fetch rendered HTML with a single long-lived browser and a pool of pages, running
+    up to `concurrency` fetches at the same time under the adaptive throttle of each host,
+    which starts at `rate` requests per second and adapts between `min_rate` and `max_rate`.
+
+    Use as an async context manager:
+
+        async with AsyncFetcher(concurrency=4, rate=0.5) as fetcher:
+            html = await fetcher.fetch(url, wait_selector=BOOK_PAGE_SELECTOR)
+    """
+
+    def __init__(self, concurrency: int = 4, rate: float = 0.5, min_rate: float = 0.05, max_rate: float = 2.0,
+                 max_attempts: int = 5, backoff_base: float = 2.0, backoff_max: float = 120.0,
+                 timeout: float = 30.0, headless: bool = True, device: str = "Desktop Firefox"):
+        self.concurrency = concurrency
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.headless = headless
+        self.device = device
+        self.last_errors: Dict[str, str] = {}
+        # URLs that were served but lack the expected content, retrying them won't help
+        self.content_failures: Set[str] = set()
+        self.playwright = None
+        self.browser = None
+        self.pages: Union[asyncio.Queue, None] = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def start(self) -> None:
+        self.playwright = await async_playwright().start()
+        self.browser = await self.playwright.webkit.launch(headless=self.headless)
+        self.pages = asyncio.Queue()
+        for _ in range(self.concurrency):
+            self.pages.put_nowait(await self._new_page())
+
+    async def close(self) -> None:
+        if self.browser is not None:
+            await self.browser.close()
+            self.browser = None
+        if self.playwright is not None:
+            await self.playwright.stop()
+            self.playwright = None
+
+    async def _new_page(self):
+        """Open a page in a fresh browser context, so pages do not share cookies or state."""
+        context = await self.browser.new_context(**self.playwright.devices[self.device])
+        page = await context.new_page()
+        page.set_default_timeout(self.timeout * 1000)
+        return page
+
+    def get_host_throttle(self, url: str) -> AdaptiveThrottle:
+        return get_throttle(url, rate=self.rate, min_rate=self.min_rate, max_rate=self.max_rate)
+
+    def get_backoff(self, attempt: int) -> float:
+        """Exponential backoff with jitter for the given (zero-based) attempt number."""
+        backoff = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return backoff * (0.5 + random.random() / 2)
+
+    async def fetch(self, url: str, wait_selector: str = None) -> Union[str, None]:
+        """Fetch the rendered HTML of a URL, waiting for `wait_selector` to appear
+        if given. Returns None if all attempts failed or the page lacks `wait_selector`."""
+        throttle = self.get_host_throttle(url)
+        page = await self.pages.get()
+        try:
+            for attempt in range(self.max_attempts):
+                with metrics.timer('fetch.rate_limit_wait_seconds'):
+                    await throttle.acquire()
+                metrics.counter('fetch.attempts').inc()
+                if attempt > 0:
+                    metrics.counter('fetch.retries').inc()
+                try:
+                    with metrics.timer('fetch.seconds'):
+                        try:
+                            response = await page.goto(url, wait_until='domcontentloaded')
+                        except TimeoutError:
+                            # a navigation timeout means the server is slow, so back off
+                            throttle.on_throttle()
+                            raise
+                        if response is not None and response.status >= 400:
+                            metrics.counter(f'fetch.status_{response.status}').inc()
+                            if response.status in THROTTLE_STATUSES:
+                                throttle.on_throttle(parse_retry_after(response.headers.get('retry-after')))
+                            raise Error(f"HTTP status {response.status} for {url}")
+                        if wait_selector is not None and not await self.wait_for_selector(page, url, wait_selector):
+                            if throttle.on_response(200, await page.inner_html('html')):
+                                raise Error(f"block page for {url}")
+                            # the page was served but lacks the expected content, fetching it again won't help
+                            self.content_failures.add(url)
+                            return None
+                        html = await page.inner_html('html')
+                    if throttle.on_response(200, html):
+                        raise Error(f"block page for {url}")
+                    metrics.counter('fetch.pages').inc()
+                    metrics.histogram('fetch.page_bytes', buckets=metrics.SIZE_BUCKETS).observe(len(html))
+                    return html
+                except (TimeoutError, Error) as err:
+                    logging.error(f"attempt {attempt+1} of {self.max_attempts} failed for {url}: {err}")
+                    metrics.counter('fetch.errors').inc()
+                    self.last_errors[url] = str(err)
+                    if page.is_closed():
+                        page = await self._new_page()
+                    if attempt + 1 < self.max_attempts:
+                        await asyncio.sleep(self.get_backoff(attempt))
+            logging.error(f"failed fetching {url} after {self.max_attempts} attempts")
+            metrics.counter('fetch.failed').inc()
+            return None
+        finally:
+            self.pages.put_nowait(page)
+
+    async def wait_for_selector(self, page, url: str, wait_selector: str) -> bool:
+        """Wait for the element that marks a fully rendered page. Returns False, and records
+        the error, if it does not appear: a content failure, which fetch does not retry and which
+        does not slow down the throttle of the host. Callers with their own retries, like
+        crawl_frontier, should not retry the URLs in `content_failures` either."""
+        try:
+            await page.wait_for_selector(wait_selector)
+            return True
+        except TimeoutError:
+            logging.error(f"selector {wait_selector} not found in {url}")
+            metrics.counter('fetch.selector_missing').inc()
+            self.last_errors[url] = f"selector {wait_selector} not found"
+            return False
+
+    async def fetch_all(self, urls: Iterable[str], handler: Callable[[str, Union[str, None]], None],
+                        wait_selector: str = None) -> None:
+        """Fetch all URLs concurrently and call `handler(url, html)` as each page arrives."""
+        async def fetch_and_handle(url):
+            html = await self.fetch(url, wait_selector=wait_selector)
+            handler(url, html)
+
+        await asyncio.gather(*(fetch_and_handle(url) for url in urls))
+
+
+def write_html_file(html_file: str, html: str) -> None:
+    with open(html_file, 'wt') as fh_out:
+        fh_out.write(html)
+    metrics.counter('pages.written').inc()
+    metrics.counter('pages.bytes_written').inc(len(html))
+
+
+def fetch_to_files(jobs: List[Tuple[str, str]], wait_selector: str = None,
+                   **fetcher_kwargs) -> Dict[str, int]:
+    """Fetch a list of (url, output file) jobs concurrently and write each page
+    to its output file. Returns the number of written and failed pages."""
+    output_files = dict(jobs)
+    stats = {'written': 0, 'failed': 0}
+
+    def write_page(url: str, html: Union[str, None]) -> None:
+        if html is None:
+            logging.error(f"Error downloading {url}")
+            stats['failed'] += 1
+            return None
+        write_html_file(output_files[url], html)
+        stats['written'] += 1
+        logging.info(f"{stats['written']} of {len(output_files)} written: {output_files[url]}")
+
+    async def run():
+        async with AsyncFetcher(**fetcher_kwargs) as fetcher:
+            await fetcher.fetch_all(output_files.keys(), write_page, wait_selector=wait_selector)
+
+    if len(output_files) > 0:
+        asyncio.run(run())
+    return stats
+
+
+def make_dir(dirname: str) -> None:
+    if not os.path.isdir(dirname):
+        os.mkdir(dirname)
+        logging.info(f"creating directory {dirname}")
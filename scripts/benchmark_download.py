@@ -0,0 +1,102 @@
+import argparse
+import glob
+import os
+import shutil
+import tempfile
+import time
+from typing import Callable, List
+
+import requests
+
+from download import get_text_throttled
+from http_cache import HTTPCache, get_session
+from local_server import start_local_server
+from throttle import get_throttle
+
+
+def time_downloads(urls: List[str], get_text: Callable[[str], str]) -> float:
+    start = time.perf_counter()
+    for url in urls:
+        get_text(url)
+    return time.perf_counter() - start
+
+
+def benchmark_downloads(page_dir: str, max_pages: int = 500, pool_size: int = 10) -> None:
+    """Compare bare requests.get calls with a pooled session and with the HTTP cache,
+    downloading saved pages from a local stand-in server."""
+    server, base_url = start_local_server(page_dir)
+    page_files = sorted(glob.glob(os.path.join(page_dir, '*.html')))[:max_pages]
+    urls = [f"{base_url}/{os.path.basename(page_file)}" for page_file in page_files]
+    if len(urls) == 0:
+        print(f"no HTML files in {page_dir}")
+        return None
+    cache_dir = tempfile.mkdtemp(prefix='http_cache-')
+    try:
+        cache = HTTPCache(cache_dir, session=get_session(pool_size=pool_size))
+        timings = {
+            'requests.get per URL': time_downloads(urls, lambda url: requests.get(url).text),
+            'pooled session': time_downloads(urls, lambda url: cache.session.get(url).text),
+            'cache, cold': time_downloads(urls, cache.get_text),
+            'cache, revalidated': time_downloads(urls, cache.get_text),
+        }
+        for name, timing in timings.items():
+            print(f"{name: <22} {1000 * timing / len(urls): >8.2f} ms/page")
+        print(f"cache stats: {cache.stats}")
+    finally:
+        shutil.rmtree(cache_dir)
+        server.shutdown()
+    return None
+
+
+def benchmark_throttle(page_dir: str, max_pages: int = 100, server_rate: float = 5.0,
+                       fixed_delay: float = 1.0) -> None:
+    """Compare a fixed delay between requests with the adaptive throttle, downloading saved
+    pages from a local stand-in server that answers with 429 above `server_rate` requests/s.
+    The throttle starts at the rate of the fixed delay and is allowed to go well above the
+    server rate, so it has to find the limit from the 429 responses."""
+    server, base_url = start_local_server(page_dir, max_rate=server_rate)
+    page_files = sorted(glob.glob(os.path.join(page_dir, '*.html')))[:max_pages]
+    urls = [f"{base_url}/{os.path.basename(page_file)}" for page_file in page_files]
+    if len(urls) == 0:
+        print(f"no HTML files in {page_dir}")
+        return None
+    cache_dir = tempfile.mkdtemp(prefix='http_cache-')
+    try:
+        session = get_session()
+
+        def get_text_fixed_delay(url: str) -> str:
+            time.sleep(fixed_delay)
+            return session.get(url).text
+
+        timing = time_downloads(urls, get_text_fixed_delay)
+        print(f"{'fixed delay': <16} {timing: >8.1f}s, throttled: {server.rate_limiter.counts['throttled']}")
+        server.rate_limiter.counts['throttled'] = 0
+        throttle = get_throttle(base_url, rate=1 / fixed_delay, min_rate=0.5 / fixed_delay,
+                                max_rate=4 * server_rate, increase=0.25)
+        cache = HTTPCache(cache_dir, session=session)
+        timing = time_downloads(urls, lambda url: get_text_throttled(cache, url))
+        print(f"{'adaptive': <16} {timing: >8.1f}s, throttled: {server.rate_limiter.counts['throttled']}, "
+              f"final rate: {throttle.rate:.2f} requests/s")
+    finally:
+        shutil.rmtree(cache_dir)
+        server.shutdown()
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark page downloads against a local stand-in server.')
+    parser.add_argument('page_dir', help='directory with saved HTML pages')
+    parser.add_argument('--max-pages', type=int, default=500)
+    parser.add_argument('--pool-size', type=int, default=10)
+    parser.add_argument('--throttle', action='store_true',
+                        help='compare a fixed delay with the adaptive throttle against a throttling server')
+    parser.add_argument('--server-rate', type=float, default=5.0, help='requests/s the throttling server allows')
+    args = parser.parse_args()
+    if args.throttle:
+        benchmark_throttle(args.page_dir, max_pages=args.max_pages, server_rate=args.server_rate)
+    else:
+        benchmark_downloads(args.page_dir, max_pages=args.max_pages, pool_size=args.pool_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import resource
+import time
+from typing import Dict, List, Tuple
+
+from bs4 import BeautifulSoup
+
+from parse import get_book_metadata, get_review_text, parse_review, extract_review
+from parse import get_book_list_books, get_book_list_pagination_urls, extract_enjoyed_books
+from synthetic_pages import make_page, get_fixture_files, PAGE_KINDS
+from benchmark_parse import check_fixture_parity
+
+
+PARSER_BACKENDS = ['lxml', 'html.parser', 'xml']
+
+# the extractors that are benchmarked on each kind of page
+PAGE_EXTRACTORS = {
+    'old_style': ['get_book_metadata', 'get_review_text', 'parse_review'],
+    'new_style': ['extract_review', 'extract_enjoyed_books'],
+    'book_list': ['get_book_list_books', 'get_book_list_pagination_urls'],
+}
+
+# extractors that process one review at a time, for which the time per review is reported
+REVIEW_EXTRACTORS = {'get_review_text', 'parse_review', 'extract_review'}
+
+DEFAULT_SIZES = [10, 100, 1000]
+
+
+def run_extractor(extractor: str, soup: BeautifulSoup, expected: Dict[str, any]):
+    """Run an extractor on a parsed page the way the crawl and extraction code calls it."""
+    if extractor == 'get_book_metadata':
+        book_review_file = os.path.join('HTML', expected['lang'], f"{expected['book_id']}.html")
+        return get_book_metadata(expected['book_id'], book_review_file, soup)
+    elif extractor == 'get_review_text':
+        return [get_review_text(review_div) for review_div in soup.find_all('div', class_="review")]
+    elif extractor == 'parse_review':
+        return [parse_review(expected['book_id'], expected['lang'], review_div)
+                for review_div in soup.find_all('div', class_="review")]
+    elif extractor == 'extract_review':
+        return [extract_review(review_card) for review_card in soup.find_all('article', class_="ReviewCard")]
+    elif extractor == 'extract_enjoyed_books':
+        return extract_enjoyed_books(soup)
+    elif extractor == 'get_book_list_books':
+        return get_book_list_books(soup, expected['book_list'])
+    elif extractor == 'get_book_list_pagination_urls':
+        return get_book_list_pagination_urls(soup)
+    raise ValueError(f"unknown extractor '{extractor}'")
+
+
+def check_output(extractor: str, soup: BeautifulSoup, expected: Dict[str, any]) -> Tuple[bool, str]:
+    """Run an extractor and compare its output with the expected output."""
+    try:
+        output = run_extractor(extractor, soup, expected)
+    except Exception as err:
+        return False, f"{type(err).__name__}: {err}"
+    if output != expected[extractor]:
+        return False, 'output differs from the expected output'
+    return True, ''
+
+
+def run_benchmark_case(page_kind: str, size: int, parser: str, extractor: str,
+                       repeats: int) -> Dict[str, any]:
+    """Parse a synthetic page and run a single extractor on it `repeats` times. Runs in
+    a fresh process, so the peak RSS belongs to this parser and extractor only."""
+    html, expected = make_page(page_kind, size)
+    parse_time = 0.0
+    extract_time = 0.0
+    correct, error = check_output(extractor, BeautifulSoup(html, features=parser), expected)
+    for _ in range(repeats):
+        start = time.perf_counter()
+        soup = BeautifulSoup(html, features=parser)
+        parse_time += time.perf_counter() - start
+        start = time.perf_counter()
+        try:
+            run_extractor(extractor, soup, expected)
+        except Exception:
+            pass
+        extract_time += time.perf_counter() - start
+        soup.decompose()
+    return {
+        'page_kind': page_kind,
+        'size': size,
+        'parser': parser,
+        'extractor': extractor,
+        'repeats': repeats,
+        'parse_time': parse_time,
+        'extract_time': extract_time,
+        'pages_per_sec': repeats / (parse_time + extract_time),
+        'us_per_review': 1e6 * extract_time / (repeats * size) if extractor in REVIEW_EXTRACTORS else None,
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'correct': correct,
+        'error': error,
+    }
+
+
+def run_benchmarks(sizes: List[int], parsers: List[str], repeats: int) -> List[Dict[str, any]]:
+    cases = [(page_kind, size, parser, extractor, repeats)
+             for page_kind in PAGE_KINDS for size in sizes for parser in parsers
+             for extractor in PAGE_EXTRACTORS[page_kind]]
+    # a fresh process per case keeps the peak RSS of one case from hiding that of the next
+    with multiprocessing.get_context('spawn').Pool(processes=1, maxtasksperchild=1) as pool:
+        return pool.starmap(run_benchmark_case, cases, chunksize=1)
+
+
+def check_golden_fixtures(fixture_dir: str, parsers: List[str]) -> int:
+    """Compare the output of all extractors on the golden fixture pages with the stored
+    expected output. Returns the number of mismatches for the lxml parser, which is the
+    parser used by the crawl and extraction code."""
+    num_errors = 0
+    for json_file in sorted(glob.glob(os.path.join(fixture_dir, '*.json'))):
+        page_kind, size = os.path.basename(json_file).replace('.json', '').split('-')
+        html_file, _ = get_fixture_files(fixture_dir, page_kind, int(size))
+        with open(html_file, 'rt', encoding='utf-8') as fh:
+            html = fh.read()
+        with open(json_file, 'rt', encoding='utf-8') as fh:
+            expected = json.load(fh)
+        for parser in parsers:
+            soup = BeautifulSoup(html, features=parser)
+            for extractor in PAGE_EXTRACTORS[page_kind]:
+                correct, error = check_output(extractor, soup, expected)
+                if not correct:
+                    print(f"golden fixture mismatch: {os.path.basename(html_file)} {parser} {extractor}: {error}")
+                    if parser == 'lxml':
+                        num_errors += 1
+    return num_errors
+
+
+def compare_with_baseline(results: List[Dict[str, any]], baseline_file: str,
+                          max_slowdown: float = 1.25) -> int:
+    """Report the cases that are more than `max_slowdown` times slower than in the baseline run."""
+    with open(baseline_file, 'rt') as fh:
+        baseline = {(r['page_kind'], r['size'], r['parser'], r['extractor']): r for r in json.load(fh)}
+    num_regressions = 0
+    for result in results:
+        key = (result['page_kind'], result['size'], result['parser'], result['extractor'])
+        if key not in baseline:
+            continue
+        slowdown = baseline[key]['pages_per_sec'] / result['pages_per_sec']
+        if slowdown > max_slowdown:
+            num_regressions += 1
+            print(f"speed regression: {' '.join(str(k) for k in key)} is {slowdown:.2f}x slower than the baseline")
+        if baseline[key]['correct'] and not result['correct']:
+            num_regressions += 1
+            print(f"correctness regression: {' '.join(str(k) for k in key)}: {result['error']}")
+    return num_regressions
+
+
+def print_results(results: List[Dict[str, any]]) -> None:
+    print(f"{'page kind': <10} {'size': >5} {'parser': <12} {'extractor': <30} {'pages/s': >9} "
+          f"{'us/review': >10} {'peak RSS': >10} correct")
+    for r in results:
+        us_per_review = f"{r['us_per_review']:.1f}" if r['us_per_review'] is not None else '-'
+        print(f"{r['page_kind']: <10} {r['size']: >5} {r['parser']: <12} {r['extractor']: <30} "
+              f"{r['pages_per_sec']: >9.1f} {us_per_review: >10} {r['peak_rss_mb']: >8.1f}MB "
+              f"{'yes' if r['correct'] else 'no: ' + r['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the parse.py extractors on synthetic Goodreads pages.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='numbers of reviews (or books) per page')
+    parser.add_argument('--parsers', nargs='+', default=PARSER_BACKENDS, choices=PARSER_BACKENDS)
+    parser.add_argument('--repeats', type=int, default=5, help='number of times each page is parsed')
+    parser.add_argument('--fixture-dir', default=os.path.join(os.path.dirname(__file__), 'fixtures'),
+                        help='directory with the golden fixtures')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare the results with those of a saved run')
+    args = parser.parse_args()
+
+    num_errors = check_golden_fixtures(args.fixture_dir, args.parsers)
+    num_errors += check_fixture_parity(args.fixture_dir)
+    results = run_benchmarks(args.sizes, args.parsers, args.repeats)
+    print_results(results)
+    if args.save:
+        with open(args.save, 'wt') as fh:
+            json.dump(results, fh, indent=2)
+    if args.baseline:
+        num_errors += compare_with_baseline(results, args.baseline)
+    num_errors += sum(1 for r in results if r['parser'] == 'lxml' and not r['correct'])
+    if num_errors > 0:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
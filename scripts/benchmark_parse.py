@@ -0,0 +1,156 @@
+import argparse
+import glob
+import json
+import os
+import time
+from typing import Dict, List
+
+from parse import read_html_file, get_review_language
+from parse import get_book_metadata, get_canonical_url, get_language_links
+from parse import get_book_reviews, extract_reviews, extract_page
+from parse import read_book_reviews, read_review_cards
+from synthetic_pages import get_fixture_files
+
+
+# the kinds of golden fixture pages that have reviews
+REVIEW_PAGE_KINDS = ['old_style', 'new_style']
+
+
+def get_book_id(html_file: str) -> str:
+    _, filename = os.path.split(html_file)
+    return filename.replace('.html', '')
+
+
+def extract_page_separately(book_id: str, html_file: str, page) -> Dict[str, any]:
+    """Extract the page data with the separate extraction functions, each scanning the full tree."""
+    return {
+        'metadata': get_book_metadata(book_id, html_file, page),
+        'canonical_url': get_canonical_url(page),
+        'language_links': get_language_links(page) if page.head is not None else [],
+        'reviews': get_book_reviews(book_id, html_file, page),
+        'review_cards': extract_reviews(book_id, html_file, page),
+    }
+
+
+def compare_page_data(separate_data: Dict[str, any], single_pass_data: Dict[str, any]) -> List[str]:
+    """Return the names of the fields for which the two extraction methods differ."""
+    diffs = []
+    for field in separate_data:
+        if field == 'language_links':
+            separate_links = [str(link) for link in separate_data[field]]
+            single_pass_links = [str(link) for link in single_pass_data[field]]
+            if separate_links != single_pass_links:
+                diffs.append(field)
+        elif separate_data[field] != single_pass_data[field]:
+            diffs.append(field)
+    return diffs
+
+
+def benchmark_single_pass(html_files: List[str]) -> None:
+    """Compare the per-page cost of the separate extraction functions with that of
+    the single pass extract_page and check that both produce the same output."""
+    separate_time = 0.0
+    single_pass_time = 0.0
+    read_time = 0.0
+    num_diffs = 0
+    for html_file in html_files:
+        book_id = get_book_id(html_file)
+        start = time.perf_counter()
+        page = read_html_file(html_file)
+        read_time += time.perf_counter() - start
+        start = time.perf_counter()
+        separate_data = extract_page_separately(book_id, html_file, page)
+        separate_time += time.perf_counter() - start
+        start = time.perf_counter()
+        single_pass_data = extract_page(book_id, html_file, page)
+        single_pass_time += time.perf_counter() - start
+        if diffs := compare_page_data(separate_data, single_pass_data):
+            num_diffs += 1
+            print(f"output differs for {html_file} (language {get_review_language(html_file)}): {diffs}")
+    num_pages = len(html_files)
+    if num_pages == 0:
+        print('no HTML files to benchmark')
+        return None
+    print(f"pages: {num_pages}, pages with differing output: {num_diffs}")
+    print(f"read and parse HTML:  {1000 * read_time / num_pages: >8.2f} ms/page")
+    print(f"separate extraction:  {1000 * separate_time / num_pages: >8.2f} ms/page")
+    print(f"single pass:          {1000 * single_pass_time / num_pages: >8.2f} ms/page")
+    return None
+
+
+def check_backend_parity(html_files: List[str], book_ids: List[str] = None) -> int:
+    """Check that the lxml review backend produces the same reviews as the BeautifulSoup
+    backend and compare the time per page. The book ids are taken from the file names,
+    unless given. Returns the number of files with differing output."""
+    if book_ids is None:
+        book_ids = [get_book_id(html_file) for html_file in html_files]
+    backend_time = {'bs4': 0.0, 'lxml': 0.0}
+    num_diffs = 0
+    for book_id, html_file in zip(book_ids, html_files):
+        backend_reviews = {}
+        for backend in backend_time:
+            start = time.perf_counter()
+            reviews = read_book_reviews(book_id, html_file, backend=backend)
+            review_cards = read_review_cards(book_id, html_file, backend=backend)
+            backend_time[backend] += time.perf_counter() - start
+            backend_reviews[backend] = (reviews, review_cards)
+        bs4_reviews, bs4_cards = backend_reviews['bs4']
+        lxml_reviews, lxml_cards = backend_reviews['lxml']
+        if bs4_reviews != lxml_reviews or bs4_cards != lxml_cards:
+            num_diffs += 1
+            print(f"backend output differs for {html_file}: bs4 {len(bs4_reviews)} reviews and "
+                  f"{len(bs4_cards)} cards, lxml {len(lxml_reviews)} reviews and {len(lxml_cards)} cards")
+    num_pages = len(html_files)
+    if num_pages == 0:
+        print('no HTML files to compare')
+        return num_diffs
+    print(f"pages: {num_pages}, pages with differing reviews between backends: {num_diffs}")
+    for backend in backend_time:
+        print(f"{backend} backend: {1000 * backend_time[backend] / num_pages: >8.2f} ms/page")
+    return num_diffs
+
+
+def check_fixture_parity(fixture_dir: str, size: int = 5) -> int:
+    """Check the backend parity on the golden fixture pages with reviews (see synthetic_pages),
+    which needs no crawled pages. A fixture page for which neither backend finds any review
+    also counts as a difference. Returns the number of fixture pages that fail the check."""
+    html_files, book_ids = [], []
+    for page_kind in REVIEW_PAGE_KINDS:
+        html_file, json_file = get_fixture_files(fixture_dir, page_kind, size)
+        with open(json_file, 'rt', encoding='utf-8') as fh:
+            # the fixture file names are not book ids, the book id is stored with the expected output
+            book_ids.append(json.load(fh)['book_id'])
+        html_files.append(html_file)
+    num_diffs = check_backend_parity(html_files, book_ids=book_ids)
+    for book_id, html_file in zip(book_ids, html_files):
+        if len(read_book_reviews(book_id, html_file)) + len(read_review_cards(book_id, html_file)) == 0:
+            num_diffs += 1
+            print(f"no reviews found in fixture {html_file}")
+    return num_diffs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the extraction of Goodreads pages.')
+    parser.add_argument('html_dir', nargs='?', help='directory with Goodreads book review pages')
+    parser.add_argument('--max-files', type=int, default=200, help='maximum number of HTML files to use')
+    parser.add_argument('--parity', action='store_true',
+                        help='check that the lxml review backend matches the BeautifulSoup backend')
+    parser.add_argument('--fixture-dir', default=os.path.join(os.path.dirname(__file__), 'fixtures'),
+                        help='directory with the golden fixtures, checked for backend parity without html_dir')
+    args = parser.parse_args()
+    if args.html_dir is None:
+        if check_fixture_parity(args.fixture_dir) > 0:
+            raise SystemExit(1)
+        return None
+    html_files = sorted(glob.glob(os.path.join(args.html_dir, '**/*.html'), recursive=True))
+    html_files = html_files[:args.max_files]
+    if args.parity:
+        num_diffs = check_backend_parity(html_files)
+        if num_diffs > 0:
+            raise SystemExit(1)
+    else:
+        benchmark_single_pass(html_files)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+import argparse
+import os
+import sqlite3
+from collections import defaultdict
+from typing import Dict, List, Tuple, Union
+
+from extraction_manifest import hash_file
+from parse import get_crawl_date
+from sharding import Shard
+
+
+CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    book_id TEXT NOT NULL,
+    lang TEXT NOT NULL,
+    crawl_date TEXT,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    content_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS files_lang ON files (lang, book_id);
+CREATE INDEX IF NOT EXISTS files_book_id ON files (book_id);
+CREATE INDEX IF NOT EXISTS files_dir ON files (dir);
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL
+);
+"""
+
+
+def get_dir_condition(html_dir: Union[str, None]) -> Tuple[List[str], List[str]]:
+    """Return the SQL condition (as a list) and its parameters that select the files of a crawl directory."""
+    if html_dir is None:
+        return [], []
+    dir_prefix = os.path.join(os.path.abspath(html_dir), '')
+    return ['substr(dir, 1, ?) = ?'], [len(dir_prefix), dir_prefix]
+
+
+class BookCatalog:
+    """An SQLite index of crawled book pages with the book_id, language, crawl date,
+    path, size, modification time and content hash of every HTML file.
+
+    The catalog is updated incrementally: a language directory is only re-scanned when
+    its modification time changed, which happens when files are added, removed or
+    replaced by rename. Files that are overwritten in place do not change the directory
+    modification time, use update(full=True) to re-stat every file. Paths are stored as
+    absolute paths, so the same file is one entry whatever the working directory.
+
+    With a shard (see sharding.Shard), only the files of that shard are cataloged; the
+    catalogs of all shards can be merged into one with merge_catalogs."""
+
+    def __init__(self, db_file: str, shard: Shard = None):
+        self.db_file = db_file
+        self.shard = shard
+        self.conn = sqlite3.connect(db_file)
+        self.conn.executescript(CATALOG_SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def update(self, html_dir: str, full: bool = False, hash_files: bool = True) -> Dict[str, int]:
+        """Update the catalog with the HTML files in the language directories of a crawl directory
+        (<html_dir>/<lang>/<book_id>.html). Returns the number of scanned, added, updated and removed files."""
+        stats = {'dirs_scanned': 0, 'dirs_skipped': 0, 'added': 0, 'updated': 0, 'removed': 0}
+        crawl_date = get_crawl_date(html_dir)
+        html_dir = os.path.abspath(html_dir)
+        with os.scandir(html_dir) as entries:
+            lang_dirs = [entry for entry in entries if entry.is_dir()]
+        with self.conn:
+            self._remove_relative_paths(stats)
+            for lang_dir in lang_dirs:
+                mtime_ns = lang_dir.stat().st_mtime_ns
+                row = self.conn.execute('SELECT mtime_ns FROM dirs WHERE path = ?', (lang_dir.path,)).fetchone()
+                if not full and row is not None and row[0] == mtime_ns:
+                    stats['dirs_skipped'] += 1
+                    continue
+                self._update_dir(lang_dir.path, lang_dir.name, crawl_date, hash_files, stats)
+                self.conn.execute('INSERT OR REPLACE INTO dirs (path, mtime_ns) VALUES (?, ?)',
+                                  (lang_dir.path, mtime_ns))
+                stats['dirs_scanned'] += 1
+            self._remove_missing_dirs(html_dir, [lang_dir.path for lang_dir in lang_dirs], stats)
+        return stats
+
+    def _remove_relative_paths(self, stats: Dict[str, int]) -> None:
+        """Remove the entries of catalogs written before paths were stored as absolute paths."""
+        for dir_path, in self.conn.execute('SELECT path FROM dirs').fetchall():
+            if not os.path.isabs(dir_path):
+                stats['removed'] += self.conn.execute('DELETE FROM files WHERE dir = ?', (dir_path,)).rowcount
+                self.conn.execute('DELETE FROM dirs WHERE path = ?', (dir_path,))
+
+    def _remove_missing_dirs(self, html_dir: str, dir_paths: List[str], stats: Dict[str, int]) -> None:
+        """Remove the files of language directories of a crawl directory that no longer exist."""
+        html_dir = os.path.normpath(html_dir)
+        current = set(dir_paths)
+        for dir_path, in self.conn.execute('SELECT path FROM dirs').fetchall():
+            if os.path.dirname(os.path.normpath(dir_path)) != html_dir or dir_path in current:
+                continue
+            cursor = self.conn.execute('DELETE FROM files WHERE dir = ?', (dir_path,))
+            stats['removed'] += cursor.rowcount
+            self.conn.execute('DELETE FROM dirs WHERE path = ?', (dir_path,))
+
+    def _update_dir(self, dir_path: str, lang: str, crawl_date: Union[str, None],
+                    hash_files: bool, stats: Dict[str, int]) -> None:
+        known = {path: (size, mtime_ns) for path, size, mtime_ns in self.conn.execute(
+            'SELECT path, size, mtime_ns FROM files WHERE dir = ?', (dir_path,))}
+        seen = set()
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.html') or not entry.is_file():
+                    continue
+                if self.shard is not None and not self.shard.owns(entry.name.replace('.html', ''), lang):
+                    continue
+                seen.add(entry.path)
+                stat = entry.stat()
+                if known.get(entry.path) == (stat.st_size, stat.st_mtime_ns):
+                    continue
+                stats['updated' if entry.path in known else 'added'] += 1
+                content_hash = hash_file(entry.path) if hash_files else None
+                book_id = entry.name.replace('.html', '')
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO files (path, dir, book_id, lang, crawl_date, size, mtime_ns, '
+                    'content_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (entry.path, dir_path, book_id, lang, crawl_date, stat.st_size, stat.st_mtime_ns, content_hash))
+        removed = [(path,) for path in known if path not in seen]
+        self.conn.executemany('DELETE FROM files WHERE path = ?', removed)
+        stats['removed'] += len(removed)
+
+    def get_book_files(self, html_dir: str = None, langs: List[str] = None,
+                       exclude_langs: List[str] = None) -> Dict[str, List[str]]:
+        """Return the files per book_id, like parse.read_book_review_files, optionally only
+        those of a crawl directory and restricted to or excluding some languages."""
+        conditions, params = get_dir_condition(html_dir)
+        if langs is not None:
+            conditions.append(f"lang IN ({', '.join('?' * len(langs))})")
+            params.extend(langs)
+        if exclude_langs is not None:
+            conditions.append(f"lang NOT IN ({', '.join('?' * len(exclude_langs))})")
+            params.extend(exclude_langs)
+        where = f" WHERE {' AND '.join(conditions)}" if len(conditions) > 0 else ''
+        book_files = defaultdict(list)
+        for book_id, path in self.conn.execute(f'SELECT book_id, path FROM files{where} ORDER BY book_id, lang, path',
+                                               params):
+            book_files[book_id].append(path)
+        return book_files
+
+    def get_lang_files(self, lang: str, html_dir: str = None) -> List[str]:
+        """Return all files of a language, optionally only those of a crawl directory."""
+        conditions, params = get_dir_condition(html_dir)
+        where = ''.join(f' AND {condition}' for condition in conditions)
+        return [row[0] for row in self.conn.execute(f'SELECT path FROM files WHERE lang = ?{where} ORDER BY book_id',
+                                                    [lang] + params)]
+
+    def get_books_missing_language(self, lang: str) -> List[str]:
+        """Return the book_ids that have files in other languages but not in the given language."""
+        return [row[0] for row in self.conn.execute(
+            'SELECT DISTINCT book_id FROM files WHERE book_id NOT IN (SELECT book_id FROM files WHERE lang = ?) '
+            'ORDER BY book_id', (lang,))]
+
+    def get_lang_counts(self) -> Dict[str, int]:
+        return {lang: num for lang, num in self.conn.execute(
+            'SELECT lang, COUNT(*) FROM files GROUP BY lang ORDER BY COUNT(*) DESC')}
+
+    def merge(self, catalog_file: str) -> int:
+        """Add the files of another catalog, e.g. of a shard. Returns the number of merged files."""
+        self.conn.execute('ATTACH DATABASE ? AS other', (catalog_file,))
+        try:
+            with self.conn:
+                cursor = self.conn.execute('INSERT OR REPLACE INTO files SELECT * FROM other.files')
+                num_files = cursor.rowcount
+                # keep the oldest scan of a directory, so it is re-scanned unless every shard scanned its current state
+                self.conn.execute('INSERT OR REPLACE INTO dirs SELECT o.path, MIN(o.mtime_ns, COALESCE(d.mtime_ns, '
+                                  'o.mtime_ns)) FROM other.dirs o LEFT JOIN dirs d ON d.path = o.path')
+        finally:
+            self.conn.execute('DETACH DATABASE other')
+        return num_files
+
+
+def read_book_review_files(html_dir: str, catalog_file: str = None, shard: Shard = None) -> Dict[str, List[str]]:
+    """Return the files per book_id in a crawl directory, like parse.read_book_review_files,
+    using (and incrementally updating) a catalog instead of globbing the full directory tree.
+    With a shard, only the files of that shard are returned, from a catalog of the shard."""
+    if catalog_file is None:
+        catalog_file = os.path.join(html_dir, 'book_catalog.sqlite')
+    if shard is not None:
+        catalog_file = shard.get_file(catalog_file)
+    catalog = BookCatalog(catalog_file, shard=shard)
+    catalog.update(html_dir)
+    book_files = catalog.get_book_files(html_dir=html_dir)
+    catalog.close()
+    return book_files
+
+
+def merge_catalogs(catalog_file: str, shard_catalog_files: List[str]) -> Dict[str, int]:
+    """Merge the catalogs of the shards of a crawl into one catalog. Returns the files per shard catalog."""
+    catalog = BookCatalog(catalog_file)
+    stats = {shard_catalog_file: catalog.merge(shard_catalog_file) for shard_catalog_file in shard_catalog_files}
+    catalog.close()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Update and query the catalog of crawled book pages.')
+    parser.add_argument('html_dir', help='crawl directory with a directory per language')
+    parser.add_argument('--catalog', help='the SQLite catalog file (default: <html_dir>/book_catalog.sqlite)')
+    parser.add_argument('--full', action='store_true', help='re-stat all files, not only those in changed dirs')
+    parser.add_argument('--lang', help='list the files of this language')
+    parser.add_argument('--missing-lang', help='list the books without a file in this language')
+    args = parser.parse_args()
+    catalog_file = args.catalog if args.catalog else os.path.join(args.html_dir, 'book_catalog.sqlite')
+    catalog = BookCatalog(catalog_file)
+    print(f"update: {catalog.update(args.html_dir, full=args.full)}")
+    if args.lang:
+        for path in catalog.get_lang_files(args.lang, html_dir=args.html_dir):
+            print(path)
+    elif args.missing_lang:
+        for book_id in catalog.get_books_missing_language(args.missing_lang):
+            print(book_id)
+    else:
+        for lang, num in catalog.get_lang_counts().items():
+            print(f"\tlanguage: {lang}\tfiles: {num}")
+    catalog.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,16 @@
+import argparse
 import datetime
 import glob
 import logging
 import os
-import time
-from typing import List
+from typing import List, Tuple
 
-from parse import get_language_links, filter_language_links
-
-from download import fetch_html
-from parse import read_html_file, get_page_filename
+import metrics
+from async_fetch import make_dir, BOOK_PAGE_SELECTOR
+from crawl_frontier import CrawlFrontier, enqueue_jobs, crawl_frontier, CRAWL_METRICS_FILE
+from language_link_index import load_language_link_index
+from parse import get_page_filename
+from sharding import Shard, add_shard_arguments, get_shard, get_shard_file
 
 # source: https://hreflang.org/list-of-hreflang-codes/
 
@@ -46,50 +48,51 @@ TARGET_LANGS = {
 }
 
 
-def crawl_language_pages(canonical_page_files: List[str], lang_base_dir: str,
-                         target_langs: List[str] = None):
-    for page_filename in canonical_page_files:
-        page_soup = read_html_file(page_filename)
-        links = get_language_links(page_soup)
-        if target_langs is not None and len(target_langs) > 0:
-            links = filter_language_links(links, target_langs)
-        for link in links:
-            crawl_language_page(link, lang_base_dir)
-            time.sleep(2)
+def crawl_language_pages(canonical_page_files: List[str], lang_base_dir: str, frontier: CrawlFrontier,
+                         target_langs: List[str] = None, shard: Shard = None, concurrency: int = 4,
+                         rate: float = 0.5):
+    link_index = load_language_link_index(canonical_page_files, shard=shard)
+    links = link_index.iter_target_links(canonical_page_files, target_langs)
+    jobs = [get_language_page_job(lang, url, lang_base_dir) for lang, url in links]
+    if shard is not None:
+        # sharded by the book and language of the language page, like its extraction
+        jobs = shard.filter_jobs(jobs)
+        rate /= shard.count
+        logging.info(f"{shard}: {len(jobs)} language pages")
+    num_new = enqueue_jobs(frontier, jobs, 'language')
+    logging.info(f"{num_new} new language pages added to the frontier")
+    stats = crawl_frontier(frontier, 'language', wait_selector=BOOK_PAGE_SELECTOR,
+                           concurrency=concurrency, rate=rate)
+    logging.info(f"written: {stats['written']}, failed: {stats['failed']}")
 
 
-def crawl_language_page(link, lang_base_dir: str):
-    lang_dir = os.path.join(lang_base_dir, link.attrs['hreflang'])
-    if not os.path.isdir(lang_dir):
-        os.mkdir(lang_dir)
-        logging.info(f"creating language directory {lang_dir}")
-    lang_file = get_page_filename(lang_dir, link['href'])
-    if os.path.exists(lang_file):
-        logging.info(f'file exists: {lang_file}')
-        return None
-    logging.info(f"downloading: {link['href']}")
-    try:
-        html = fetch_html(link['href'], wait_time=2)
-        with open(lang_file, 'wt') as fh_out:
-            fh_out.write(html)
-    except BaseException as err:
-        logging.error(f"Error downloading {link['href']}")
-        logging.error(err)
+def get_language_page_job(lang: str, url: str, lang_base_dir: str) -> Tuple[str, str]:
+    """Return the (url, output file) pair for a language link."""
+    lang_dir = os.path.join(lang_base_dir, lang)
+    make_dir(lang_dir)
+    lang_file = get_page_filename(lang_dir, url)
+    return url, lang_file
 
 
-def main():
+def main(shard: Shard = None):
+    metrics.configure(snapshot_file=get_shard_file(CRAWL_METRICS_FILE, shard))
     canonical_page_dir = '../data/Canonical_book_pages'
     canonical_page_files = glob.glob(os.path.join(canonical_page_dir, '*.html'))
     logging.info(f"num canonical_page_files: {len(canonical_page_files)}")
     lang_base_dir = '../data/Book_language_pages'
     target_langs = list(TARGET_LANGS.keys())
     logging.info(f"target_langs: {target_langs}")
-    crawl_language_pages(canonical_page_files, lang_base_dir, target_langs)
+    frontier = CrawlFrontier(get_shard_file('../data/crawl_frontier.sqlite', shard))
+    crawl_language_pages(canonical_page_files, lang_base_dir, frontier, target_langs, shard=shard)
+    frontier.close()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Crawl the language versions of the canonical book pages.')
+    add_shard_arguments(parser)
+    crawl_shard = get_shard(parser.parse_args())
     today = datetime.date.today().isoformat()
     logging.basicConfig(format='%(asctime)s %(message)s',
-                        filename=f'crawling-book_language_pages-{today}.log',
+                        filename=get_shard_file(f'crawling-book_language_pages-{today}.log', crawl_shard),
                         level=logging.DEBUG)
-    main()
+    main(shard=crawl_shard)
@@ -1,40 +1,117 @@
+import argparse
 import glob
+import json
 import os
-import re
-import time
+from typing import Dict, List, Tuple
 
 from bs4 import BeautifulSoup
 
-from download import fetch_html
-from parse import get_book_list_pagination_urls
+import metrics
+from async_fetch import BOOK_LIST_SELECTOR
+from crawl_frontier import CrawlFrontier, enqueue_jobs, crawl_frontier, CRAWL_METRICS_FILE
+from parse import get_book_list_pagination_urls, get_book_list_books
+from parse import get_book_list_name, merge_book_list_books
+from sharding import Shard, add_shard_arguments, get_shard, get_shard_file
 
 
-def main():
+# the saved book list pages are parsed with the XML parser, as they have always been
+BOOK_LIST_PARSER = 'xml'
+BOOK_MAP_FILE = '../data/books.json'
+
+
+def get_pagination_jobs(book_list_file: str, soup: BeautifulSoup) -> List[Tuple[str, str]]:
+    """Return the (url, output file) jobs of the other pages of a book list, given its first page."""
+    jobs = []
+    for url in get_book_list_pagination_urls(soup):
+        page_num = url.split('?page=')[-1]
+        page_filename = book_list_file.replace('.html', f'--page{page_num}.html')
+        if page_filename == book_list_file:
+            raise ValueError(f"paginated filename '{page_filename}' cannot be the same as original filename")
+        jobs.append((url, page_filename))
+    return jobs
+
+
+def add_book_list_page(book_map: Dict[str, Dict[str, any]], book_list_file: str, soup: BeautifulSoup) -> None:
+    book_list = get_book_list_name(book_list_file)
+    merge_book_list_books(book_map, get_book_list_books(soup, book_list))
+    metrics.counter('book_lists.pages_parsed').inc()
+
+
+def read_book_list_page(book_list_file: str) -> BeautifulSoup:
+    with open(book_list_file, 'rt') as fh_in:
+        return BeautifulSoup(fh_in, features=BOOK_LIST_PARSER)
+
+
+def crawl_book_lists(book_list_files: List[str], frontier: CrawlFrontier, concurrency: int = 4,
+                     rate: float = 0.5) -> Tuple[Dict[str, Dict[str, any]], Dict[str, int]]:
+    """Crawl the pages of the book lists and return the map of book_id to book of all lists,
+    and the number of written and failed pages.
+
+    Every page is parsed exactly once: the first page of each list for both its pagination
+    and its books, pages crawled earlier from disk, and newly fetched pages as they arrive,
+    so the book map grows while the pages of all lists are fetched concurrently."""
+    book_map = {}
+    jobs = []
+    for blf in book_list_files:
+        soup = read_book_list_page(blf)
+        jobs.extend(get_pagination_jobs(blf, soup))
+        add_book_list_page(book_map, blf, soup)
+    print(f"{len(book_map)} books on the first pages of {len(book_list_files)} lists, "
+          f"{len(jobs)} more pages")
+    enqueue_jobs(frontier, jobs, 'list_page')
+    # pages that were already crawled only need to be parsed, the others are parsed when they arrive
+    for url, page_filename in jobs:
+        if os.path.exists(page_filename) and frontier.get_status(url) == 'done':
+            add_book_list_page(book_map, page_filename, read_book_list_page(page_filename))
+
+    def parse_page(url: str, page_filename: str, html: str) -> None:
+        add_book_list_page(book_map, page_filename, BeautifulSoup(html, features=BOOK_LIST_PARSER))
+
+    stats = crawl_frontier(frontier, 'list_page', wait_selector=BOOK_LIST_SELECTOR, on_page=parse_page,
+                           concurrency=concurrency, rate=rate)
+    print(f"written: {stats['written']}, failed attempts: {stats['failed']}, books: {len(book_map)}")
+    return book_map, stats
+
+
+def merge_book_maps(book_map_file: str, shard_book_map_files: List[str]) -> int:
+    """Merge the book maps of the shards of a book list crawl into one book map file.
+    Returns the number of books."""
+    book_map = {}
+    for shard_book_map_file in shard_book_map_files:
+        with open(shard_book_map_file, 'rt') as fh:
+            merge_book_list_books(book_map, list(json.load(fh).values()))
+    with open(book_map_file, 'wt') as fh:
+        json.dump(book_map, fh)
+    return len(book_map)
+
+
+def main(shard: Shard = None, concurrency: int = 4, rate: float = 0.5):
+    metrics.configure(snapshot_file=get_shard_file(CRAWL_METRICS_FILE, shard))
     book_list_dir = "../data/Book_list_pages"
     book_list_files = glob.glob(os.path.join(book_list_dir, '* _ Goodreads.html'))
+    if shard is not None:
+        # a shard crawls all pages of its lists, the shard book maps are merged with sharding.py merge-books
+        book_list_files = [blf for blf in book_list_files if shard.owns_file(blf)]
+        rate /= shard.count
     print(f"number of book_list_files: {len(book_list_files)}")
-
-    for blf in book_list_files:
-        with open(blf, 'rt') as fh_in:
-            print(blf)
-            _, filename = os.path.split(blf)
-            if m := re.match(r"^(.*) \((\d+) books\)", filename):
-                book_list = m.group(1)
-            soup = BeautifulSoup(fh_in, features='xml')
-            pagination_urls = get_book_list_pagination_urls(soup)
-            # print(f"pagination_urls: {pagination_urls}")
-            for url in pagination_urls:
-                page_num = url.split('?page=')[-1]
-                html = fetch_html(url)
-                page_filename = blf.replace('.html', f'--page{page_num}.html')
-                print(page_filename)
-                if page_filename == blf:
-                    raise ValueError(f"paginated filename '{page_filename}' cannot be the same as original filename")
-                with open(page_filename, 'wt') as fh_out:
-                    fh_out.write(html)
-                time.sleep(2)
+    frontier = CrawlFrontier(get_shard_file('../data/crawl_frontier.sqlite', shard))
+    book_map, stats = crawl_book_lists(book_list_files, frontier, concurrency=concurrency, rate=rate)
+    # failed attempts are retried in the same run, so completeness is decided by the frontier state
+    progress = frontier.get_progress().get('list_page', {})
+    frontier.close()
+    num_incomplete = sum(progress.get(status, 0) for status in ['pending', 'leased', 'failed'])
+    if num_incomplete > 0:
+        # get_books_json uses an existing book map as is, so only write a complete one
+        print(f"{num_incomplete} list pages not crawled ({progress.get('failed', 0)} failed), not writing the "
+              f"book map. Run the crawl again, after scheduling the failed pages for a retry with: "
+              f"python crawl_frontier.py {frontier.db_file} retry --kind list_page")
+        return None
+    with open(get_shard_file(BOOK_MAP_FILE, shard), 'wt') as fh:
+        json.dump(book_map, fh)
     return None
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description='Crawl the pages of the Goodreads book lists.')
+    add_shard_arguments(parser)
+    main(shard=get_shard(parser.parse_args()))
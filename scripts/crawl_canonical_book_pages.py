@@ -1,48 +1,41 @@
+import argparse
 import datetime
 import glob
 import json
 import logging
 import os
-import re
-import time
 
 import pandas as pd
-from bs4 import BeautifulSoup
 
-from download import fetch_html
-from parse import get_book_list_books
+import metrics
+from async_fetch import BOOK_PAGE_SELECTOR
+from crawl_book_list_pages import BOOK_MAP_FILE, add_book_list_page, read_book_list_page
+from crawl_frontier import CrawlFrontier, enqueue_jobs, crawl_frontier, CRAWL_METRICS_FILE
+from sharding import Shard, add_shard_arguments, get_shard, get_shard_file
 
 
 def extract_book_list_books():
+    """Build the book map from saved book list pages. crawl_book_list_pages builds (and saves)
+    the book map while crawling, this is only needed for pages that were crawled before that."""
     book_list_dir = "../data/Book_list_pages"
     book_list_files = glob.glob(os.path.join(book_list_dir, '*.html'))
     print(f"number of book_list_files: {len(book_list_files)}")
 
     book_map = {}
     for blf in book_list_files:
-        with open(blf, 'rt') as fh_in:
-            print(blf)
-            _, filename = os.path.split(blf)
-            if m := re.match(r"^(.*) \((\d+) books\)", filename):
-                book_list = m.group(1)
-            soup = BeautifulSoup(fh_in, features='xml')
-            books = get_book_list_books(soup, book_list)
-            for book in books:
-                if book['book_id'] in book_map:
-                    book_map[book['book_id']]['book_lists'].append(book_list)
-                else:
-                    book_map[book['book_id']] = book
-            num_books = len(book_map)
-            print(f"{num_books: >6} books, blf: {blf}")
+        print(blf)
+        add_book_list_page(book_map, blf, read_book_list_page(blf))
+        num_books = len(book_map)
+        print(f"{num_books: >6} books, blf: {blf}")
     return book_map
 
 
 def get_books_json():
-    book_file = '../data/books.json'
+    book_file = BOOK_MAP_FILE
     if os.path.exists(book_file) is False:
         book_map = extract_book_list_books()
         with open(book_file, 'wt') as fh:
-            json.dump(book_map)
+            json.dump(book_map, fh)
     else:
         with open(book_file, 'rt') as fh:
             book_map = json.load(fh)
@@ -58,36 +51,49 @@ def get_metadata_book_ids():
     return list(df.gr_EN_link)
 
 
-def main():
-    canonical_dir = '../data/Canonical_book_pages'
-    book_map = get_books_json()
-    print(f"number of book_map book_ids: {len(book_map)}")
-    metadata_book_ids = set(get_metadata_book_ids())
-    print(f"number of metadata book_ids: {len(metadata_book_ids)}")
+def get_canonical_page_jobs(book_map, canonical_dir: str, metadata_book_ids):
+    """Return the (url, output file) pairs of the canonical book pages."""
+    jobs = []
     for bi, book_id in enumerate(book_map):
         if book_id in metadata_book_ids:
             print(f"duplicate: {book_id} {book_map[book_id]}")
             continue
         book_url = book_map[book_id]['book_url']
-        try:
-            filename = f"{os.path.split(book_url)[-1]}.html"
-            filepath = os.path.join(canonical_dir, filename)
-            if os.path.exists(filepath):
-                continue
-            logging.info(f"{bi+1} of {len(book_map)} - fetching HTML for book_id {book_id}")
-            if book_url.startswith('/book/show'):
-                book_url = f"https://goodreads.com{book_url}"
-            html = fetch_html(book_url, wait_time=2)
-            with open(filepath, 'wt') as fh_out:
-                fh_out.write(html)
-        except BaseException as err:
-            logging.error(f"Error fetching HTML for book_id {book_id}: {err}")
-            continue
+        filename = f"{os.path.split(book_url)[-1]}.html"
+        filepath = os.path.join(canonical_dir, filename)
+        if book_url.startswith('/book/show'):
+            book_url = f"https://goodreads.com{book_url}"
+        jobs.append((book_url, filepath))
+    return jobs
+
+
+def main(shard: Shard = None, concurrency: int = 4, rate: float = 0.5):
+    metrics.configure(snapshot_file=get_shard_file(CRAWL_METRICS_FILE, shard))
+    canonical_dir = '../data/Canonical_book_pages'
+    frontier = CrawlFrontier(get_shard_file('../data/crawl_frontier.sqlite', shard))
+    book_map = get_books_json()
+    print(f"number of book_map book_ids: {len(book_map)}")
+    metadata_book_ids = set(get_metadata_book_ids())
+    print(f"number of metadata book_ids: {len(metadata_book_ids)}")
+    jobs = get_canonical_page_jobs(book_map, canonical_dir, metadata_book_ids)
+    if shard is not None:
+        jobs = shard.filter_jobs(jobs)
+        rate /= shard.count
+        logging.info(f"{shard}: {len(jobs)} canonical pages")
+    num_new = enqueue_jobs(frontier, jobs, 'canonical')
+    logging.info(f"{num_new} new canonical pages added to the frontier for {len(book_map)} books")
+    stats = crawl_frontier(frontier, 'canonical', wait_selector=BOOK_PAGE_SELECTOR,
+                           concurrency=concurrency, rate=rate)
+    logging.info(f"written: {stats['written']}, failed: {stats['failed']}")
+    frontier.close()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Crawl the canonical pages of the books of the book lists.')
+    add_shard_arguments(parser)
+    crawl_shard = get_shard(parser.parse_args())
     today = datetime.date.today().isoformat()
     logging.basicConfig(format='%(asctime)s %(message)s',
-                        filename=f'crawling-canonical_book_pages-{today}.log',
+                        filename=get_shard_file(f'crawling-canonical_book_pages-{today}.log', crawl_shard),
                         level=logging.DEBUG)
-    main()
+    main(shard=crawl_shard)
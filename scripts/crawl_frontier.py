@@ -0,0 +1,259 @@
+import argparse
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Set, Tuple, Union
+
+from async_fetch import AsyncFetcher, write_html_file
+
+
+# the crawl scripts append their metrics snapshots to this file
+CRAWL_METRICS_FILE = '../data/crawl_metrics.jsonl'
+
+FRONTIER_KINDS = ['list_page', 'canonical', 'language']
+FRONTIER_STATUSES = ['pending', 'leased', 'done', 'failed']
+
+FRONTIER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS frontier (
+    url TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    output_path TEXT,
+    available_at REAL NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS frontier_available ON frontier (kind, status, available_at);
+CREATE INDEX IF NOT EXISTS frontier_output_path ON frontier (output_path);
+"""
+
+
+class CrawlFrontier:
+    """A SQLite-backed queue of URLs to crawl, which records for each URL its kind
+    (list_page, canonical or language), status, number of attempts, last error and
+    output path, so a crawl can be stopped and resumed at any time.
+
+    A leased URL that is not completed within `lease_time` seconds becomes available
+    again. A failed URL is retried after `retry_delay` seconds, doubling the delay
+    with every attempt, until it has failed `max_attempts` times. The frontier is the only
+    retry layer of a crawl, crawl_frontier fetches each leased URL once."""
+
+    def __init__(self, db_file: str, max_attempts: int = 5, retry_delay: float = 60.0,
+                 lease_time: float = 900.0):
+        self.db_file = db_file
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lease_time = lease_time
+        self.conn = sqlite3.connect(db_file)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(FRONTIER_SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def contains(self, url: str) -> bool:
+        row = self.conn.execute('SELECT 1 FROM frontier WHERE url = ?', (url,)).fetchone()
+        return row is not None
+
+    def get_urls(self) -> Set[str]:
+        return {row['url'] for row in self.conn.execute('SELECT url FROM frontier')}
+
+    def get_status(self, url: str) -> Union[str, None]:
+        row = self.conn.execute('SELECT status FROM frontier WHERE url = ?', (url,)).fetchone()
+        return row['status'] if row is not None else None
+
+    def enqueue(self, url: str, kind: str, output_path: str = None, status: str = 'pending') -> bool:
+        """Add a URL to the frontier. Returns False if the URL was already known."""
+        return self.enqueue_many([(url, output_path)], kind, status=status) == 1
+
+    def enqueue_many(self, jobs: Iterable[Tuple[str, str]], kind: str, status: str = 'pending') -> int:
+        """Add (url, output path) pairs to the frontier in a single transaction.
+        Returns the number of URLs that were not yet known."""
+        if kind not in FRONTIER_KINDS:
+            raise ValueError(f"unknown frontier kind '{kind}', must be one of {FRONTIER_KINDS}")
+        now = time.time()
+        with self.conn:
+            cursor = self.conn.executemany(
+                'INSERT OR IGNORE INTO frontier (url, kind, status, output_path, available_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [(url, kind, status, output_path, now, now) for url, output_path in jobs])
+        return cursor.rowcount
+
+    def lease(self, kind: str = None) -> Union[sqlite3.Row, None]:
+        """Take the next available URL of the given kind, or None if no URL is available."""
+        leased = self.lease_many(1, kind=kind)
+        return leased[0] if len(leased) > 0 else None
+
+    def lease_many(self, num_urls: int, kind: str = None) -> List[sqlite3.Row]:
+        """Take up to `num_urls` available URLs, pending ones as well as URLs with an expired lease."""
+        now = time.time()
+        kinds = FRONTIER_KINDS if kind is None else [kind]
+        leased = []
+        with self.conn:
+            for lease_kind in kinds:
+                if len(leased) == num_urls:
+                    break
+                leased += self.conn.execute(
+                    "UPDATE frontier SET status = 'leased', available_at = ?, updated_at = ? "
+                    "WHERE url IN (SELECT url FROM frontier WHERE kind = ? AND status IN ('pending', 'leased') "
+                    "AND available_at <= ? ORDER BY available_at LIMIT ?) RETURNING *",
+                    (now + self.lease_time, now, lease_kind, now, num_urls - len(leased))).fetchall()
+        return leased
+
+    def complete(self, url: str, output_path: str = None) -> None:
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                "UPDATE frontier SET status = 'done', attempts = attempts + 1, last_error = NULL, "
+                "output_path = COALESCE(?, output_path), updated_at = ? WHERE url = ?",
+                (output_path, now, url))
+
+    def fail(self, url: str, error: str, retry: bool = True) -> None:
+        """Record a failed attempt and schedule a retry, or mark the URL as failed
+        when it has reached the maximum number of attempts or should not be retried."""
+        now = time.time()
+        with self.conn:
+            row = self.conn.execute('SELECT attempts FROM frontier WHERE url = ?', (url,)).fetchone()
+            attempts = row['attempts'] + 1
+            status = 'failed' if not retry or attempts >= self.max_attempts else 'pending'
+            available_at = now + self.retry_delay * 2 ** (attempts - 1)
+            self.conn.execute(
+                'UPDATE frontier SET status = ?, attempts = ?, last_error = ?, available_at = ?, updated_at = ? '
+                'WHERE url = ?', (status, attempts, error, available_at, now, url))
+
+    def retry_failed(self, kind: str = None) -> int:
+        """Make all failed URLs (of the given kind) available again. Returns the number of URLs."""
+        now = time.time()
+        with self.conn:
+            cursor = self.conn.execute(
+                "UPDATE frontier SET status = 'pending', attempts = 0, available_at = ?, updated_at = ? "
+                "WHERE status = 'failed' AND (? IS NULL OR kind = ?)", (now, now, kind, kind))
+        return cursor.rowcount
+
+    def next_available_at(self, kind: str = None) -> Union[float, None]:
+        """Return the time at which the next pending or leased URL becomes available."""
+        row = self.conn.execute(
+            "SELECT MIN(available_at) AS available_at FROM frontier WHERE status IN ('pending', 'leased') "
+            "AND (? IS NULL OR kind = ?)", (kind, kind)).fetchone()
+        return row['available_at']
+
+    def get_progress(self) -> Dict[str, Dict[str, int]]:
+        """Return the number of URLs per kind and status."""
+        progress = {}
+        for row in self.conn.execute('SELECT kind, status, COUNT(*) AS num FROM frontier GROUP BY kind, status'):
+            if row['kind'] not in progress:
+                progress[row['kind']] = {status: 0 for status in FRONTIER_STATUSES}
+            progress[row['kind']][row['status']] = row['num']
+        return progress
+
+    def get_failed(self, kind: str = None, limit: int = 20) -> List[sqlite3.Row]:
+        return self.conn.execute(
+            "SELECT * FROM frontier WHERE status = 'failed' AND (? IS NULL OR kind = ?) "
+            "ORDER BY updated_at DESC LIMIT ?", (kind, kind, limit)).fetchall()
+
+
+def enqueue_jobs(frontier: CrawlFrontier, jobs: List[Tuple[str, str]], kind: str) -> int:
+    """Add (url, output file) jobs to the frontier. Jobs that are not yet in the frontier but
+    whose output file already exists, from crawls before the frontier was used, are marked done."""
+    known_urls = frontier.get_urls()
+    new_jobs = [(url, output_file) for url, output_file in jobs if url not in known_urls]
+    done_jobs = [job for job in new_jobs if os.path.exists(job[1])]
+    pending_jobs = [job for job in new_jobs if not os.path.exists(job[1])]
+    frontier.enqueue_many(done_jobs, kind, status='done')
+    return frontier.enqueue_many(pending_jobs, kind)
+
+
+def crawl_frontier(frontier: CrawlFrontier, kind: str, wait_selector: str = None, batch_size: int = 100,
+                   on_page: Callable[[str, str, str], None] = None, max_wait: float = 600.0,
+                   **fetcher_kwargs) -> Dict[str, int]:
+    """Fetch all available URLs of a kind from the frontier and write each page to its
+    output path, until no URL is left that can be (re)tried within `max_wait` seconds; URLs
+    that become available later are left for the next run. If given, `on_page(url, output_path, html)`
+    is called for every written page, so pages can be processed as they arrive. It runs in a
+    background thread, one page at a time, so processing a page does not stall the fetches."""
+    stats = {'written': 0, 'failed': 0}
+
+    def write_page(url: str, html: Union[str, None]) -> None:
+        if html is None:
+            # a page without the expected content is marked failed at once, see AsyncFetcher.wait_for_selector
+            is_content_failure = url in fetcher.content_failures
+            fetcher.content_failures.discard(url)
+            frontier.fail(url, fetcher.last_errors.pop(url, 'fetch failed'), retry=not is_content_failure)
+            stats['failed'] += 1
+            return None
+        write_html_file(output_paths[url], html)
+        frontier.complete(url)
+        fetcher.last_errors.pop(url, None)
+        stats['written'] += 1
+        logging.info(f"{stats['written']} written: {output_paths[url]}")
+        if on_page is not None:
+            page_futures.append(page_executor.submit(on_page, url, output_paths[url], html))
+
+    async def run():
+        async with fetcher:
+            while True:
+                leased = frontier.lease_many(batch_size, kind=kind)
+                if len(leased) == 0:
+                    available_at = frontier.next_available_at(kind=kind)
+                    if available_at is None:
+                        break
+                    wait = max(0.0, available_at - time.time())
+                    if wait > max_wait:
+                        logging.info(f"next retry in {wait:.0f}s, leaving the remaining URLs for the next run")
+                        break
+                    await asyncio.sleep(wait)
+                    continue
+                output_paths.clear()
+                output_paths.update({row['url']: row['output_path'] for row in leased})
+                await fetcher.fetch_all(list(output_paths.keys()), write_page, wait_selector=wait_selector)
+
+    output_paths = {}
+    page_futures: List[Future] = []
+    page_executor = ThreadPoolExecutor(max_workers=1)
+    # retries are scheduled by the frontier, retrying in the fetcher as well would multiply the attempts
+    fetcher_kwargs.setdefault('max_attempts', 1)
+    fetcher = AsyncFetcher(**fetcher_kwargs)
+    try:
+        asyncio.run(run())
+    finally:
+        page_executor.shutdown(wait=True)
+    for page_future in page_futures:
+        # raise the first error of on_page, if any
+        page_future.result()
+    return stats
+
+
+def print_progress(frontier: CrawlFrontier) -> None:
+    progress = frontier.get_progress()
+    print(f"{'kind': <10} " + ' '.join(f"{status: >8}" for status in FRONTIER_STATUSES) + f" {'total': >8}")
+    for kind in progress:
+        counts = ' '.join(f"{progress[kind][status]: >8}" for status in FRONTIER_STATUSES)
+        print(f"{kind: <10} {counts} {sum(progress[kind].values()): >8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Show and manage the progress of a crawl frontier.')
+    parser.add_argument('db_file', help='the SQLite file of the crawl frontier')
+    parser.add_argument('command', choices=['status', 'failed', 'retry'], default='status', nargs='?')
+    parser.add_argument('--kind', choices=FRONTIER_KINDS, default=None)
+    args = parser.parse_args()
+    if not os.path.exists(args.db_file):
+        raise FileNotFoundError(f"no crawl frontier at {args.db_file}")
+    frontier = CrawlFrontier(args.db_file)
+    if args.command == 'status':
+        print_progress(frontier)
+    elif args.command == 'failed':
+        for row in frontier.get_failed(kind=args.kind):
+            print(f"{row['kind']}\t{row['attempts']}\t{row['url']}\t{row['last_error']}")
+    elif args.command == 'retry':
+        print(f"{frontier.retry_failed(kind=args.kind)} failed URLs scheduled for retry")
+    frontier.close()
+
+
+if __name__ == "__main__":
+    main()
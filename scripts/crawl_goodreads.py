@@ -1,38 +1,40 @@
+import argparse
 import glob
 import os
 from typing import List
 
-from parse import get_language_links, filter_language_links
+import metrics
 from download import fetch_html, write_book_page
+from language_link_index import load_language_link_index
+from sharding import Shard, add_shard_arguments, get_shard, get_shard_file
 
 
-def extract_links(html_dir: str, lang_base_dir: str, target_langs: List[str]):
-    from download import sleep
-    from parse import read_html_file, get_page_filename
+def extract_links(html_dir: str, lang_base_dir: str, target_langs: List[str], shard: Shard = None):
+    from parse import get_page_filename
 
     book_page_files = glob.glob(os.path.join(html_dir, '*.html'))
+    link_index = load_language_link_index(book_page_files, shard=shard)
 
-    for fname in book_page_files:
-        page_soup = read_html_file(fname)
-        links = get_language_links(page_soup)
-        links = filter_language_links(links, target_langs)
-        for link in links:
-            lang_dir = os.path.join(lang_base_dir, link.attrs['hreflang'])
-            if not os.path.isdir(lang_dir):
-                os.mkdir(lang_dir)
-                print(lang_dir)
-            lang_file = get_page_filename(lang_dir, link['href'])
-            if os.path.exists(lang_file):
-                print('file exists:', lang_file)
-                continue
-            else:
-                print('downloading', link['href'])
-                html = fetch_html(link['href'], wait_time=2)
-                write_book_page(lang_dir, link['href'], html)
-                sleep(min_sleep_time=2, max_random_time=0)
+    for lang, url in link_index.iter_target_links(book_page_files, target_langs):
+        lang_dir = os.path.join(lang_base_dir, lang)
+        if not os.path.isdir(lang_dir):
+            # shards can create the same language directory at the same time
+            os.makedirs(lang_dir, exist_ok=True)
+            print(lang_dir)
+        lang_file = get_page_filename(lang_dir, url)
+        if shard is not None and not shard.owns_path(lang_file):
+            continue
+        if os.path.exists(lang_file):
+            print('file exists:', lang_file)
+            continue
+        else:
+            print('downloading', url)
+            html = fetch_html(url)
+            if html is not None:
+                write_book_page(lang_dir, url, html)
 
 
-def main():
+def main(shard: Shard = None):
     target_langs = [
         'it',  # Italian
         'de',  # German
@@ -69,8 +71,11 @@ def main():
 
     html_dir = '../../data/reviews/Multilingual/Goodreads/HTML-2025-10-23/Canonical_book_pages/'
     lang_dir = '../../data/reviews/Multilingual/Goodreads/HTML-2025-10-23/'
-    extract_links(html_dir, lang_dir, target_langs)
+    metrics.configure(snapshot_file=get_shard_file(os.path.join(lang_dir, 'crawl_metrics.jsonl'), shard))
+    extract_links(html_dir, lang_dir, target_langs, shard=shard)
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description='Download the language versions of the canonical book pages.')
+    add_shard_arguments(parser)
+    main(shard=get_shard(parser.parse_args()))
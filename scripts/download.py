@@ -1,17 +1,19 @@
 import glob
 import logging
 import os
-import random
-import requests
 import time
 from typing import List, Union
 
+import requests
 from playwright.sync_api import sync_playwright
 from playwright._impl._errors import Error
 from playwright._impl._errors import TimeoutError
 
-from parse import read_html_file, get_language_links, filter_language_links
+import metrics
 from parse import get_page_filename
+from http_cache import HTTPCache
+from language_link_index import load_language_link_index
+from throttle import AdaptiveThrottle, get_throttle, parse_retry_after, THROTTLE_STATUSES
 
 
 TARGET_LANGS = [
@@ -23,9 +25,15 @@ TARGET_LANGS = [
     'zh'
 ]
 
+DEFAULT_CACHE_DIR = '../data/http_cache'
+
 
-def fetch_html(url: str, wait_time: float = 5.0, max_attempts: int = 5,
-               headless: bool = True, manual_delay: int = 3) -> Union[str, None]:
+def fetch_html(url: str, max_attempts: int = 5, headless: bool = True, manual_delay: int = 3,
+               throttle: AdaptiveThrottle = None) -> Union[str, None]:
+    """Fetch the rendered HTML of a URL. The pace of the requests is set by the (shared)
+    adaptive throttle of the host, which slows down when responses are throttled."""
+    if throttle is None:
+        throttle = get_throttle(url)
     with sync_playwright() as playwright:
         webkit = playwright.webkit
         desktop = playwright.devices["Desktop Firefox"]
@@ -34,64 +42,104 @@ def fetch_html(url: str, wait_time: float = 5.0, max_attempts: int = 5,
         page = context.new_page()
         attempt = 0
         while attempt < max_attempts:
+            throttle.wait()
+            metrics.counter('fetch.attempts').inc()
             try:
-                page.goto(url)
+                with metrics.timer('fetch.seconds'):
+                    response = page.goto(url)
+                # give the scripts on the page time to render the reviews
                 time.sleep(manual_delay)
                 html = page.inner_html('html')
+                status = response.status if response is not None else 200
+                if throttle.on_response(status, html, parse_retry_after(response.headers.get('retry-after')
+                                                                        if response is not None else None)):
+                    raise Error(f"throttled with HTTP status {status} for {url}")
                 browser.close()
-                time.sleep(wait_time)
+                metrics.counter('fetch.pages').inc()
+                metrics.histogram('fetch.page_bytes', buckets=metrics.SIZE_BUCKETS).observe(len(html))
                 return html
             except (TimeoutError, Error) as err:
                 logging.error(err)
                 print(err)
+                metrics.counter('fetch.errors').inc()
+                if isinstance(err, TimeoutError):
+                    throttle.on_throttle()
                 attempt += 1
-                time.sleep(wait_time)
         if attempt == max_attempts:
             print(f"failed crawling thread {url}")
+            metrics.counter('fetch.failed').inc()
             browser.close()
     return None
 
 
-def sleep(min_sleep_time: int = 10, max_random_time: int = 10) -> None:
-    """Sleep for a minimum number of seconds and a random amount of time."""
-    sleep_time = min_sleep_time + random.randint(0, max_random_time) + random.random()
-    time.sleep(sleep_time)
+def get_text_throttled(cache: HTTPCache, url: str, max_attempts: int = 5) -> Union[str, None]:
+    """Get the text of a URL through the HTTP cache, pacing the requests with the adaptive
+    throttle of the host and retrying throttled requests. Returns None if all attempts failed
+    or the server answered with an error status that is not throttling."""
+    throttle = get_throttle(url)
+    for attempt in range(max_attempts):
+        throttle.wait()
+        try:
+            text = cache.get_text(url)
+        except requests.HTTPError as err:
+            status = err.response.status_code
+            if status not in THROTTLE_STATUSES:
+                # e.g. a 404, retrying won't help and one missing page should not stop a download run
+                logging.error(f"failed downloading {url}: HTTP status {status}")
+                metrics.counter('fetch.failed').inc()
+                return None
+            throttle.on_throttle(parse_retry_after(err.response.headers.get('Retry-After')))
+            logging.error(f"attempt {attempt+1} of {max_attempts} throttled for {url}: HTTP status {status}")
+            continue
+        except (requests.ConnectionError, requests.Timeout) as err:
+            logging.error(f"attempt {attempt+1} of {max_attempts} failed for {url}: {err}")
+            throttle.on_throttle()
+            continue
+        if throttle.on_response(200, text):
+            logging.error(f"attempt {attempt+1} of {max_attempts} got a block page for {url}")
+            continue
+        return text
+    logging.error(f"failed downloading {url} after {max_attempts} attempts")
+    return None
 
 
-def download_urls(urls: List[str], page_dir: str) -> None:
+def download_urls(urls: List[str], page_dir: str, cache: HTTPCache = None) -> None:
     """Download page content for a list of Goodreads
     URLs and write each page to disk"""
+    if cache is None:
+        cache = HTTPCache(DEFAULT_CACHE_DIR)
     for url in urls:
-        sleep(min_sleep_time=10, max_random_time=10)
-        response = requests.get(url)
-        write_book_page(page_dir, url, response)
+        html = get_text_throttled(cache, url)
+        if html is not None:
+            write_book_page(page_dir, url, html)
 
 
-def download_review_pages(base_output_dir: str, html_input_dir):
+def download_review_pages(base_output_dir: str, html_input_dir, cache: HTTPCache = None):
+    if cache is None:
+        cache = HTTPCache(DEFAULT_CACHE_DIR)
     book_page_files = glob.glob(os.path.join(html_input_dir, '*.html'))
-
-    for fname in book_page_files:
-        page_soup = read_html_file(fname)
-        links = get_language_links(page_soup)
-        links = filter_language_links(links, TARGET_LANGS)
-        for link in links:
-            lang_dir = os.path.join(base_output_dir, link.attrs['hreflang'])
-            if not os.path.isdir(lang_dir):
-                os.mkdir(lang_dir)
-                print(lang_dir)
-            lang_file = get_page_filename(lang_dir, link['href'])
-            if os.path.exists(lang_file):
-                print('file exists:', lang_file)
-                continue
-            else:
-                print('downloading', link['href'])
-                response = requests.get(link['href'])
-                write_book_page(lang_dir, link['href'], response.text)
-                sleep(min_sleep_time=10, max_random_time=10)
+    link_index = load_language_link_index(book_page_files)
+
+    for lang, url in link_index.iter_target_links(book_page_files, TARGET_LANGS):
+        lang_dir = os.path.join(base_output_dir, lang)
+        if not os.path.isdir(lang_dir):
+            os.mkdir(lang_dir)
+            print(lang_dir)
+        lang_file = get_page_filename(lang_dir, url)
+        if os.path.exists(lang_file):
+            print('file exists:', lang_file)
+            continue
+        else:
+            print('downloading', url)
+            html = get_text_throttled(cache, url)
+            if html is not None:
+                write_book_page(lang_dir, url, html)
 
 
 def write_book_page(page_dir: str, url: str, html_content: str) -> None:
     filename = get_page_filename(page_dir, url)
     with open(filename, 'wt') as fh:
         fh.write(html_content)
+    metrics.counter('pages.written').inc()
+    metrics.counter('pages.bytes_written').inc(len(html_content))
 
@@ -0,0 +1,95 @@
+import io
+import os
+import tarfile
+import time
+from typing import Dict, List
+
+import pandas as pd
+
+
+def get_book_fields(book_metadata: pd.DataFrame) -> pd.DataFrame:
+    """Return the author(s), title and genres per goodreads_book_id from the book metadata of
+    all review pages, in one row per book. Like the per-record loop in the notebook, records
+    without author are skipped, the author and title of the last record of a book are used
+    and the genres of the first record of a book that has genres."""
+    book_metadata = book_metadata[book_metadata.author_name.notna()]
+    book_fields = pd.DataFrame({
+        'goodreads_book_id': book_metadata.goodreads_book_id,
+        'book_author': book_metadata.author_name.str.join('; '),
+        'book_title': book_metadata.book_title,
+    }).drop_duplicates('goodreads_book_id', keep='last')
+    genres = book_metadata[['goodreads_book_id', 'genres']]
+    genres = genres[genres.genres.str.len() > 0].drop_duplicates('goodreads_book_id', keep='first')
+    genres = genres.explode('genres')
+    genres['genre'] = genres.genres.str['genre']
+    book_genre = genres.groupby('goodreads_book_id', sort=False).genre.agg('; '.join).rename('book_genre')
+    return book_fields.merge(book_genre, left_on='goodreads_book_id', right_index=True, how='outer')
+
+
+def enrich_reviews(reviews: pd.DataFrame, book_metadata: pd.DataFrame,
+                   book_key: str = 'goodreads_book_id') -> pd.DataFrame:
+    """Add the author, title and genres of the reviewed book to each review, with a single hash
+    join of the reviews on the aggregated book metadata. Use book_key='book_id' for review cards."""
+    book_fields = get_book_fields(book_metadata)
+    if book_key != 'goodreads_book_id':
+        book_fields = book_fields.rename(columns={'goodreads_book_id': book_key})
+    return reviews.merge(book_fields, on=book_key, how='left', validate='many_to_one')
+
+
+def _add_text_member(archive: tarfile.TarFile, name: str, text: str) -> None:
+    data = text.encode('utf-8')
+    member = tarfile.TarInfo(name)
+    member.size = len(data)
+    member.mtime = int(time.time())
+    archive.addfile(member, io.BytesIO(data))
+
+
+def export_lang_archives(reviews: pd.DataFrame, output_dir: str, batch_size: int = 10000,
+                         lang_column: str = 'review_lang') -> Dict[str, List[str]]:
+    """Write the review texts per language to gzipped tar archives of at most batch_size
+    reviews each (<output_dir>/gr_review_<lang>/reviews-<lang>-<batch>.tar.gz), instead of a
+    text file per review. The members are named reviews-book-<book_num>-<n>.txt, as the text
+    files were, and each archive has an index.tsv with the other fields of its reviews.
+    Returns the archive files per language."""
+    archive_files = {}
+    for lang, lang_reviews in reviews.groupby(lang_column, sort=True):
+        lang_dir = os.path.join(output_dir, f'gr_review_{lang}')
+        os.makedirs(lang_dir, exist_ok=True)
+        # number the reviews per language like the text files were, counting reviews without text
+        lang_reviews = lang_reviews.assign(
+            review_filename=[f"reviews-book-{book_num}-{ri+1}.txt"
+                             for ri, book_num in enumerate(lang_reviews.goodreads_book_num)])
+        lang_reviews = lang_reviews[lang_reviews.review_text.notna()]
+        archive_files[lang] = []
+        for batch_start in range(0, len(lang_reviews), batch_size):
+            batch = lang_reviews.iloc[batch_start:batch_start + batch_size]
+            archive_file = os.path.join(lang_dir, f'reviews-{lang}-{batch_start // batch_size + 1:05d}.tar.gz')
+            with tarfile.open(archive_file, 'w:gz') as archive:
+                for filename, review_text in zip(batch.review_filename, batch.review_text):
+                    _add_text_member(archive, filename, review_text)
+                _add_text_member(archive, 'index.tsv', batch.drop(columns=['review_text']).to_csv(sep='\t', index=False))
+            archive_files[lang].append(archive_file)
+        print(f"language {lang}: {len(lang_reviews)} reviews in {len(archive_files[lang])} archives")
+    return archive_files
+
+
+def main():
+    from parquet_sink import read_dataset, get_dataset_dirs
+
+    parquet_base_dir = '../../data/reviews/Multilingual/Goodreads/Parquet/'
+    output_dir = '../data/'
+    gr_review_file = '../data/gr_reviews-crawl.jsonl.gz'
+
+    start = time.perf_counter()
+    dataset_dirs = get_dataset_dirs(parquet_base_dir)
+    reviews = read_dataset(dataset_dirs['reviews']).to_pandas()
+    book_metadata = read_dataset(dataset_dirs['metadata'], lang_column='review_file_language',
+                                 columns=['goodreads_book_id', 'book_title', 'author_name', 'genres']).to_pandas()
+    reviews = enrich_reviews(reviews, book_metadata)
+    print(f"{len(reviews)} reviews enriched in {time.perf_counter() - start:.1f}s")
+    reviews.to_json(gr_review_file, orient='records', lines=True, compression='gzip')
+    export_lang_archives(reviews, output_dir)
+
+
+if __name__ == "__main__":
+    main()
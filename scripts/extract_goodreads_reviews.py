@@ -1,10 +1,20 @@
+import argparse
 import json
+import multiprocessing
 import os
-from typing import Dict, List
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
 
-
-from parse import read_html_file, extract_reviews
-from parse import read_book_review_files
+import metrics
+from parse import read_review_cards, check_review_backend
+from parse import read_html_string, extract_reviews
+from parse import iter_page_data, get_crawl_date, parse_review_date, parse_genre_users
+from extraction_manifest import ExtractionManifest, hash_file
+from book_catalog import read_book_review_files
+from review_search import update_search_index
+from sharding import Shard, add_shard_arguments, get_shard, get_shard_file
 
 
 def map_html_to_json_file(html_filepath: str, json_base_dir: str):
@@ -12,31 +22,201 @@ def map_html_to_json_file(html_filepath: str, json_base_dir: str):
     json_filename = html_filename.replace('.html', '-reviews.json')
     _, lang = os.path.split(lang_dir)
     json_lang_dir = os.path.join(json_base_dir, lang)
-    if os.path.exists(json_lang_dir) is False:
-        os.mkdir(json_lang_dir)
+    # shard processes can create the same language directory concurrently
+    os.makedirs(json_lang_dir, exist_ok=True)
     return os.path.join(json_lang_dir, json_filename)
 
 
-def write_reviews_json(book_files: Dict[str, List[str]], json_base_dir: str):
+def write_json_atomic(json_file: str, data) -> int:
+    """Write data as JSON to a temporary file in the target directory and move
+    it into place, so an interrupted run never leaves a truncated JSON file.
+    Returns the size of the written file."""
+    json_dir, json_filename = os.path.split(json_file)
+    fd, tmp_file = tempfile.mkstemp(dir=json_dir, prefix=f'.{json_filename}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wt') as fh:
+            json.dump(data, fh)
+            num_bytes = fh.tell()
+        os.replace(tmp_file, json_file)
+        return num_bytes
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+
+def needs_extraction(html_file: str, json_file: str, manifest: ExtractionManifest = None) -> bool:
+    """Without a manifest, a file needs extraction if it has no JSON output. With a manifest,
+    it needs extraction if its content or the extractor version changed since the last run."""
+    if manifest is None:
+        return not os.path.exists(json_file)
+    return manifest.check(html_file, json_file)
+
+
+def write_reviews_json(book_files: Dict[str, List[str]], json_base_dir: str, backend: str = 'bs4',
+                       manifest: ExtractionManifest = None):
+    check_review_backend(backend)
     for bi, book_id in enumerate(book_files):
         for html_file in book_files[book_id]:
             print(f"{bi+1} of {len(book_files)} books, {html_file}")
             json_file = map_html_to_json_file(html_file, json_base_dir)
-            if os.path.exists(json_file):
+            if not needs_extraction(html_file, json_file, manifest):
+                continue
+            if manifest is not None:
+                stat, content_hash = os.stat(html_file), hash_file(html_file)
+            with metrics.timer('extract.page_seconds'):
+                reviews = read_review_cards(book_id, html_file, backend=backend)
+            record_extraction_metrics(len(reviews), write_json_atomic(json_file, reviews))
+            if manifest is not None:
+                manifest.record(html_file, json_file, content_hash=content_hash, stat=stat)
+    if manifest is not None:
+        print('extraction manifest:')
+        manifest.print_report()
+    return None
+
+
+def record_extraction_metrics(num_reviews: int, num_bytes: int) -> None:
+    metrics.counter('extract.pages').inc()
+    metrics.counter('extract.reviews').inc(num_reviews)
+    metrics.counter('extract.bytes_written').inc(num_bytes)
+
+
+def extract_reviews_job(job: Tuple[str, str, str, str]) -> Tuple[int, str, str, float, str, os.stat_result, int, int]:
+    """Extract the reviews of a single HTML file and write them to JSON. Runs in a worker process,
+    so the metrics are returned (number of reviews, bytes written) and recorded by the parent."""
+    book_id, html_file, json_file, backend = job
+    start = time.perf_counter()
+    # stat and hash before extraction, so a file that changes during extraction is processed again next time
+    stat = os.stat(html_file)
+    content_hash = hash_file(html_file)
+    reviews = read_review_cards(book_id, html_file, backend=backend)
+    num_bytes = write_json_atomic(json_file, reviews)
+    return os.getpid(), html_file, json_file, time.perf_counter() - start, content_hash, stat, len(reviews), num_bytes
+
+
+def get_extraction_jobs(book_files: Dict[str, List[str]], json_base_dir: str,
+                        backend: str = 'bs4', manifest: ExtractionManifest = None) -> List[Tuple[str, str, str, str]]:
+    """Map all HTML files to their JSON output file, skipping files that need no extraction."""
+    jobs = []
+    for book_id in book_files:
+        for html_file in book_files[book_id]:
+            json_file = map_html_to_json_file(html_file, json_base_dir)
+            if not needs_extraction(html_file, json_file, manifest):
                 continue
-            page = read_html_file(html_file)
-            reviews = extract_reviews(book_id, html_file, page)
-            with open(json_file, 'wt') as fh:
-                json.dump(reviews, fh)
+            jobs.append((book_id, html_file, json_file, backend))
+    return jobs
+
+
+def write_reviews_json_parallel(book_files: Dict[str, List[str]], json_base_dir: str,
+                                num_workers: int = None, chunk_size: int = 16,
+                                report_every: int = 1000, backend: str = 'bs4',
+                                manifest: ExtractionManifest = None):
+    """Extract the reviews of all HTML files in a pool of worker processes and
+    report the throughput in pages per second per worker."""
+    check_review_backend(backend)
+    if num_workers is None:
+        num_workers = os.cpu_count()
+    jobs = get_extraction_jobs(book_files, json_base_dir, backend=backend, manifest=manifest)
+    num_files = sum(len(book_files[book_id]) for book_id in book_files)
+    print(f"{len(jobs)} of {num_files} files to extract, {num_workers} workers, chunk size {chunk_size}")
+    worker_pages = defaultdict(int)
+    worker_time = defaultdict(float)
+    start = time.perf_counter()
+    with multiprocessing.Pool(processes=num_workers) as pool:
+        results = pool.imap_unordered(extract_reviews_job, jobs, chunksize=chunk_size)
+        for ji, (pid, html_file, json_file, elapsed, content_hash, stat, num_reviews, num_bytes) in enumerate(results):
+            metrics.histogram('extract.page_seconds').observe(elapsed)
+            record_extraction_metrics(num_reviews, num_bytes)
+            if manifest is not None:
+                manifest.record(html_file, json_file, content_hash=content_hash, stat=stat)
+            worker_pages[pid] += 1
+            worker_time[pid] += elapsed
+            if (ji+1) % report_every == 0:
+                total_time = time.perf_counter() - start
+                print(f"{ji+1} of {len(jobs)} files, {(ji+1) / total_time:.1f} pages/s")
+    total_time = time.perf_counter() - start
+    for pid in sorted(worker_pages):
+        pages_per_sec = worker_pages[pid] / worker_time[pid] if worker_time[pid] > 0 else 0.0
+        print(f"worker {pid}: {worker_pages[pid]} pages, {pages_per_sec:.1f} pages/s")
+    if total_time > 0:
+        print(f"total: {len(jobs)} pages in {total_time:.1f}s, {len(jobs) / total_time:.1f} pages/s")
+    if manifest is not None:
+        print('extraction manifest:')
+        manifest.print_report()
+    return None
+
+
+def write_store_reviews_json(store, json_base_dir: str, crawl_date: str = None, lang: str = None):
+    """Extract the reviews of the pages in a SnapshotStore, reading the store sequentially,
+    and write them to JSON in the same layout as write_reviews_json. The JSON file of a book
+    and language has no crawl date, so without `crawl_date` the latest crawl of each page is used."""
+    store_pages = store.iter_pages(lang=lang, crawl_date=crawl_date, latest=crawl_date is None)
+    for pi, (book_id, page_lang, page_crawl_date, html) in enumerate(store_pages):
+        # the extraction functions derive the language and source URL from the <lang>/<book_id>.html layout
+        html_file = os.path.join(page_lang, f'{book_id}.html')
+        json_file = map_html_to_json_file(html_file, json_base_dir)
+        if os.path.exists(json_file):
+            continue
+        print(f"{pi+1} pages, {page_crawl_date} {html_file}")
+        page = read_html_string(html)
+        reviews = extract_reviews(book_id, html_file, page)
+        write_json_atomic(json_file, reviews)
+        page.decompose()
+    return None
+
+
+def write_reviews_parquet(book_files: Dict[str, List[str]], parquet_base_dir: str, batch_size: int = 50000):
+    """Extract the reviews, review cards and book metadata of all HTML files and write them in
+    batches to Parquet datasets partitioned by language and crawl date."""
+    from parquet_sink import ParquetDatasetWriter, get_dataset_dirs
+    from parquet_sink import REVIEW_SCHEMA, REVIEW_CARD_SCHEMA, METADATA_SCHEMA
+    from parquet_sink import REVIEW_PARTITION_COLS, METADATA_PARTITION_COLS
+
+    dataset_dirs = get_dataset_dirs(parquet_base_dir)
+    review_writer = ParquetDatasetWriter(dataset_dirs['reviews'], REVIEW_SCHEMA, REVIEW_PARTITION_COLS,
+                                         batch_size=batch_size)
+    card_writer = ParquetDatasetWriter(dataset_dirs['review_cards'], REVIEW_CARD_SCHEMA, REVIEW_PARTITION_COLS,
+                                       batch_size=batch_size)
+    metadata_writer = ParquetDatasetWriter(dataset_dirs['metadata'], METADATA_SCHEMA, METADATA_PARTITION_COLS,
+                                           batch_size=batch_size)
+    with review_writer, card_writer, metadata_writer:
+        for pi, (book_id, html_file, page_data) in enumerate(iter_page_data(book_files)):
+            print(f"{pi+1} pages, {html_file}")
+            crawl_date = get_crawl_date(html_file)
+            for record in page_data['reviews'] + page_data['review_cards'] + [page_data['metadata']]:
+                record['crawl_date'] = crawl_date
+            for review in page_data['reviews'] + page_data['review_cards']:
+                review['review_day'] = parse_review_date(review['review_date'])
+            for genre_vote in page_data['metadata']['genres']:
+                genre_vote['num_users'] = parse_genre_users(genre_vote['users'])
+            review_writer.write_many(page_data['reviews'])
+            card_writer.write_many(page_data['review_cards'])
+            metadata_writer.write(page_data['metadata'])
+    print(f"records written: reviews {review_writer.num_records}, review cards {card_writer.num_records}, "
+          f"metadata {metadata_writer.num_records}")
     return None
 
 
-def main():
+def main(shard: Shard = None):
     json_base_dir = '../../data/reviews/Multilingual/Goodreads/JSON/'
+    metrics.configure(snapshot_file=get_shard_file(os.path.join(json_base_dir, 'extraction_metrics.jsonl'), shard))
     html_dir = '../../data/reviews/Multilingual/Goodreads/HTML-2025-10-23/'
-    book_files = read_book_review_files(html_dir)
-    write_reviews_json(book_files, json_base_dir)
+    book_files = read_book_review_files(html_dir, shard=shard)
+    manifest = ExtractionManifest(get_shard_file(os.path.join(json_base_dir, 'extraction_manifest.sqlite'), shard))
+    # local shard processes share the CPUs
+    num_workers = None if shard is None else max(1, os.cpu_count() // shard.count)
+    write_reviews_json_parallel(book_files, json_base_dir, num_workers=num_workers, manifest=manifest)
+    manifest.close()
+    if shard is not None:
+        # the shards would all write the same search index, it is updated after merging the manifests
+        print(f"{shard}: done, update the search index with review_search.py --json-dir {json_base_dir}")
+        return None
+    # add the reviews of the newly extracted files to the full-text search index
+    search_stats = update_search_index(os.path.join(json_base_dir, 'review_search.sqlite'), json_base_dir)
+    print(f"search index: {search_stats['reviews']} reviews from {search_stats['files']} files added")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description='Extract the reviews of the crawled Goodreads pages to JSON.')
+    add_shard_arguments(parser)
+    main(shard=get_shard(parser.parse_args()))
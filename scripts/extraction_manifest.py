@@ -0,0 +1,114 @@
+import hashlib
+import os
+import sqlite3
+import time
+from collections import Counter
+from typing import Dict, List, Union
+
+from parse import EXTRACTOR_VERSION
+
+
+MANIFEST_SCHEMA = """
+CREATE TABLE IF NOT EXISTS manifest (
+    html_file TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    content_hash TEXT NOT NULL,
+    extractor_version TEXT NOT NULL,
+    json_file TEXT NOT NULL,
+    extracted_at REAL NOT NULL
+);
+"""
+
+
+def hash_file(filename: str) -> str:
+    """Return the SHA-256 hash of the content of a file."""
+    file_hash = hashlib.sha256()
+    with open(filename, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(1024 * 1024), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+class ExtractionManifest:
+    """Records for each extracted HTML file its size, modification time, content hash,
+    the extractor version that processed it and its JSON output file, so that a re-run
+    only re-extracts pages whose content or extractor version changed.
+
+    The content hash is only computed when the size or modification time of a file changed,
+    so checking an unchanged corpus costs a stat per file."""
+
+    def __init__(self, db_file: str, extractor_version: str = EXTRACTOR_VERSION):
+        self.extractor_version = extractor_version
+        self.conn = sqlite3.connect(db_file)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(MANIFEST_SCHEMA)
+        self.counts = Counter()
+
+    def close(self) -> None:
+        self.conn.commit()
+        self.conn.close()
+
+    def get_rebuild_reason(self, html_file: str, json_file: str) -> Union[str, None]:
+        """Return why a file needs to be (re-)extracted, or None if its JSON output is up to date.
+        The reason is one of 'new', 'extractor_version', 'missing_output' or 'changed_input'."""
+        row = self.conn.execute('SELECT * FROM manifest WHERE html_file = ?', (html_file,)).fetchone()
+        if row is None:
+            return 'new'
+        if row['extractor_version'] != self.extractor_version:
+            return 'extractor_version'
+        if row['json_file'] != json_file or not os.path.exists(json_file):
+            return 'missing_output'
+        stat = os.stat(html_file)
+        if stat.st_size == row['size'] and stat.st_mtime_ns == row['mtime_ns']:
+            return None
+        if hash_file(html_file) != row['content_hash']:
+            return 'changed_input'
+        # touched but unchanged, update the stat to skip hashing next time
+        with self.conn:
+            self.conn.execute('UPDATE manifest SET size = ?, mtime_ns = ? WHERE html_file = ?',
+                              (stat.st_size, stat.st_mtime_ns, html_file))
+        return None
+
+    def check(self, html_file: str, json_file: str) -> bool:
+        """Check whether a file needs to be extracted and count the outcome for the report."""
+        reason = self.get_rebuild_reason(html_file, json_file)
+        self.counts['skipped' if reason is None else f'rebuilt ({reason})'] += 1
+        return reason is not None
+
+    def record(self, html_file: str, json_file: str, content_hash: str = None,
+               stat: os.stat_result = None) -> None:
+        """Record that a file was extracted with the current extractor version."""
+        if stat is None:
+            stat = os.stat(html_file)
+        if content_hash is None:
+            content_hash = hash_file(html_file)
+        with self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO manifest (html_file, size, mtime_ns, content_hash, extractor_version, '
+                'json_file, extracted_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (html_file, stat.st_size, stat.st_mtime_ns, content_hash, self.extractor_version,
+                 json_file, time.time()))
+
+    def print_report(self) -> None:
+        for outcome, count in sorted(self.counts.items()):
+            print(f"\t{outcome}: {count}")
+
+    def merge(self, manifest_file: str) -> int:
+        """Add the entries of another manifest, e.g. of a shard. Returns the number of merged entries."""
+        self.conn.execute('ATTACH DATABASE ? AS other', (manifest_file,))
+        try:
+            with self.conn:
+                cursor = self.conn.execute('INSERT OR REPLACE INTO manifest SELECT * FROM other.manifest')
+        finally:
+            self.conn.execute('DETACH DATABASE other')
+        return cursor.rowcount
+
+
+def merge_manifests(manifest_file: str, shard_manifest_files: List[str]) -> Dict[str, int]:
+    """Merge the extraction manifests of the shards of an extraction into one manifest.
+    Returns the entries per shard manifest."""
+    manifest = ExtractionManifest(manifest_file)
+    stats = {shard_manifest_file: manifest.merge(shard_manifest_file) for shard_manifest_file in shard_manifest_files}
+    manifest.close()
+    return stats
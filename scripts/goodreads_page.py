@@ -0,0 +1,120 @@
+import os
+import threading
+from collections import OrderedDict
+from functools import cached_property
+from typing import Dict, List, Tuple, Union
+
+from bs4 import BeautifulSoup
+
+from parse import read_html_file, extract_page, extract_enjoyed_books
+from parse import get_book_list_pagination_urls, get_book_list_books
+
+
+# A BeautifulSoup tree takes roughly fourteen times the size of the HTML it was parsed from
+SOUP_SIZE_FACTOR = 14
+DEFAULT_CACHE_SIZE = 512 * 1024 * 1024
+
+
+class GoodreadsPage:
+    """A saved Goodreads page whose soup and extracted fields are computed on first access
+    and memoized. The book page fields (metadata, canonical URL, language links, reviews and
+    review cards) come from a single extract_page traversal.
+
+    Use get_page(path) to get pages from the shared cache, so every caller in a process
+    uses the same parse of a page. This is the API for interactive analysis in notebooks,
+    where one page is inspected with several extractors. The crawl and extraction scripts
+    read each page once and decompose it, and should not keep their soups in the cache."""
+
+    def __init__(self, path: str, book_id: str = None):
+        self.path = path
+        self.book_id = book_id if book_id is not None else os.path.basename(path).replace('.html', '')
+
+    @cached_property
+    def soup(self) -> BeautifulSoup:
+        return read_html_file(self.path)
+
+    @cached_property
+    def page_data(self) -> Dict[str, any]:
+        return extract_page(self.book_id, self.path, self.soup)
+
+    @property
+    def metadata(self) -> Dict[str, any]:
+        return self.page_data['metadata']
+
+    @property
+    def canonical_url(self) -> Union[str, None]:
+        return self.page_data['canonical_url']
+
+    @property
+    def language_links(self) -> List[BeautifulSoup]:
+        return self.page_data['language_links']
+
+    @property
+    def reviews(self) -> List[Dict[str, any]]:
+        return self.page_data['reviews']
+
+    @property
+    def review_cards(self) -> List[Dict[str, any]]:
+        return self.page_data['review_cards']
+
+    @cached_property
+    def enjoyed_books(self) -> List[str]:
+        return extract_enjoyed_books(self.soup)
+
+    @cached_property
+    def pagination_urls(self) -> List[str]:
+        return get_book_list_pagination_urls(self.soup)
+
+    def get_book_list_books(self, book_list: str) -> List[Dict[str, any]]:
+        return get_book_list_books(self.soup, book_list)
+
+
+class PageCache:
+    """An LRU cache of GoodreadsPage objects, bounded by the estimated memory of their soups
+    and keyed by path, modification time and size, so a page that is overwritten on disk
+    is parsed again."""
+
+    def __init__(self, max_size: int = DEFAULT_CACHE_SIZE):
+        self.max_size = max_size
+        self.pages: OrderedDict[Tuple[str, int, int], Tuple[GoodreadsPage, int]] = OrderedDict()
+        self.size = 0
+        self.counts = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self.lock = threading.Lock()
+
+    def get(self, path: str, book_id: str = None) -> GoodreadsPage:
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            if key in self.pages:
+                self.pages.move_to_end(key)
+                self.counts['hits'] += 1
+                return self.pages[key][0]
+            self.counts['misses'] += 1
+            page = GoodreadsPage(path, book_id=book_id)
+            page_size = stat.st_size * SOUP_SIZE_FACTOR
+            self.pages[key] = (page, page_size)
+            self.size += page_size
+            # keep at least the page that was just added, even if it exceeds the limit on its own
+            while self.size > self.max_size and len(self.pages) > 1:
+                _, (_, evicted_size) = self.pages.popitem(last=False)
+                self.size -= evicted_size
+                self.counts['evictions'] += 1
+            return page
+
+    def clear(self) -> None:
+        with self.lock:
+            self.pages.clear()
+            self.size = 0
+
+
+PAGE_CACHE = PageCache()
+
+
+def get_page(path: str, book_id: str = None) -> GoodreadsPage:
+    """Return the (cached) page object of a saved Goodreads page."""
+    return PAGE_CACHE.get(path, book_id=book_id)
+
+
+def read_html_file_cached(path: str) -> BeautifulSoup:
+    """Like parse.read_html_file, but parse each (unchanged) file only once."""
+    return get_page(path).soup
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+from typing import Dict, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+try:
+    import brotli  # noqa: F401 - requests/urllib3 decode brotli responses when it is installed
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+
+def get_session(pool_size: int = 10) -> requests.Session:
+    """Return a session that keeps connections alive in a pool of `pool_size` connections per host
+    and accepts compressed responses."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+    return session
+
+
+class HTTPCache:
+    """An on-disk HTTP cache that revalidates cached pages with conditional GET requests,
+    using the ETag and Last-Modified headers of the cached response. An unchanged page
+    costs a 304 response instead of a full download."""
+
+    def __init__(self, cache_dir: str, session: requests.Session = None, timeout: float = 30.0):
+        self.cache_dir = cache_dir
+        self.session = session if session is not None else get_session()
+        self.timeout = timeout
+        self.stats = {'downloaded': 0, 'not_modified': 0}
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def get_cache_files(self, url: str):
+        url_hash = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        cache_subdir = os.path.join(self.cache_dir, url_hash[:2])
+        return os.path.join(cache_subdir, f'{url_hash}.json'), os.path.join(cache_subdir, f'{url_hash}.body')
+
+    def read_cache_entry(self, url: str) -> Union[Dict[str, str], None]:
+        meta_file, body_file = self.get_cache_files(url)
+        if not os.path.exists(meta_file) or not os.path.exists(body_file):
+            return None
+        with open(meta_file, 'rt') as fh:
+            return json.load(fh)
+
+    def write_cache_entry(self, url: str, response: requests.Response) -> None:
+        meta_file, body_file = self.get_cache_files(url)
+        os.makedirs(os.path.dirname(meta_file), exist_ok=True)
+        with open(body_file, 'wb') as fh:
+            fh.write(response.content)
+        cache_entry = {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'encoding': response.encoding,
+        }
+        with open(meta_file, 'wt') as fh:
+            json.dump(cache_entry, fh)
+
+    def read_cached_text(self, url: str, cache_entry: Dict[str, str]) -> str:
+        _, body_file = self.get_cache_files(url)
+        with open(body_file, 'rb') as fh:
+            content = fh.read()
+        return content.decode(cache_entry['encoding'] or 'utf-8', errors='replace')
+
+    def get_text(self, url: str) -> str:
+        """Return the text of a URL, from the cache if the server reports that it is unchanged."""
+        cache_entry = self.read_cache_entry(url)
+        headers = {}
+        if cache_entry is not None:
+            if cache_entry['etag'] is not None:
+                headers['If-None-Match'] = cache_entry['etag']
+            if cache_entry['last_modified'] is not None:
+                headers['If-Modified-Since'] = cache_entry['last_modified']
+        with metrics.timer('http.request_seconds'):
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+        metrics.counter(f'http.status_{response.status_code}').inc()
+        if response.status_code == 304 and cache_entry is not None:
+            self.stats['not_modified'] += 1
+            return self.read_cached_text(url, cache_entry)
+        response.raise_for_status()
+        self.stats['downloaded'] += 1
+        metrics.counter('http.bytes_downloaded').inc(len(response.content))
+        if response.headers.get('ETag') is not None or response.headers.get('Last-Modified') is not None:
+            self.write_cache_entry(url, response)
+        return response.text
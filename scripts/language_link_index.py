@@ -0,0 +1,140 @@
+import argparse
+import glob
+import json
+import os
+import tempfile
+from typing import Any, Dict, List, Tuple
+
+from extraction_manifest import hash_file
+from parse import read_html_file, get_language_links
+from sharding import Shard
+
+
+class LanguageLinkIndex:
+    """A compact index of the hreflang links of canonical book pages (book page → {lang: url}),
+    stored as JSON. A page is only parsed again when its size and modification time changed
+    and its content hash differs from the indexed one, so planning language crawls is a dict
+    lookup instead of a full HTML parse per page. The pages are also keyed by book_id, for
+    book → {lang: url} lookups."""
+
+    def __init__(self, index_file: str, seed_file: str = None):
+        """Load the index from index_file or, if that does not exist yet, from seed_file."""
+        self.index_file = index_file
+        self.pages: Dict[str, Dict[str, Any]] = {}
+        load_file = index_file if os.path.exists(index_file) or seed_file is None else seed_file
+        if os.path.exists(load_file):
+            with open(load_file, 'rt') as fh:
+                self.pages = json.load(fh)
+        self.book_pages = {entry['book_id']: page_file for page_file, entry in self.pages.items()}
+        # whether the index differs from the index file
+        self.changed = False
+
+    def save(self) -> None:
+        # a temporary file per process, so concurrent writers never interleave
+        index_dir, index_filename = os.path.split(os.path.abspath(self.index_file))
+        fd, tmp_file = tempfile.mkstemp(dir=index_dir, prefix=f'.{index_filename}.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wt') as fh:
+                json.dump(self.pages, fh)
+            os.replace(tmp_file, self.index_file)
+        except BaseException:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+        self.changed = False
+
+    def is_current(self, page_file: str, stat: os.stat_result) -> bool:
+        entry = self.pages.get(page_file)
+        if entry is None:
+            return False
+        if entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return True
+        if hash_file(page_file) == entry['content_hash']:
+            entry['size'], entry['mtime_ns'] = stat.st_size, stat.st_mtime_ns
+            self.changed = True
+            return True
+        return False
+
+    def update(self, page_files: List[str]) -> int:
+        """Extract the language links of new and changed pages and remove pages that no
+        longer exist from the index. Returns the number of parsed pages."""
+        num_parsed = 0
+        for page_file in page_files:
+            stat = os.stat(page_file)
+            if self.is_current(page_file, stat):
+                continue
+            # only the <head> links are needed, so no full extraction and no cached soup
+            page_soup = read_html_file(page_file)
+            links = {link.attrs['hreflang']: link.attrs['href'] for link in get_language_links(page_soup)
+                     if 'hreflang' in link.attrs}
+            page_soup.decompose()
+            self.pages[page_file] = {
+                'book_id': os.path.basename(page_file).replace('.html', ''),
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'content_hash': hash_file(page_file),
+                'links': links,
+            }
+            self.book_pages[self.pages[page_file]['book_id']] = page_file
+            self.changed = True
+            num_parsed += 1
+        current = set(page_files)
+        for page_file in [page_file for page_file in self.pages if page_file not in current]:
+            book_id = self.pages.pop(page_file)['book_id']
+            if self.book_pages.get(book_id) == page_file:
+                del self.book_pages[book_id]
+            self.changed = True
+        return num_parsed
+
+    def get_links(self, page_file: str, target_langs: List[str] = None) -> Dict[str, str]:
+        """Return the {lang: url} language links of a page, optionally only those of the target languages."""
+        links = self.pages[page_file]['links']
+        if target_langs is None or len(target_langs) == 0:
+            return dict(links)
+        return {lang: url for lang, url in links.items() if lang in target_langs}
+
+    def get_book_links(self, book_id: str) -> Dict[str, str]:
+        """Return the language links of a book by its book_id."""
+        if book_id not in self.book_pages:
+            return {}
+        return dict(self.pages[self.book_pages[book_id]]['links'])
+
+    def iter_target_links(self, page_files: List[str], target_langs: List[str] = None) -> List[Tuple[str, str]]:
+        """Return the (lang, url) language links of a list of pages."""
+        return [(lang, url) for page_file in page_files
+                for lang, url in self.get_links(page_file, target_langs).items()]
+
+
+def load_language_link_index(page_files: List[str], index_file: str = None, shard: Shard = None) -> LanguageLinkIndex:
+    """Load the language link index of a set of canonical pages, update it for new and
+    changed pages and save it. By default the index is stored next to the pages.
+
+    A shard keeps its own index file, which starts from the shared index if there is one,
+    so shard processes do not write the same file. Build the shared index once before
+    launching shards (python language_link_index.py <page_dir>), so the shards only parse
+    the pages that changed since."""
+    if index_file is None:
+        page_dir = os.path.dirname(page_files[0]) if len(page_files) > 0 else '.'
+        index_file = os.path.join(page_dir, 'language_links.json')
+    if shard is not None:
+        index = LanguageLinkIndex(shard.get_file(index_file), seed_file=index_file)
+        index_file = index.index_file
+    else:
+        index = LanguageLinkIndex(index_file)
+    index.update(page_files)
+    if index.changed or not os.path.exists(index_file):
+        index.save()
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or update the language link index of canonical book pages.')
+    parser.add_argument('page_dir', help='the directory of canonical book pages')
+    args = parser.parse_args()
+    page_files = glob.glob(os.path.join(args.page_dir, '*.html'))
+    index = load_language_link_index(page_files)
+    print(f"{len(index.pages)} pages in {index.index_file}")
+
+
+if __name__ == "__main__":
+    main()
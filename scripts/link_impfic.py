@@ -0,0 +1,144 @@
+import time
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+
+ISBN10_WEIGHTS = np.arange(10, 0, -1)
+ISBN13_WEIGHTS = np.array([1, 3] * 6 + [1])
+
+
+def _digit_matrix(isbns: pd.Series, length: int) -> np.ndarray:
+    """Turn a series of equal length digit strings into a matrix of digits, with X (and x) as 10."""
+    # ':' directly follows '9' in ASCII, so it becomes 10 after subtracting ord('0')
+    codes = isbns.str.upper().str.replace('X', ':', regex=False)
+    digits = np.frombuffer(''.join(codes).encode('ascii'), dtype=np.uint8).reshape(-1, length)
+    return digits.astype(np.int64) - ord('0')
+
+
+def _fullmatch(isbns: pd.Series, pattern: str) -> pd.Series:
+    return isbns.str.fullmatch(pattern).fillna(False).astype(bool)
+
+
+def is_valid_isbn10(isbns: pd.Series) -> pd.Series:
+    """Check the format and check digit of a series of ISBN-10 strings."""
+    valid = pd.Series(False, index=isbns.index)
+    mask = _fullmatch(isbns, r"\d{9}[0-9Xx]")
+    if mask.any():
+        valid[mask] = (_digit_matrix(isbns[mask], 10) @ ISBN10_WEIGHTS) % 11 == 0
+    return valid
+
+
+def is_valid_isbn13(isbns: pd.Series) -> pd.Series:
+    """Check the format and check digit of a series of ISBN-13 strings."""
+    valid = pd.Series(False, index=isbns.index)
+    mask = _fullmatch(isbns, r"97[89]\d{10}")
+    if mask.any():
+        valid[mask] = (_digit_matrix(isbns[mask], 13) @ ISBN13_WEIGHTS) % 10 == 0
+    return valid
+
+
+def isbn10_to_isbn13(isbns: pd.Series) -> pd.Series:
+    """Convert a series of ISBN-10 strings to ISBN-13. Values that are not ISBN-10 become None."""
+    isbn13 = pd.Series(None, index=isbns.index, dtype=object)
+    mask = _fullmatch(isbns, r"\d{9}[0-9Xx]")
+    if mask.any():
+        stems = '978' + isbns[mask].str.slice(0, 9)
+        check_digits = (10 - (_digit_matrix(stems, 12) @ ISBN13_WEIGHTS[:12]) % 10) % 10
+        isbn13[mask] = stems + pd.Series(check_digits, index=stems.index).astype(str)
+    return isbn13
+
+
+def normalize_isbns(isbns: pd.Series) -> pd.Series:
+    """Normalize a series of ISBN-10 and ISBN-13 strings to ISBN-13. Values with
+    an invalid check digit become None."""
+    isbn13 = pd.Series(None, index=isbns.index, dtype=object)
+    valid13 = is_valid_isbn13(isbns)
+    isbn13[valid13] = isbns[valid13]
+    valid10 = is_valid_isbn10(isbns)
+    isbn13[valid10] = isbn10_to_isbn13(isbns[valid10])
+    return isbn13
+
+
+def extract_edition_isbns(editions: pd.Series) -> pd.DataFrame:
+    """Extract ISBNs from a series of edition strings. Column reviewed_isbn holds the
+    ISBN as found in the edition string, the same as parse.parse_edition_isbn returns,
+    and column reviewed_isbn13 holds it as validated ISBN-13."""
+    editions = editions.astype('string')
+    isbn13 = editions.str.extract(r"(978\d{9}[0-9Xx])", expand=False)
+    isbn10 = editions.str.extract(r"\b(\d{9}[0-9Xx])", expand=False)
+    reviewed_isbn = isbn13.fillna(isbn10).astype(object).where(lambda s: s.notna(), None)
+    return pd.DataFrame({
+        'reviewed_isbn': reviewed_isbn,
+        'reviewed_isbn13': normalize_isbns(reviewed_isbn.astype('string')),
+    }, index=editions.index)
+
+
+def build_impfic_indexes(work_genre: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """Build lookup tables of ImpFic work IDs, keyed by ISBN-13, by Goodreads identifier
+    (which can be a book ID or a book number) and by work ID."""
+    isbn_records = work_genre.loc[work_genre.record_id_type == 'isbn', ['record_id', 'work_id']]
+    isbn_records = isbn_records.assign(isbn13=normalize_isbns(isbn_records.record_id.astype('string')))
+    isbn_index = isbn_records.dropna(subset=['isbn13'])[['isbn13', 'work_id']].drop_duplicates()
+    gr_records = work_genre.loc[work_genre.record_id_type == 'goodreads', ['record_id', 'work_id']]
+    gr_index = gr_records.rename(columns={'record_id': 'goodreads_id'}).drop_duplicates()
+    return {
+        'isbn': isbn_index.set_index('isbn13'),
+        'goodreads': gr_index.set_index('goodreads_id'),
+        'work_id': work_genre.drop_duplicates(subset=['work_id']).set_index('work_id'),
+    }
+
+
+def link_goodreads_to_impfic(gr_reviews: pd.DataFrame, impfic_indexes: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """Map Goodreads books to ImpFic works via the ISBN of the reviewed editions, the
+    Goodreads book ID and the Goodreads book number. Returns the distinct
+    (goodreads_book_id, goodreads_book_num, work_id) combinations."""
+    books = gr_reviews[['goodreads_book_id', 'goodreads_book_num']].drop_duplicates()
+    edition_isbns = extract_edition_isbns(gr_reviews['edition'])
+    book_isbns = pd.concat([gr_reviews[['goodreads_book_id', 'goodreads_book_num']], edition_isbns], axis=1)
+    book_isbns = book_isbns.dropna(subset=['reviewed_isbn13']).drop_duplicates()
+    isbn_map = book_isbns.join(impfic_indexes['isbn'], on='reviewed_isbn13', how='inner')
+    gr_id_map = books.join(impfic_indexes['goodreads'], on='goodreads_book_id', how='inner')
+    gr_num_map = books.join(impfic_indexes['goodreads'], on='goodreads_book_num', how='inner')
+    link_cols = ['goodreads_book_id', 'goodreads_book_num', 'work_id']
+    return pd.concat([isbn_map[link_cols], gr_id_map[link_cols], gr_num_map[link_cols]]).drop_duplicates()
+
+
+def get_linked_impfic_reviews(book_work_map: pd.DataFrame, impfic_reviews: pd.DataFrame) -> pd.DataFrame:
+    """Select the ImpFic reviews of the linked works, keyed by Goodreads book number and work ID."""
+    book_works = book_work_map[['goodreads_book_num', 'work_id']].drop_duplicates()
+    return book_works.merge(impfic_reviews, on='work_id', how='inner')
+
+
+def read_impfic_data(work_file: str, review_file: str):
+    work_genre = pd.read_csv(work_file, sep='\t', compression='gzip',
+                             dtype={'unesco': str, 'brinkman': str, 'record_id': str})
+    impfic_reviews = pd.read_csv(review_file, sep='\t', compression='gzip')
+    return work_genre, impfic_reviews
+
+
+def main():
+    from parquet_sink import read_dataset, get_dataset_dirs
+
+    parquet_base_dir = '../../data/reviews/Multilingual/Goodreads/Parquet/'
+    review_file = '../../data/review_features/reviews-stats.tsv.gz'
+    work_file = '../../data/book_metadata/work_isbn_title_genre.tsv.gz'
+    output_file = '../data/multilingual_books-impfic_reviews.tsv.gz'
+
+    start = time.perf_counter()
+    gr_reviews = read_dataset(get_dataset_dirs(parquet_base_dir)['reviews'],
+                              columns=['goodreads_book_id', 'goodreads_book_num', 'edition']).to_pandas()
+    work_genre, impfic_reviews = read_impfic_data(work_file, review_file)
+    impfic_indexes = build_impfic_indexes(work_genre)
+    book_work_map = link_goodreads_to_impfic(gr_reviews, impfic_indexes)
+    print(f"linked {book_work_map.goodreads_book_num.nunique()} Goodreads books "
+          f"to {book_work_map.work_id.nunique()} ImpFic works")
+    gr_impfic_reviews = get_linked_impfic_reviews(book_work_map, impfic_reviews)
+    print(f"number of reviews mapped to goodreads book numbers: {len(gr_impfic_reviews)}")
+    gr_impfic_reviews.to_csv(output_file, sep='\t', index=False, compression='gzip')
+    print(f"linking took {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
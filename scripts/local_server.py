@@ -0,0 +1,124 @@
+import argparse
+import functools
+import os
+import threading
+import time
+from collections import deque
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+
+
+def get_file_etag(file_path: str) -> str:
+    stat = os.stat(file_path)
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+class PageRequestHandler(SimpleHTTPRequestHandler):
+    """Serve saved HTML pages from a directory. Paths without extension, such as
+    /book/show/123.Title, are mapped to the corresponding .html file. Connections
+    are kept alive and pages are served with an ETag, so conditional requests with
+    If-None-Match get a 304 response."""
+
+    protocol_version = 'HTTP/1.1'
+    # buffer the response and disable Nagle: writing the headers and the body separately on a
+    # kept-alive connection otherwise stalls each response ~40 ms on the client's delayed ACK
+    wbufsize = -1
+    disable_nagle_algorithm = True
+    etag = None
+
+    def send_head(self):
+        file_path = self.translate_path(self.path)
+        self.etag = get_file_etag(file_path) if os.path.isfile(file_path) else None
+        if self.etag is not None and self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return None
+        return super().send_head()
+
+    def end_headers(self):
+        if self.etag is not None:
+            self.send_header('ETag', self.etag)
+        super().end_headers()
+
+    def translate_path(self, path: str) -> str:
+        file_path = super().translate_path(path)
+        if not file_path.endswith('.html') and not file_path.endswith('/'):
+            file_path += '.html'
+        return file_path
+
+    def log_message(self, format, *args):
+        pass
+
+
+class RateLimiter:
+    """Allow at most `max_rate` requests in any one-second window."""
+
+    def __init__(self, max_rate: float, retry_after: int = 1):
+        self.max_rate = max_rate
+        self.retry_after = retry_after
+        self.request_times = deque()
+        self.counts = {'served': 0, 'throttled': 0}
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            while len(self.request_times) > 0 and self.request_times[0] <= now - 1.0:
+                self.request_times.popleft()
+            if len(self.request_times) >= self.max_rate:
+                self.counts['throttled'] += 1
+                return False
+            self.request_times.append(now)
+            self.counts['served'] += 1
+            return True
+
+
+class ThrottlingPageRequestHandler(PageRequestHandler):
+    """Serve saved pages like PageRequestHandler, but answer with 429 Too Many Requests and
+    a Retry-After header when the server's rate limiter is exceeded, to simulate Goodreads
+    throttling a crawler."""
+
+    def send_head(self):
+        rate_limiter = self.server.rate_limiter
+        if not rate_limiter.allow():
+            self.etag = None
+            self.send_response(429)
+            self.send_header('Retry-After', str(rate_limiter.retry_after))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return None
+        return super().send_head()
+
+
+def start_local_server(page_dir: str, port: int = 0, handler_class=PageRequestHandler,
+                       max_rate: float = None, retry_after: int = 1) -> Tuple[ThreadingHTTPServer, str]:
+    """Start a local stand-in for the Goodreads server in a background thread,
+    serving the pages in `page_dir`. If max_rate is given, requests above that rate
+    per second are throttled. Returns the server and its base URL."""
+    if max_rate is not None and handler_class is PageRequestHandler:
+        handler_class = ThrottlingPageRequestHandler
+    handler = functools.partial(handler_class, directory=page_dir)
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.rate_limiter = RateLimiter(max_rate, retry_after=retry_after) if max_rate is not None else None
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address
+    return server, f"http://{host}:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve saved Goodreads pages as a local stand-in server.')
+    parser.add_argument('page_dir', help='directory with saved HTML pages')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max-rate', type=float, help='throttle requests above this rate per second with 429s')
+    args = parser.parse_args()
+    server, base_url = start_local_server(args.page_dir, port=args.port, max_rate=args.max_rate)
+    print(f"serving {args.page_dir} at {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import atexit
+import bisect
+import functools
+import json
+import math
+import threading
+import time
+from typing import Callable, Dict, List, Union
+
+
+# histogram bucket upper bounds, roughly 1-2-5 per decade from 1ms to 1000s (or 1B to 1GB)
+DEFAULT_BUCKETS = [m * 10 ** e for e in range(-3, 4) for m in (1, 2, 5)]
+SIZE_BUCKETS = [m * 10 ** e for e in range(0, 10) for m in (1, 2, 5)]
+
+
+class Counter:
+
+    def __init__(self, name: str):
+        self.name = name
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: Union[int, float] = 1) -> None:
+        with self.lock:
+            self.value += amount
+
+    def snapshot(self) -> Dict[str, any]:
+        return {'type': 'counter', 'value': self.value}
+
+
+class Histogram:
+    """A histogram with fixed bucket bounds, keeping the count, sum, min and max of the
+    observed values. Quantiles are estimated from the buckets."""
+
+    def __init__(self, name: str, buckets: List[float] = None):
+        self.name = name
+        self.buckets = sorted(buckets) if buckets is not None else DEFAULT_BUCKETS
+        # one extra bucket for values above the highest bound
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self.lock:
+            self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+            self.min = min(self.min, value)
+            self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> Union[float, None]:
+        """Return the upper bound of the bucket that contains the q-th quantile."""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bi, bucket_count in enumerate(self.bucket_counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(self.buckets[bi], self.max) if bi < len(self.buckets) else self.max
+        return self.max
+
+    def snapshot(self) -> Dict[str, any]:
+        if self.count == 0:
+            return {'type': 'histogram', 'count': 0}
+        return {
+            'type': 'histogram', 'count': self.count, 'sum': self.sum, 'mean': self.sum / self.count,
+            'min': self.min, 'max': self.max,
+            'p50': self.quantile(0.5), 'p90': self.quantile(0.9), 'p99': self.quantile(0.99),
+        }
+
+
+class Timer:
+    """Measure the duration of a block of code (as a context manager) or of every call of
+    a function (as a decorator) in a histogram of seconds."""
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+    def __call__(self, func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with Timer(self.histogram):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.snapshot_file = None
+        self.reporter = None
+        self.stop_event = threading.Event()
+
+    def _get_metric(self, name: str, metric_class, **kwargs):
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = metric_class(name, **kwargs)
+            elif not isinstance(self.metrics[name], metric_class):
+                raise TypeError(f"metric {name} is a {type(self.metrics[name]).__name__}, "
+                                f"not a {metric_class.__name__}")
+            return self.metrics[name]
+
+    def counter(self, name: str) -> Counter:
+        return self._get_metric(name, Counter)
+
+    def histogram(self, name: str, buckets: List[float] = None) -> Histogram:
+        return self._get_metric(name, Histogram, buckets=buckets)
+
+    def timer(self, name: str) -> Timer:
+        return Timer(self.histogram(name))
+
+    def snapshot(self) -> Dict[str, any]:
+        with self.lock:
+            metrics = dict(self.metrics)
+        return {
+            'time': time.time(),
+            'elapsed': time.time() - self.start_time,
+            'metrics': {name: metrics[name].snapshot() for name in sorted(metrics)},
+        }
+
+    def write_snapshot(self) -> None:
+        with open(self.snapshot_file, 'at') as fh:
+            fh.write(json.dumps(self.snapshot()) + '\n')
+
+    def _report_loop(self, interval: float) -> None:
+        while not self.stop_event.wait(interval):
+            self.write_snapshot()
+
+    def start_reporting(self, snapshot_file: str, interval: float = 60.0) -> None:
+        """Append a JSON-lines snapshot of all metrics to snapshot_file every `interval` seconds."""
+        self.snapshot_file = snapshot_file
+        self.reporter = threading.Thread(target=self._report_loop, args=(interval,), daemon=True)
+        self.reporter.start()
+
+    def stop_reporting(self) -> None:
+        if self.reporter is not None:
+            self.stop_event.set()
+            self.reporter.join()
+            self.reporter = None
+            self.write_snapshot()
+
+    def print_summary(self) -> None:
+        snapshot = self.snapshot()
+        if len(snapshot['metrics']) == 0:
+            return None
+        print(f"metrics after {snapshot['elapsed']:.1f}s:")
+        for name, metric in snapshot['metrics'].items():
+            if metric['type'] == 'counter':
+                print(f"\t{name}: {metric['value']}")
+            elif metric['count'] == 0:
+                print(f"\t{name}: no observations")
+            else:
+                print(f"\t{name}: count {metric['count']}, mean {metric['mean']:.3f}, p50 {metric['p50']:.3f}, "
+                      f"p90 {metric['p90']:.3f}, p99 {metric['p99']:.3f}, max {metric['max']:.3f}")
+
+
+REGISTRY = MetricsRegistry()
+
+
+def counter(name: str) -> Counter:
+    return REGISTRY.counter(name)
+
+
+def histogram(name: str, buckets: List[float] = None) -> Histogram:
+    return REGISTRY.histogram(name, buckets=buckets)
+
+
+def timer(name: str) -> Timer:
+    """Time a block (with timer(name): ...) or a function (@timer(name))."""
+    return REGISTRY.timer(name)
+
+
+def _report_at_exit() -> None:
+    REGISTRY.stop_reporting()
+    REGISTRY.print_summary()
+
+
+def configure(snapshot_file: str = None, interval: float = 60.0, summary: bool = True) -> None:
+    """Start writing periodic JSON-lines snapshots to snapshot_file (if given) and print
+    a summary of all metrics when the process exits (if summary is True)."""
+    if snapshot_file is not None:
+        REGISTRY.start_reporting(snapshot_file, interval=interval)
+    if summary or snapshot_file is not None:
+        atexit.register(_report_at_exit if summary else REGISTRY.stop_reporting)
@@ -0,0 +1,134 @@
+import os
+import uuid
+from typing import Dict, Iterable, List
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+
+# reviews as returned by parse.parse_review (div.review pages), with the review_day of parse.ReviewRecord
+REVIEW_SCHEMA = pa.schema([
+    ('username', pa.string()),
+    ('userurl', pa.string()),
+    ('goodreads_book_id', pa.string()),
+    ('goodreads_book_num', pa.string()),
+    ('review_date', pa.string()),
+    ('rating', pa.int8()),
+    ('edition', pa.string()),
+    ('review_text', pa.string()),
+    ('review_lang', pa.string()),
+    ('review_day', pa.date32()),
+    ('crawl_date', pa.string()),
+])
+
+# reviews as returned by parse.extract_reviews (article.ReviewCard pages), with the review_day of
+# parse.ReviewCardRecord
+REVIEW_CARD_SCHEMA = pa.schema([
+    ('review_text', pa.string()),
+    ('user_url', pa.string()),
+    ('user_name', pa.string()),
+    ('review_url', pa.string()),
+    ('review_date', pa.string()),
+    ('rating', pa.int8()),
+    ('book_id', pa.string()),
+    ('source_url', pa.string()),
+    ('review_lang', pa.string()),
+    ('review_day', pa.date32()),
+    ('crawl_date', pa.string()),
+])
+
+# book metadata as returned by parse.get_book_metadata, with the num_users of parse.GenreVote
+METADATA_SCHEMA = pa.schema([
+    ('goodreads_book_id', pa.string()),
+    ('goodreads_book_num', pa.string()),
+    ('source_url', pa.string()),
+    ('book_title', pa.string()),
+    ('book_description', pa.string()),
+    ('book_url', pa.string()),
+    ('book_image', pa.string()),
+    ('book_type', pa.string()),
+    ('book_author', pa.string()),
+    ('book_isbn', pa.string()),
+    ('book_page_count', pa.string()),
+    ('author_name', pa.list_(pa.string())),
+    ('avg_rating', pa.float64()),
+    ('num_ratings', pa.int64()),
+    ('num_reviews', pa.int64()),
+    ('genres', pa.list_(pa.struct([('genre', pa.string()), ('users', pa.string()), ('num_users', pa.int64())]))),
+    ('review_file_language', pa.string()),
+    ('crawl_date', pa.string()),
+])
+
+REVIEW_PARTITION_COLS = ['review_lang', 'crawl_date']
+METADATA_PARTITION_COLS = ['review_file_language', 'crawl_date']
+
+
+class ParquetDatasetWriter:
+    """Buffer records and write them in batches to a hive-partitioned Parquet dataset
+    with an explicit schema. Every flush adds new files to the dataset, so several
+    runs (or several writers) can add to the same dataset."""
+
+    def __init__(self, dataset_dir: str, schema: pa.Schema, partition_cols: List[str],
+                 batch_size: int = 50000):
+        self.dataset_dir = dataset_dir
+        self.schema = schema
+        self.partition_cols = partition_cols
+        self.batch_size = batch_size
+        self.buffer: List[Dict[str, any]] = []
+        self.writer_id = uuid.uuid4().hex
+        self.num_flushes = 0
+        self.num_records = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, record: Dict[str, any]) -> None:
+        self.buffer.append(record)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def write_many(self, records: Iterable[Dict[str, any]]) -> None:
+        for record in records:
+            self.write(record)
+
+    def flush(self) -> None:
+        if len(self.buffer) == 0:
+            return None
+        table = pa.Table.from_pylist(self.buffer, schema=self.schema)
+        pq.write_to_dataset(table, self.dataset_dir, partition_cols=self.partition_cols,
+                            basename_template=f'part-{self.writer_id}-{self.num_flushes}-{{i}}.parquet',
+                            existing_data_behavior='overwrite_or_ignore')
+        self.num_records += len(self.buffer)
+        self.num_flushes += 1
+        self.buffer = []
+
+    def close(self) -> None:
+        self.flush()
+
+
+def get_partitioning(partition_cols: List[str]) -> ds.Partitioning:
+    """Return the hive partitioning of a dataset with string partition columns. With an explicit
+    schema, a partition without a value (e.g. crawl_date=__HIVE_DEFAULT_PARTITION__ for pages
+    from a directory without a crawl date) is read as null, instead of failing type inference."""
+    return ds.partitioning(pa.schema([(column, pa.string()) for column in partition_cols]), flavor='hive')
+
+
+def read_dataset(dataset_dir: str, columns: List[str] = None, langs: List[str] = None,
+                 lang_column: str = 'review_lang') -> pa.Table:
+    """Read (a subset of the columns of) a partitioned dataset, only reading the partitions
+    of the given languages."""
+    filters = [(lang_column, 'in', langs)] if langs is not None else None
+    return pq.read_table(dataset_dir, columns=columns, filters=filters,
+                         partitioning=get_partitioning([lang_column, 'crawl_date']))
+
+
+def get_dataset_dirs(parquet_base_dir: str) -> Dict[str, str]:
+    return {
+        'reviews': os.path.join(parquet_base_dir, 'reviews'),
+        'review_cards': os.path.join(parquet_base_dir, 'review_cards'),
+        'metadata': os.path.join(parquet_base_dir, 'metadata'),
+    }
@@ -1,12 +1,21 @@
+import datetime
 import glob
 import json
 import os
 import re
+import sys
 from collections import defaultdict
-from typing import Dict, List, Union
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
 
 import pandas as pd
 from bs4 import BeautifulSoup
+from bs4.element import Tag
+
+
+# Increase this when a change to the extraction functions changes their output,
+# so that incremental extraction re-processes all pages.
+EXTRACTOR_VERSION = '1'
 
 
 def get_review_text(review: BeautifulSoup) -> Union[List[str], None]:
@@ -57,6 +66,18 @@ def read_html_file(html_file: str) -> BeautifulSoup:
         return BeautifulSoup(fh, "lxml")
 
 
+def read_html_string(html: str) -> BeautifulSoup:
+    """Parse a HTML string and return the content as a BeautifulSoup instance."""
+    return BeautifulSoup(html, "lxml")
+
+
+def get_crawl_date(html_path: str) -> Union[str, None]:
+    """Extract the crawl date from a crawl directory name such as HTML-2025-10-23."""
+    if m := re.search(r"HTML-(\d{4}-\d{2}-\d{2})", html_path):
+        return m.group(1)
+    return None
+
+
 def read_book_review_files(html_dir: str) -> Dict[str, List[str]]:
     html_files = glob.glob(os.path.join(html_dir, '**/*.html'))
 
@@ -79,8 +100,9 @@ def get_book_review_divs(book_file: str) -> List[BeautifulSoup]:
 
 
 def get_review_language(book_review_file: str) -> str:
-    """Extract the language code from a book review filename."""
-    return book_review_file.split('HTML/')[-1][:2]
+    """Extract the language code from a book review filename, which is the name of
+    the language directory the file is in (<crawl_dir>/<lang>/<book_id>.html)."""
+    return os.path.basename(os.path.dirname(book_review_file))
 
 
 def get_book_reviews(book_id: str, book_review_file: str, page: BeautifulSoup) -> List[Dict[str, any]]:
@@ -253,6 +275,25 @@ def get_book_list_books(soup, book_list):
     return books
 
 
+def get_book_list_name(book_list_file: str) -> Union[str, None]:
+    """Return the name of a book list from the filename of a saved list page,
+    e.g. '<name> (100 books) _ Goodreads.html' or '<name> (100 books) _ Goodreads--page2.html'."""
+    _, filename = os.path.split(book_list_file)
+    if m := re.match(r"^(.*) \((\d+) books\)", filename):
+        return m.group(1)
+    return None
+
+
+def merge_book_list_books(book_map: Dict[str, Dict[str, any]], books: List[Dict[str, any]]) -> None:
+    """Add the books of a book list page to a map of book_id to book, adding the list to the
+    book_lists of books that are already in the map."""
+    for book in books:
+        if book['book_id'] in book_map:
+            book_map[book['book_id']]['book_lists'].extend(book['book_lists'])
+        else:
+            book_map[book['book_id']] = book
+
+
 def extract_review_rating(review_content):
     if review_content is None:
         return None
@@ -281,11 +322,17 @@ def extract_review(review_card):
     }
 
 
-def extract_reviews(book_id, book_review_file, page):
+def get_review_card_source(book_review_file: str) -> Tuple[str, str]:
+    """Return the language and source URL of a book review page based on its filename."""
     lang_dir, filename = os.path.split(book_review_file)
     lang_base_dir, lang = os.path.split(lang_dir)
     base_url = "https://goodreads.com"
     source_url = os.path.join(base_url, f"{lang}/book/show/{filename}")
+    return lang, source_url
+
+
+def extract_reviews(book_id, book_review_file, page):
+    lang, source_url = get_review_card_source(book_review_file)
 
     reviews = []
     for review_card in page.find_all('article', class_="ReviewCard"):
@@ -299,9 +346,395 @@ def extract_reviews(book_id, book_review_file, page):
     return reviews
 
 
+REVIEW_BACKENDS = ['bs4', 'lxml']
+
+
+def check_review_backend(backend: str) -> None:
+    if backend not in REVIEW_BACKENDS:
+        raise ValueError(f"unknown review backend '{backend}', must be one of {REVIEW_BACKENDS}")
+
+
+def read_book_reviews(book_id: str, book_review_file: str, backend: str = 'bs4') -> List[Dict[str, any]]:
+    """Read a Goodreads book review page and extract the old style reviews (div.review),
+    either via a BeautifulSoup tree ('bs4') or by streaming the review elements with lxml ('lxml')."""
+    check_review_backend(backend)
+    if backend == 'lxml':
+        import parse_lxml
+        return parse_lxml.get_book_reviews(book_id, book_review_file)
+    page = read_html_file(book_review_file)
+    return get_book_reviews(book_id, book_review_file, page)
+
+
+def read_review_cards(book_id: str, book_review_file: str, backend: str = 'bs4') -> List[Dict[str, any]]:
+    """Read a Goodreads book review page and extract the reviews cards (article.ReviewCard),
+    either via a BeautifulSoup tree ('bs4') or by streaming the review elements with lxml ('lxml')."""
+    check_review_backend(backend)
+    if backend == 'lxml':
+        import parse_lxml
+        return parse_lxml.extract_reviews(book_id, book_review_file)
+    page = read_html_file(book_review_file)
+    return extract_reviews(book_id, book_review_file, page)
+
+
 def extract_enjoyed_books(page):
     carousel = page.find('section', class_="Carousel")
     book_cards = [book_card for book_card in carousel.find_all('div', class_="BookCard")]
     book_links = [book_card.find('a', class_="BookCard__clickCardTarget") for book_card in book_cards]
     book_urls = [book_link.attrs['href'] for book_link in book_links]
     return book_urls
+
+
+# Map the property of a <meta> element to the book metadata field it fills.
+META_PROPERTY_FIELDS = {
+    'og:title': 'book_title',
+    'og:description': 'book_description',
+    'og:url': 'book_url',
+    'og:image': 'book_image',
+    'og:type': 'book_type',
+    'books:author': 'book_author',
+    'books:isbn': 'book_isbn',
+    'books:page_count': 'book_page_count',
+}
+
+
+def _is_inside(ele: Tag, container: Union[Tag, None]) -> bool:
+    """Check whether an element is a descendant of a container element."""
+    if container is None:
+        return False
+    return any(parent is container for parent in ele.parents)
+
+
+def _has_class(ele: Tag, class_name: str) -> bool:
+    return class_name in ele.get('class', [])
+
+
+def extract_page(book_id: str, book_review_file: str, page: BeautifulSoup) -> Dict[str, any]:
+    """Extract the book metadata, canonical URL, language links and reviews from a
+    Goodreads book review page in a single traversal of the tree.
+
+    The output is the same as that of get_book_metadata, get_canonical_url,
+    get_language_links, get_book_reviews and extract_reviews."""
+    review_lang = get_review_language(book_review_file)
+    book_metadata = {
+        'goodreads_book_id': book_id,
+        'goodreads_book_num': re.match(r"(\d+)", book_id).group(1),
+        'source_url': None,
+        'review_file_language': review_lang,
+    }
+    for meta_field in META_PROPERTY_FIELDS.values():
+        book_metadata[meta_field] = None
+    for extra_field in ['author_name', 'avg_rating', 'num_ratings', 'num_reviews']:
+        book_metadata[extra_field] = None
+    book_metadata['genres'] = []
+
+    card_lang, source_url = get_review_card_source(book_review_file)
+    canonical_url = None
+    head = None
+    meta_col = None
+    book_meta_div = None
+    language_links = []
+    reviews = []
+    review_cards = []
+    genre = ''
+    for ele in page.descendants:
+        if not isinstance(ele, Tag):
+            continue
+        name = ele.name
+        if name == 'meta':
+            meta_field = META_PROPERTY_FIELDS.get(ele.get('property'))
+            if meta_field is not None:
+                book_metadata[meta_field] = ele.attrs['content']
+            itemprop = ele.get('itemprop')
+            if itemprop in ('ratingCount', 'reviewCount') and _is_inside(ele, book_meta_div):
+                if itemprop == 'ratingCount':
+                    book_metadata['num_ratings'] = int(ele.attrs['content'])
+                else:
+                    book_metadata['num_reviews'] = int(ele.attrs['content'])
+        elif name == 'link':
+            rel = ele.get('rel', [])
+            if canonical_url is None and 'canonical' in rel:
+                canonical_url = ele.attrs['href']
+            if 'alternate' in rel and _is_inside(ele, head):
+                language_links.append(ele)
+        elif name == 'head':
+            if head is None:
+                head = ele
+        elif name == 'div':
+            div_id = ele.get('id')
+            if div_id == 'metacol' and meta_col is None:
+                meta_col = ele
+                book_metadata['author_name'] = []
+            elif div_id == 'bookMeta' and book_meta_div is None:
+                book_meta_div = ele
+            if _has_class(ele, 'review'):
+                reviews.append(parse_review(book_id, review_lang, ele))
+            if _has_class(ele, 'authorName__container') and _is_inside(ele, meta_col):
+                book_metadata['author_name'].append(ele.text.strip())
+        elif name == 'span':
+            if ele.get('itemprop') == 'ratingValue' and _is_inside(ele, book_meta_div):
+                book_metadata['avg_rating'] = float(ele.text)
+        elif name == 'article':
+            if _has_class(ele, 'ReviewCard'):
+                review = extract_review(ele)
+                review['book_id'] = book_id
+                review['source_url'] = source_url
+                review['review_lang'] = card_lang
+                review_cards.append(review)
+        if _has_class(ele, 'bookPageGenreLink'):
+            if name == 'a':
+                if len(genre) > 0:
+                    genre += ' -- ' + ele.text.strip()
+                else:
+                    genre = ele.text.strip()
+            if name == 'div':
+                book_metadata['genres'].append({'genre': genre, 'users': ele.text.strip()})
+                genre = ''
+    book_metadata['source_url'] = canonical_url
+    return {
+        'metadata': book_metadata,
+        'canonical_url': canonical_url,
+        'language_links': language_links,
+        'reviews': reviews,
+        'review_cards': review_cards,
+    }
+
+
+def extract_page_file(book_id: str, book_review_file: str) -> Dict[str, any]:
+    """Read a Goodreads book review page and extract all its data in a single pass."""
+    page = read_html_file(book_review_file)
+    page_data = extract_page(book_id, book_review_file, page)
+    return page_data
+
+
+def iter_page_data(book_files: Dict[str, List[str]]) -> Iterator[Tuple[str, str, Dict[str, any]]]:
+    """Iterate over the book review pages and yield the book ID, filename and the data
+    extracted by extract_page for each page. Each soup is decomposed as soon as its data
+    is extracted, so only a single page is held in memory."""
+    for book_id in book_files:
+        for book_review_file in book_files[book_id]:
+            page = read_html_file(book_review_file)
+            page_data = extract_page(book_id, book_review_file, page)
+            # the language links are elements of the soup, keep only their attributes
+            page_data['language_links'] = [dict(link.attrs) for link in page_data['language_links']]
+            page.decompose()
+            yield book_id, book_review_file, page_data
+
+
+def iter_metadata_reviews(book_files: Dict[str, List[str]], review_cards: bool = False,
+                          records: bool = False) -> Iterator[Tuple[Dict[str, any], List[Dict[str, any]]]]:
+    """Yield the book metadata and the reviews of each book review page. The reviews are
+    those of get_book_reviews (div.review), or of extract_reviews (article.ReviewCard)
+    if review_cards is True. If records is True, the metadata and reviews are yielded as
+    BookMetadataRecord and ReviewRecord/ReviewCardRecord instances instead of dicts."""
+    review_key = 'review_cards' if review_cards else 'reviews'
+    review_class = ReviewCardRecord if review_cards else ReviewRecord
+    for book_id, book_review_file, page_data in iter_page_data(book_files):
+        if records:
+            yield BookMetadataRecord.from_dict(page_data['metadata']), to_records(page_data[review_key], review_class)
+        else:
+            yield page_data['metadata'], page_data[review_key]
+
+
+def iter_batches(metadata_reviews: Iterable[Tuple[Dict[str, any], List[Dict[str, any]]]],
+                 batch_size: int = 10000) -> Iterator[Tuple[List[Dict[str, any]], List[Dict[str, any]]]]:
+    """Group the (metadata, reviews) pairs of pages into batches of book metadata and reviews,
+    so peak memory is set by the batch size. A batch is closed as soon as it has `batch_size`
+    reviews or more; the reviews of a page are not split over batches, so a batch can exceed
+    `batch_size` by the reviews of its last page."""
+    metadata_batch, review_batch = [], []
+    for book_metadata, reviews in metadata_reviews:
+        metadata_batch.append(book_metadata)
+        review_batch.extend(reviews)
+        if len(review_batch) >= batch_size:
+            yield metadata_batch, review_batch
+            metadata_batch, review_batch = [], []
+    if len(metadata_batch) > 0:
+        yield metadata_batch, review_batch
+
+
+def get_metadata_reviews(book_files: Dict[str, List[str]], review_cards: bool = False,
+                         records: bool = False) -> Tuple[List[Dict[str, any]], List[Dict[str, any]]]:
+    """Return the book metadata and reviews of all book review pages as two lists.
+    For large collections, use iter_metadata_reviews or iter_batches instead, or use
+    records=True to get compact record instances instead of dicts."""
+    all_book_metadata = []
+    all_reviews = []
+    for book_metadata, reviews in iter_metadata_reviews(book_files, review_cards=review_cards, records=records):
+        all_book_metadata.append(book_metadata)
+        all_reviews.extend(reviews)
+    return all_book_metadata, all_reviews
+
+
+REVIEW_DATE_FORMATS = ['%b %d, %Y', '%B %d, %Y']
+
+
+def parse_review_date(date_text: Union[str, None]) -> Union[datetime.date, None]:
+    """Parse the (English) date in the text of a review date link or review card row, e.g.
+    'Mar 03, 2019' or 'March 3, 2019'. Returns None for dates in other languages."""
+    if date_text is None:
+        return None
+    match = re.search(r"([A-Z][a-z]+\.? \d{1,2}, \d{4})", date_text)
+    if match is None:
+        return None
+    date_string = match.group(1).replace('.', '')
+    for date_format in REVIEW_DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(date_string, date_format).date()
+        except ValueError:
+            continue
+    return None
+
+
+def parse_genre_users(users: Union[str, None]) -> Union[int, None]:
+    """Parse the number of users that voted for a genre, e.g. '1,234 users'."""
+    if users is None:
+        return None
+    digits = re.sub(r"[^\d]", '', users)
+    return int(digits) if len(digits) > 0 else None
+
+
+def _intern(string: Union[str, None]) -> Union[str, None]:
+    return sys.intern(string) if string is not None else None
+
+
+@dataclass(slots=True)
+class GenreVote:
+    genre: str
+    users: str
+    num_users: Union[int, None] = None
+
+    @classmethod
+    def from_dict(cls, genre_vote: Dict[str, str]) -> 'GenreVote':
+        return cls(_intern(genre_vote['genre']), genre_vote['users'], parse_genre_users(genre_vote['users']))
+
+    def to_dict(self) -> Dict[str, str]:
+        return {'genre': self.genre, 'users': self.users}
+
+
+@dataclass(slots=True)
+class ReviewRecord:
+    """A review as returned by parse_review (div.review pages)."""
+    username: str
+    userurl: str
+    goodreads_book_id: str
+    goodreads_book_num: str
+    review_date: str
+    rating: int
+    edition: Union[str, None]
+    review_lang: str
+    review_text: Union[str, None]
+    review_day: Union[datetime.date, None] = None
+
+    @classmethod
+    def from_dict(cls, review: Dict[str, any]) -> 'ReviewRecord':
+        return cls(review['username'], review['userurl'], review['goodreads_book_id'],
+                   review['goodreads_book_num'], review['review_date'], review['rating'], review['edition'],
+                   _intern(review['review_lang']), review['review_text'], parse_review_date(review['review_date']))
+
+    def to_dict(self) -> Dict[str, any]:
+        return {key: getattr(self, key) for key in REVIEW_DICT_FIELDS}
+
+
+@dataclass(slots=True)
+class ReviewCardRecord:
+    """A review as returned by extract_reviews (article.ReviewCard pages)."""
+    review_text: str
+    user_url: str
+    user_name: str
+    review_url: Union[str, None]
+    review_date: str
+    rating: Union[int, None]
+    book_id: str
+    source_url: str
+    review_lang: str
+    review_day: Union[datetime.date, None] = None
+
+    @classmethod
+    def from_dict(cls, review: Dict[str, any]) -> 'ReviewCardRecord':
+        return cls(review['review_text'], review['user_url'], review['user_name'], review['review_url'],
+                   review['review_date'], review['rating'], review['book_id'], review['source_url'],
+                   _intern(review['review_lang']), parse_review_date(review['review_date']))
+
+    def to_dict(self) -> Dict[str, any]:
+        return {key: getattr(self, key) for key in REVIEW_CARD_DICT_FIELDS}
+
+
+@dataclass(slots=True)
+class BookMetadataRecord:
+    """Book metadata as returned by get_book_metadata and extract_page."""
+    goodreads_book_id: str
+    goodreads_book_num: str
+    source_url: Union[str, None]
+    review_file_language: str
+    book_title: Union[str, None] = None
+    book_description: Union[str, None] = None
+    book_url: Union[str, None] = None
+    book_image: Union[str, None] = None
+    book_type: Union[str, None] = None
+    book_author: Union[str, None] = None
+    book_isbn: Union[str, None] = None
+    book_page_count: Union[str, None] = None
+    author_name: Union[List[str], None] = None
+    avg_rating: Union[float, None] = None
+    num_ratings: Union[int, None] = None
+    num_reviews: Union[int, None] = None
+    genres: List[GenreVote] = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, book_metadata: Dict[str, any]) -> 'BookMetadataRecord':
+        values = {key: book_metadata[key] for key in BOOK_METADATA_DICT_FIELDS if key != 'genres'}
+        values['review_file_language'] = _intern(values['review_file_language'])
+        values['book_type'] = _intern(values['book_type'])
+        genres = [GenreVote.from_dict(genre_vote) for genre_vote in book_metadata['genres']]
+        return cls(genres=genres, **values)
+
+    def to_dict(self) -> Dict[str, any]:
+        book_metadata = {key: getattr(self, key) for key in BOOK_METADATA_DICT_FIELDS}
+        book_metadata['genres'] = [genre_vote.to_dict() for genre_vote in self.genres]
+        return book_metadata
+
+
+# the keys (and key order) of the dicts returned by the extraction functions
+REVIEW_DICT_FIELDS = ['username', 'userurl', 'goodreads_book_id', 'goodreads_book_num', 'review_date',
+                      'rating', 'edition', 'review_lang', 'review_text']
+REVIEW_CARD_DICT_FIELDS = ['review_text', 'user_url', 'user_name', 'review_url', 'review_date', 'rating',
+                           'book_id', 'source_url', 'review_lang']
+BOOK_METADATA_DICT_FIELDS = ['goodreads_book_id', 'goodreads_book_num', 'source_url', 'review_file_language',
+                             'book_title', 'book_description', 'book_url', 'book_image', 'book_type',
+                             'book_author', 'book_isbn', 'book_page_count', 'author_name', 'avg_rating',
+                             'num_ratings', 'num_reviews', 'genres']
+
+Record = Union[ReviewRecord, ReviewCardRecord, BookMetadataRecord]
+
+
+def to_records(dicts: Iterable[Dict[str, any]], record_class) -> List[Record]:
+    """Convert the review or book metadata dicts of the extraction functions to records."""
+    return [record_class.from_dict(record_dict) for record_dict in dicts]
+
+
+def records_to_record_batch(records: List[Record], extra_columns: Dict[str, any] = None, schema=None):
+    """Convert a list of records of the same type to an Arrow record batch with the schema of
+    its parquet_sink dataset, building the columns directly from the record attributes instead
+    of going through dicts. The extra_columns (e.g. the crawl_date) are added as constant columns.
+    The schema must be given for an empty list of records."""
+    import pyarrow as pa
+    from parquet_sink import REVIEW_SCHEMA, REVIEW_CARD_SCHEMA, METADATA_SCHEMA
+
+    record_schemas = {ReviewRecord: REVIEW_SCHEMA, ReviewCardRecord: REVIEW_CARD_SCHEMA,
+                      BookMetadataRecord: METADATA_SCHEMA}
+    if schema is None:
+        if len(records) == 0:
+            raise ValueError('the schema of an empty list of records must be given')
+        schema = record_schemas[type(records[0])]
+    extra_columns = extra_columns if extra_columns is not None else {}
+    columns = []
+    for field_name in schema.names:
+        if field_name in extra_columns:
+            values = [extra_columns[field_name]] * len(records)
+        elif field_name == 'genres':
+            values = [[{'genre': vote.genre, 'users': vote.users, 'num_users': vote.num_users}
+                       for vote in record.genres] for record in records]
+        else:
+            values = [getattr(record, field_name, None) for record in records]
+        columns.append(pa.array(values, type=schema.field(field_name).type))
+    return pa.RecordBatch.from_arrays(columns, schema=schema)
@@ -0,0 +1,183 @@
+import re
+from typing import Dict, Iterator, List, Union
+
+from lxml import etree
+
+from parse import get_review_language, get_review_card_source
+
+
+# Strings inside these elements are not part of the text returned by BeautifulSoup's .text
+SKIPPED_TEXT_TAGS = {'script', 'style', 'template', 'rt', 'rp'}
+
+
+def has_class(element: etree._Element, class_name: str) -> bool:
+    return class_name in element.get('class', '').split()
+
+
+def find_first(element: etree._Element, tag: Union[str, None], class_name: Union[str, None] = None):
+    """Return the first descendant with the given tag and class, like BeautifulSoup's find."""
+    for descendant in element.iterdescendants(tag):
+        if not isinstance(descendant.tag, str):
+            continue
+        if class_name is None or has_class(descendant, class_name):
+            return descendant
+    return None
+
+
+def find_all(element: etree._Element, tag: Union[str, None],
+             class_name: Union[str, None] = None) -> List[etree._Element]:
+    """Return all descendants with the given tag and class, like BeautifulSoup's find_all."""
+    return [descendant for descendant in element.iterdescendants(tag)
+            if isinstance(descendant.tag, str) and (class_name is None or has_class(descendant, class_name))]
+
+
+def iter_strings(element: etree._Element) -> Iterator[str]:
+    """Iterate over the text strings of an element in document order, skipping comments."""
+    if element.tag in SKIPPED_TEXT_TAGS:
+        return
+    if element.text:
+        yield element.text
+    for child in element:
+        if isinstance(child.tag, str):
+            yield from iter_strings(child)
+        if child.tail:
+            yield child.tail
+
+
+def get_text(element: etree._Element) -> str:
+    return ''.join(iter_strings(element))
+
+
+def get_stripped_strings(element: etree._Element) -> List[str]:
+    stripped_strings = [string.strip() for string in iter_strings(element)]
+    return [string for string in stripped_strings if len(string) > 0]
+
+
+def get_review_text(review: etree._Element) -> Union[List[str], None]:
+    """Extract paragraphs of review text from an lxml review element."""
+    review_text_div = find_first(review, 'div', 'reviewText')
+    if review_text_div is None:
+        return None
+    review_text_strings = []
+    for span in review_text_div.iterdescendants('span'):
+        if 'id' in span.attrib and span.attrib['id'].startswith('freeTextContainer'):
+            review_text_strings = get_stripped_strings(span)
+        if 'style' in span.attrib and span.attrib['style'] == 'display:none':
+            review_text_strings = get_stripped_strings(span)
+    return review_text_strings
+
+
+def parse_review(book_id: str, review_lang: str, review: etree._Element) -> Dict[str, any]:
+    """Extract review data from an lxml review element (div.review)."""
+    user_link = find_first(review, 'a', 'user')
+    date_link = find_first(review, 'a', 'reviewDate')
+    review_date = get_text(date_link)
+    user_url = user_link.attrib['href']
+    user_name = user_link.attrib['name']
+    edition_link = find_first(review, 'a', 'lightGreyText')
+    rating = len(find_all(review, 'span', 'staticStar'))
+    review_text = get_review_text(review)
+    edition = None
+    if edition_link is not None:
+        edition = edition_link.attrib['title']
+    return {
+        'username': user_name,
+        'userurl': user_url,
+        'goodreads_book_id': book_id,
+        'goodreads_book_num': re.match(r"(\d+)", book_id).group(1),
+        'review_date': review_date,
+        'rating': rating,
+        'edition': edition,
+        'review_lang': review_lang,
+        'review_text': '\n\n'.join(review_text) if isinstance(review_text, list) else None
+    }
+
+
+def extract_review_rating(review_content: etree._Element) -> Union[int, None]:
+    if review_content is None:
+        return None
+    rating_stars = find_first(review_content, 'span', 'RatingStars')
+    if rating_stars is None:
+        return None
+    rating_string = rating_stars.attrib['aria-label']
+    if m := re.match(r"Rating (\d) out of 5", rating_string):
+        return int(m.group(1))
+    else:
+        raise ValueError(f"unexpected rating_star string '{rating_string}'")
+
+
+def extract_review(review_card: etree._Element) -> Dict[str, any]:
+    """Extract review data from an lxml review card element (article.ReviewCard)."""
+    review_content = find_first(review_card, 'section', 'ReviewCard__content')
+    reviewer_profile = find_first(review_card, None, 'ReviewerProfile__name')
+    review_card_row = find_first(review_content, 'section', 'ReviewCard__row')
+    review_link = find_first(review_card_row, 'a')
+    return {
+        'review_text': get_text(find_first(review_card, 'section', 'ReviewText')),
+        'user_url': find_first(reviewer_profile, 'a').attrib['href'],
+        'user_name': get_text(reviewer_profile),
+        'review_url': review_link.attrib['href'] if 'href' in review_link.attrib else None,
+        'review_date': get_text(review_card_row),
+        'rating': extract_review_rating(review_content)
+    }
+
+
+def iter_matching_elements(html_file: str, tag: str,
+                           class_name: str) -> Iterator[etree._Element]:
+    """Stream the elements with the given tag and class from an HTML file in
+    document order. Elements that are done with are cleared, so only the current
+    review subtree is kept in memory. An element yielded by this function is
+    only valid until the next one is requested."""
+    def is_match(ele: etree._Element) -> bool:
+        return ele.tag == tag and has_class(ele, class_name)
+
+    open_matches = 0
+    # read the file as UTF-8, like read_html_file does, rather than relying on a meta charset
+    with open(html_file, 'rb') as fh:
+        for event, element in etree.iterparse(fh, events=('start', 'end'), tag=('div', 'article', tag),
+                                              html=True, encoding='utf-8'):
+            if event == 'start':
+                if is_match(element):
+                    open_matches += 1
+                continue
+            if is_match(element):
+                open_matches -= 1
+                if open_matches > 0:
+                    # nested match, handled when the outermost match is done
+                    continue
+                yield element
+                for nested in element.iterdescendants(tag):
+                    if is_match(nested):
+                        yield nested
+            elif open_matches > 0:
+                continue
+            element.clear(keep_tail=True)
+            parent = element.getparent()
+            if parent is not None:
+                while element.getprevious() is not None:
+                    del parent[0]
+
+
+def get_book_reviews(book_id: str, book_review_file: str) -> List[Dict[str, any]]:
+    """Extract all old style book reviews (div.review) from a Goodreads book review page."""
+    review_lang = get_review_language(book_review_file)
+    try:
+        return [parse_review(book_id, review_lang, review_div)
+                for review_div in iter_matching_elements(book_review_file, 'div', 'review')]
+    except Exception as err:
+        print(err)
+        print('Error parsing HTML of file', book_review_file)
+        raise
+
+
+def extract_reviews(book_id: str, book_review_file: str) -> List[Dict[str, any]]:
+    """Extract all review cards (article.ReviewCard) from a Goodreads book review page."""
+    lang, source_url = get_review_card_source(book_review_file)
+    reviews = []
+    for review_card in iter_matching_elements(book_review_file, 'article', 'ReviewCard'):
+        review = extract_review(review_card)
+        review['book_id'] = book_id
+        review['source_url'] = source_url
+        review['review_lang'] = lang
+        reviews.append(review)
+    return reviews
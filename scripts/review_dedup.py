@@ -0,0 +1,217 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
+from urllib.parse import urlsplit
+
+
+SIMHASH_BITS = 64
+# the simhash is split into bands, two hashes within MAX_HAMMING_DISTANCE of each other
+# share at least one band exactly if there are more bands than the maximum distance
+NUM_BANDS = 8
+BAND_BITS = SIMHASH_BITS // NUM_BANDS
+MAX_HAMMING_DISTANCE = 6
+# shorter texts ('Great book!') are too similar across unrelated reviews for near-duplicate matching
+MIN_SIMHASH_WORDS = 20
+
+DEDUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reviews (
+    id INTEGER PRIMARY KEY,
+    review_key TEXT UNIQUE NOT NULL,
+    book_num TEXT,
+    review_lang TEXT,
+    crawl_date TEXT,
+    simhash INTEGER
+);
+CREATE TABLE IF NOT EXISTS simhash_bands (
+    book_num TEXT NOT NULL,
+    band INTEGER NOT NULL,
+    band_value INTEGER NOT NULL,
+    review_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS simhash_bands_lookup ON simhash_bands (book_num, band, band_value);
+"""
+
+
+def get_book_num(review: Dict[str, any]) -> Union[str, None]:
+    """Return the numeric Goodreads book id of a review (from extract_reviews or parse_review)."""
+    book_id = review.get('book_id', review.get('goodreads_book_id'))
+    if book_id is None:
+        return None
+    match = re.match(r"(\d+)", str(book_id))
+    return match.group(1) if match else str(book_id)
+
+
+def normalize_url(url: str) -> str:
+    """Normalize a Goodreads URL so that the same review or user has the same URL on every
+    language version of the site (no scheme, host, language prefix, query or fragment)."""
+    path = urlsplit(url).path
+    path = re.sub(r"^/[a-z]{2}(?:-[A-Za-z]{2,4})?(?=/)", '', path)
+    return path.rstrip('/')
+
+
+def get_review_key(review: Dict[str, any]) -> Union[str, None]:
+    """Return the exact duplicate key of a review: the review URL if it has one,
+    otherwise the user URL combined with the book."""
+    if review.get('review_url'):
+        return normalize_url(review['review_url'])
+    user_url = review.get('user_url', review.get('userurl'))
+    if user_url:
+        return f"{normalize_url(user_url)}|{get_book_num(review)}"
+    return None
+
+
+def compute_simhash(text: str, min_words: int = MIN_SIMHASH_WORDS) -> Union[int, None]:
+    """Compute a 64-bit SimHash over the word bigrams of a text, or None if the text is too short."""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < min_words:
+        return None
+    weights = [0] * SIMHASH_BITS
+    features = Counter(' '.join(words[wi:wi + 2]) for wi in range(len(words) - 1))
+    for feature, count in features.items():
+        feature_hash = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'big')
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += count if feature_hash >> bit & 1 else -count
+    return sum(1 << bit for bit in range(SIMHASH_BITS) if weights[bit] > 0)
+
+
+def get_bands(simhash: int) -> List[int]:
+    mask = (1 << BAND_BITS) - 1
+    return [simhash >> (band * BAND_BITS) & mask for band in range(NUM_BANDS)]
+
+
+def hamming_distance(hash1: int, hash2: int) -> int:
+    return bin(hash1 ^ hash2).count('1')
+
+
+def _to_signed(value: int) -> int:
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _to_unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+class ReviewDedupIndex:
+    """A persistent SQLite index of the reviews seen so far, to deduplicate reviews across the
+    language versions of book pages and across crawls. A review is a duplicate if its key
+    (review URL, or user URL + book) is already in the index, or, only for reviews without such
+    a key, if a review of the same book has a text SimHash within MAX_HAMMING_DISTANCE bits.
+    Reviews with a key are distinct reviews even if their texts are similar, e.g. two users
+    pasting the publisher's blurb.
+
+    Lookups only touch the index rows of the same key or book, so adding a new crawl costs
+    time proportional to the number of new reviews, not to the size of the corpus."""
+
+    def __init__(self, db_file: str, max_distance: int = MAX_HAMMING_DISTANCE):
+        if max_distance >= NUM_BANDS:
+            raise ValueError(f"max_distance must be smaller than the number of bands ({NUM_BANDS})")
+        self.db_file = db_file
+        self.max_distance = max_distance
+        self.conn = sqlite3.connect(db_file)
+        self.conn.executescript(DEDUP_SCHEMA)
+        self.counts = Counter()
+
+    def close(self) -> None:
+        self.conn.commit()
+        self.conn.close()
+
+    def commit(self) -> None:
+        self.conn.commit()
+
+    def find_near_duplicate(self, book_num: str, simhash: int) -> Union[str, None]:
+        """Return the key of an indexed review of the same book with a similar text, if any."""
+        checked = set()
+        for band, band_value in enumerate(get_bands(simhash)):
+            rows = self.conn.execute(
+                'SELECT r.id, r.review_key, r.simhash FROM simhash_bands b JOIN reviews r ON r.id = b.review_id '
+                'WHERE b.book_num = ? AND b.band = ? AND b.band_value = ?', (book_num, band, band_value))
+            for review_id, review_key, other_hash in rows:
+                if review_id in checked:
+                    continue
+                checked.add(review_id)
+                if hamming_distance(simhash, _to_unsigned(other_hash)) <= self.max_distance:
+                    return review_key
+        return None
+
+    def check_and_add(self, review: Dict[str, any], crawl_date: str = None) -> Tuple[bool, Union[str, None]]:
+        """Check whether a review is a duplicate of an indexed review and add it to the index
+        if it is not. Returns whether it is a duplicate and the key of the review it duplicates."""
+        review_key = get_review_key(review)
+        book_num = get_book_num(review)
+        if review_key is not None:
+            row = self.conn.execute('SELECT 1 FROM reviews WHERE review_key = ?', (review_key,)).fetchone()
+            if row is not None:
+                self.counts['duplicate_key'] += 1
+                return True, review_key
+        simhash = compute_simhash(review['review_text']) if review.get('review_text') else None
+        if review_key is None and simhash is not None and book_num is not None:
+            duplicate_key = self.find_near_duplicate(book_num, simhash)
+            if duplicate_key is not None:
+                self.counts['duplicate_text'] += 1
+                return True, duplicate_key
+        if review_key is None:
+            # reviews without URLs can still be matched on their text later on
+            text_hash = hashlib.blake2b((review.get('review_text') or '').encode('utf-8'), digest_size=8).hexdigest()
+            review_key = f"text|{book_num}|{text_hash}"
+        cursor = self.conn.execute(
+            'INSERT INTO reviews (review_key, book_num, review_lang, crawl_date, simhash) VALUES (?, ?, ?, ?, ?)',
+            (review_key, book_num, review.get('review_lang'), crawl_date if crawl_date else review.get('crawl_date'),
+             _to_signed(simhash) if simhash is not None else None))
+        if simhash is not None and book_num is not None:
+            self.conn.executemany(
+                'INSERT INTO simhash_bands (book_num, band, band_value, review_id) VALUES (?, ?, ?, ?)',
+                [(book_num, band, band_value, cursor.lastrowid) for band, band_value in enumerate(get_bands(simhash))])
+        self.counts['unique'] += 1
+        return False, None
+
+    def dedup_reviews(self, reviews: Iterable[Dict[str, any]], crawl_date: str = None,
+                      commit_every: int = 10000) -> Iterator[Dict[str, any]]:
+        """Yield the reviews that are not duplicates of indexed (or earlier) reviews, adding them to the index."""
+        for ri, review in enumerate(reviews):
+            is_duplicate, _ = self.check_and_add(review, crawl_date=crawl_date)
+            if not is_duplicate:
+                yield review
+            if (ri + 1) % commit_every == 0:
+                self.commit()
+        self.commit()
+
+    def get_lang_counts(self) -> Dict[str, int]:
+        """Return the number of unique reviews per language in which they were first seen."""
+        return {lang: num for lang, num in self.conn.execute(
+            'SELECT review_lang, COUNT(*) FROM reviews GROUP BY review_lang ORDER BY COUNT(*) DESC')}
+
+
+def iter_json_reviews(json_files: List[str]) -> Iterator[Dict[str, any]]:
+    for json_file in json_files:
+        with open(json_file, 'rt') as fh:
+            yield from json.load(fh)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Deduplicate extracted reviews across languages and crawls.')
+    parser.add_argument('json_dir', help='directory with the JSON review files of a crawl (per language)')
+    parser.add_argument('output_file', help='JSONL file to write the new unique reviews to')
+    parser.add_argument('--index', default='../data/review_dedup.sqlite', help='the persistent dedup index')
+    parser.add_argument('--crawl-date', help='the crawl date to record for new reviews')
+    args = parser.parse_args()
+    json_files = sorted(glob.glob(os.path.join(args.json_dir, '**', '*.json'), recursive=True))
+    index = ReviewDedupIndex(args.index)
+    with open(args.output_file, 'wt') as fh:
+        for review in index.dedup_reviews(iter_json_reviews(json_files), crawl_date=args.crawl_date):
+            fh.write(json.dumps(review) + '\n')
+    print(f"unique: {index.counts['unique']}\tduplicate key: {index.counts['duplicate_key']}"
+          f"\tnear-duplicate text: {index.counts['duplicate_text']}")
+    for lang, num in index.get_lang_counts().items():
+        print(f"\tlanguage: {lang}\treviews: {num}")
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+import argparse
+import glob
+import json
+import os
+import re
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Union
+
+import metrics
+
+
+# Han, Hiragana, Katakana and Hangul, which are not separated into words by spaces
+CJK_PATTERN = re.compile(r"[\u1100-\u11ff\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+")
+
+SEARCH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reviews (
+    id INTEGER PRIMARY KEY,
+    review_key TEXT UNIQUE NOT NULL,
+    book_id TEXT,
+    lang TEXT,
+    rating INTEGER,
+    source_file TEXT,
+    review_text TEXT
+);
+CREATE INDEX IF NOT EXISTS reviews_source_file ON reviews (source_file);
+CREATE INDEX IF NOT EXISTS reviews_book_id ON reviews (book_id);
+CREATE TABLE IF NOT EXISTS indexed_files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS review_fts USING fts5(
+    search_text, content='', tokenize='unicode61 remove_diacritics 2'
+);
+"""
+
+
+def cjk_bigrams(run: str) -> str:
+    """Split a run of CJK characters into overlapping bigrams, plus the last character on its
+    own, so that single-character prefix queries match every character of the run."""
+    if len(run) == 1:
+        return run
+    return ' '.join([run[ci:ci + 2] for ci in range(len(run) - 1)] + [run[-1]])
+
+
+def prepare_search_text(text: Union[str, None]) -> str:
+    """Turn a review text into the text that is indexed: the unicode61 tokenizer of FTS5 splits
+    words on spaces and punctuation, which does not work for Chinese, Japanese and Korean,
+    so runs of CJK characters are replaced by their bigrams."""
+    if text is None:
+        return ''
+    return CJK_PATTERN.sub(lambda m: f" {cjk_bigrams(m.group(0))} ", text)
+
+
+def prepare_query(query: str) -> str:
+    """Rewrite the CJK parts of an FTS5 query to the bigrams of the index. A CJK run outside a
+    quoted phrase becomes a phrase of its bigrams, a single character becomes a prefix query."""
+    def replace(m: re.Match) -> str:
+        run = m.group(0)
+        in_phrase = query[:m.start()].count('"') % 2 == 1
+        if len(run) == 1:
+            # a single character already followed by '*' is a prefix query as it is
+            is_prefix = query[m.end():m.end() + 1] == '*'
+            return run if in_phrase or is_prefix else f'"{run}"*'
+        bigrams = ' '.join(run[ci:ci + 2] for ci in range(len(run) - 1))
+        return bigrams if in_phrase else f'"{bigrams}"'
+    return CJK_PATTERN.sub(replace, query)
+
+
+def get_review_key(review: Dict[str, any]) -> str:
+    if review.get('review_url'):
+        return review['review_url']
+    if review.get('review_id'):
+        return review['review_id']
+    user_url = review.get('user_url', review.get('userurl', review.get('user_id')))
+    return f"{user_url}|{get_review_book_id(review)}"
+
+
+def get_review_book_id(review: Dict[str, any]) -> Union[str, None]:
+    for key in ['book_id', 'goodreads_book_id', 'goodreads_book_num']:
+        if review.get(key) is not None:
+            return str(review[key])
+    return None
+
+
+def get_review_rating(review: Dict[str, any]) -> Union[int, None]:
+    try:
+        return int(float(review['rating']))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class ReviewSearchIndex:
+    """A full-text index of review texts in an SQLite FTS5 table, with the book, language and
+    rating of each review for filtering. The FTS table is contentless, the review texts are
+    stored once, in the reviews table.
+
+    Review files are added incrementally: a file is only (re-)indexed if it is new or its
+    size or modification time changed, in which case its previous reviews are replaced."""
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self.conn = sqlite3.connect(db_file)
+        self.conn.executescript(SEARCH_SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def _delete_file_reviews(self, source_file: str) -> None:
+        rows = self.conn.execute('SELECT id, review_text FROM reviews WHERE source_file = ?', (source_file,)).fetchall()
+        # a contentless FTS5 table needs the indexed text to delete a row
+        self.conn.executemany("INSERT INTO review_fts (review_fts, rowid, search_text) VALUES ('delete', ?, ?)",
+                              [(review_id, prepare_search_text(text)) for review_id, text in rows])
+        self.conn.execute('DELETE FROM reviews WHERE source_file = ?', (source_file,))
+
+    def add_reviews(self, reviews: Iterable[Dict[str, any]], source_file: str = None, lang: str = None) -> int:
+        """Add reviews (dicts from extract_reviews, parse_review or the ImpFic TSV) to the index.
+        Reviews that are already indexed are skipped. Returns the number of added reviews."""
+        num_added = 0
+        for review in reviews:
+            review_text = review.get('review_text')
+            if not review_text:
+                continue
+            cursor = self.conn.execute(
+                'INSERT OR IGNORE INTO reviews (review_key, book_id, lang, rating, source_file, review_text) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (get_review_key(review), get_review_book_id(review), review.get('review_lang', lang),
+                 get_review_rating(review), source_file, review_text))
+            if cursor.rowcount == 0:
+                continue
+            self.conn.execute('INSERT INTO review_fts (rowid, search_text) VALUES (?, ?)',
+                              (cursor.lastrowid, prepare_search_text(review_text)))
+            num_added += 1
+        metrics.counter('search_index.reviews_added').inc(num_added)
+        return num_added
+
+    def needs_indexing(self, review_file: str, stat: os.stat_result) -> bool:
+        row = self.conn.execute('SELECT size, mtime_ns FROM indexed_files WHERE path = ?', (review_file,)).fetchone()
+        return row is None or tuple(row) != (stat.st_size, stat.st_mtime_ns)
+
+    def update_json_files(self, json_files: List[str]) -> Dict[str, int]:
+        """Index the reviews of new and changed JSON review files (as written by extract_goodreads_reviews)."""
+        stats = {'files': 0, 'reviews': 0}
+        with self.conn:
+            for json_file in json_files:
+                stat = os.stat(json_file)
+                if not self.needs_indexing(json_file, stat):
+                    continue
+                with open(json_file, 'rt') as fh:
+                    reviews = json.load(fh)
+                self._delete_file_reviews(json_file)
+                stats['reviews'] += self.add_reviews(reviews, source_file=json_file)
+                self.conn.execute('INSERT OR REPLACE INTO indexed_files (path, size, mtime_ns) VALUES (?, ?, ?)',
+                                  (json_file, stat.st_size, stat.st_mtime_ns))
+                stats['files'] += 1
+        return stats
+
+    def update_impfic_reviews(self, review_file: str, lang: str = 'nl') -> Dict[str, int]:
+        """Index the reviews of the linked ImpFic review TSV, if it changed since it was last indexed."""
+        import pandas as pd
+
+        stats = {'files': 0, 'reviews': 0}
+        stat = os.stat(review_file)
+        if not self.needs_indexing(review_file, stat):
+            return stats
+        reviews = pd.read_csv(review_file, sep='\t', dtype=str, keep_default_na=False)
+        with self.conn:
+            self._delete_file_reviews(review_file)
+            stats['reviews'] += self.add_reviews(reviews.to_dict('records'), source_file=review_file, lang=lang)
+            self.conn.execute('INSERT OR REPLACE INTO indexed_files (path, size, mtime_ns) VALUES (?, ?, ?)',
+                              (review_file, stat.st_size, stat.st_mtime_ns))
+            stats['files'] += 1
+        return stats
+
+    def search(self, query: str, book_id: str = None, lang: str = None, min_rating: int = None,
+               max_rating: int = None, limit: int = 20, offset: int = 0) -> List[Dict[str, any]]:
+        """Search the review texts with an FTS5 query (words, "phrases", AND/OR/NOT, prefix*),
+        optionally filtered by book, language and rating, best matches first."""
+        sql = ('SELECT r.review_key, r.book_id, r.lang, r.rating, r.review_text FROM review_fts f '
+               'JOIN reviews r ON r.id = f.rowid WHERE review_fts MATCH ?')
+        params = [prepare_query(query)]
+        for condition, value in [('r.book_id = ?', book_id), ('r.lang = ?', lang),
+                                 ('r.rating >= ?', min_rating), ('r.rating <= ?', max_rating)]:
+            if value is not None:
+                sql += f' AND {condition}'
+                params.append(value)
+        sql += ' ORDER BY f.rank LIMIT ? OFFSET ?'
+        params.extend([limit, offset])
+        columns = ['review_key', 'book_id', 'lang', 'rating', 'review_text']
+        return [dict(zip(columns, row)) for row in self.conn.execute(sql, params)]
+
+    def get_lang_counts(self) -> Dict[str, int]:
+        return {lang: num for lang, num in self.conn.execute(
+            'SELECT lang, COUNT(*) FROM reviews GROUP BY lang ORDER BY COUNT(*) DESC')}
+
+
+def get_review_json_files(json_base_dir: str) -> List[str]:
+    return sorted(glob.glob(os.path.join(json_base_dir, '*', '*-reviews.json')))
+
+
+def update_search_index(index_file: str, json_base_dir: str) -> Dict[str, int]:
+    """Add the new and changed JSON review files under json_base_dir to the search index."""
+    index = ReviewSearchIndex(index_file)
+    stats = index.update_json_files(get_review_json_files(json_base_dir))
+    index.close()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build and search a full-text index of review texts.')
+    parser.add_argument('--index', default='../data/review_search.sqlite')
+    parser.add_argument('--json-dir', help='index the new and changed JSON review files in this directory')
+    parser.add_argument('--impfic', help='index the reviews of a linked ImpFic review TSV file')
+    parser.add_argument('--query', help='FTS5 query, e.g. \'"plot twist" AND ending\'')
+    parser.add_argument('--book-id')
+    parser.add_argument('--lang')
+    parser.add_argument('--min-rating', type=int)
+    parser.add_argument('--max-rating', type=int)
+    parser.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args()
+    index = ReviewSearchIndex(args.index)
+    if args.json_dir:
+        print(f"indexed: {index.update_json_files(get_review_json_files(args.json_dir))}")
+    if args.impfic:
+        print(f"indexed: {index.update_impfic_reviews(args.impfic)}")
+    if args.query:
+        start = time.perf_counter()
+        results = index.search(args.query, book_id=args.book_id, lang=args.lang, min_rating=args.min_rating,
+                               max_rating=args.max_rating, limit=args.limit)
+        print(f"{len(results)} results in {1000 * (time.perf_counter() - start):.1f} ms")
+        for result in results:
+            print(f"{result['book_id']}\t{result['lang']}\t{result['rating']}\t{result['review_text'][:200]!r}")
+    else:
+        for lang, num in index.get_lang_counts().items():
+            print(f"\tlanguage: {lang}\treviews: {num}")
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import argparse
+import json
+import os
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Union
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+
+REVIEW_DTYPES = {
+    'goodreads_book_num': str,
+    'work_id': str,
+    'source': str,
+    'user_id': str,
+    'review_id': str,
+    'review_date': str,
+    'review_text': str,
+}
+# the ImpFic reviews are Dutch, a review_lang column (e.g. from review_text_stats) takes precedence
+DEFAULT_LANG = 'nl'
+MAX_LIMIT = 1000
+
+
+def build_review_store(review_file: str, store_file: str, default_lang: str = DEFAULT_LANG) -> None:
+    """Convert the linked review TSV to an uncompressed Arrow (Feather v2) file sorted by
+    goodreads_book_num, that can be memory-mapped by ReviewStore."""
+    reviews = pd.read_csv(review_file, sep='\t', dtype=REVIEW_DTYPES, keep_default_na=False, na_values={
+        'rating': [''], 'review_num_terms': [''], 'review_num_words': [''], 'num_sentences': ['']})
+    if 'review_lang' not in reviews.columns:
+        reviews['review_lang'] = default_lang
+    reviews['review_datetime'] = pd.to_datetime(reviews.review_date, errors='coerce')
+    reviews = reviews.sort_values(['goodreads_book_num', 'work_id', 'review_datetime'], kind='stable')
+    table = pa.Table.from_pandas(reviews, preserve_index=False)
+    tmp_file = f'{store_file}.tmp'
+    feather.write_feather(table, tmp_file, compression='uncompressed')
+    os.replace(tmp_file, store_file)
+
+
+def _group_rows(values: np.ndarray) -> Dict[str, np.ndarray]:
+    """Map each distinct value to the (sorted) row numbers it occurs in."""
+    order = np.argsort(values, kind='stable')
+    distinct, starts = np.unique(values[order], return_index=True)
+    return {value: rows for value, rows in zip(distinct, np.split(order, starts[1:]))}
+
+
+class ReviewStore:
+    """Read-only, indexed access to the linked review dataset. The Arrow file is memory-mapped,
+    so opening the store only reads the columns needed for the indexes and filters, and the
+    review texts are only read for the rows a query returns."""
+
+    def __init__(self, store_file: str):
+        self.store_file = store_file
+        self.table = feather.read_table(store_file, memory_map=True)
+        self.num_rows = self.table.num_rows
+        book_nums = self.table.column('goodreads_book_num').to_numpy(zero_copy_only=False).astype(str)
+        # the store is sorted by goodreads_book_num, so each book is a contiguous block of rows
+        distinct, starts, counts = np.unique(book_nums, return_index=True, return_counts=True)
+        self.book_rows = {book_num: (start, start + count) for book_num, start, count in zip(distinct, starts, counts)}
+        self.work_rows = _group_rows(self.table.column('work_id').to_numpy(zero_copy_only=False).astype(str))
+        self.sources = self.table.column('source').to_numpy(zero_copy_only=False).astype(str)
+        self.langs = self.table.column('review_lang').to_numpy(zero_copy_only=False).astype(str)
+        self.dates = self.table.column('review_datetime').to_numpy(zero_copy_only=False).astype('datetime64[s]')
+
+    def get_rows(self, book_num: str = None, work_id: str = None) -> np.ndarray:
+        if book_num is not None:
+            if book_num not in self.book_rows:
+                return np.array([], dtype=np.int64)
+            start, end = self.book_rows[book_num]
+            rows = np.arange(start, end)
+            if work_id is not None:
+                rows = np.intersect1d(rows, self.work_rows.get(work_id, np.array([], dtype=np.int64)))
+            return rows
+        if work_id is not None:
+            return self.work_rows.get(work_id, np.array([], dtype=np.int64))
+        return np.arange(self.num_rows)
+
+    def query(self, book_num: str = None, work_id: str = None, source: str = None, lang: str = None,
+              date_from: str = None, date_to: str = None, offset: int = 0,
+              limit: int = 100) -> Dict[str, Union[int, List[Dict[str, any]]]]:
+        """Return a page of the reviews matching all given filters, ordered by book, work and date,
+        with the total number of matches. Dates are ISO dates (inclusive); reviews without a date
+        do not match a date range."""
+        if offset < 0:
+            raise ValueError(f"offset must be 0 or more, got {offset}")
+        if limit < 1:
+            raise ValueError(f"limit must be 1 or more, got {limit}")
+        rows = self.get_rows(book_num=book_num, work_id=work_id)
+        mask = np.ones(len(rows), dtype=bool)
+        if source is not None:
+            mask &= self.sources[rows] == source
+        if lang is not None:
+            mask &= self.langs[rows] == lang
+        if date_from is not None:
+            mask &= self.dates[rows] >= np.datetime64(date_from, 's')
+        if date_to is not None:
+            # inclusive: everything before the start of the next day
+            mask &= self.dates[rows] < np.datetime64(date_to, 'D') + np.timedelta64(1, 'D')
+        rows = rows[mask]
+        limit = min(limit, MAX_LIMIT)
+        page_rows = rows[offset:offset + limit]
+        columns = [name for name in self.table.column_names if name != 'review_datetime']
+        reviews = self.table.select(columns).take(pa.array(page_rows, type=pa.int64())).to_pylist()
+        return {'total': len(rows), 'offset': offset, 'limit': limit, 'reviews': reviews}
+
+    def get_stats(self) -> Dict[str, any]:
+        sources, counts = np.unique(self.sources, return_counts=True)
+        return {
+            'reviews': self.num_rows,
+            'books': len(self.book_rows),
+            'works': len(self.work_rows),
+            'sources': {source: int(count) for source, count in zip(sources, counts)},
+        }
+
+
+def open_review_store(review_file: str, store_file: str = None) -> ReviewStore:
+    """Open the store of a review TSV file, (re)building it if it is missing or older than the TSV."""
+    if store_file is None:
+        store_file = review_file.replace('.tsv.gz', '.arrow')
+    if not os.path.exists(store_file) or os.path.getmtime(store_file) < os.path.getmtime(review_file):
+        print(f"building review store {store_file}")
+        build_review_store(review_file, store_file)
+    return ReviewStore(store_file)
+
+
+QUERY_PARAMS = ['book_num', 'work_id', 'source', 'lang', 'date_from', 'date_to']
+
+
+class ReviewRequestHandler(BaseHTTPRequestHandler):
+    """Answer GET /reviews?book_num=...&work_id=...&source=...&lang=...&date_from=...&date_to=...
+    &offset=...&limit=... and GET /stats with JSON."""
+
+    store: ReviewStore = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        try:
+            if url.path == '/reviews':
+                query = {key: params[key] for key in QUERY_PARAMS if key in params}
+                response = self.store.query(offset=int(params.get('offset', 0)),
+                                            limit=int(params.get('limit', 100)), **query)
+            elif url.path == '/stats':
+                response = self.store.get_stats()
+            else:
+                self.send_json(404, {'error': f'unknown path {url.path}'})
+                return None
+        except ValueError as err:
+            self.send_json(400, {'error': str(err)})
+            return None
+        self.send_json(200, response)
+
+    def send_json(self, status: int, data) -> None:
+        body = json.dumps(data, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(store: ReviewStore, port: int = 8080) -> None:
+    handler_class = type('StoreRequestHandler', (ReviewRequestHandler,), {'store': store})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler_class)
+    print(f"serving {store.num_rows} reviews at http://127.0.0.1:{port}/reviews")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+def benchmark_lookups(store: ReviewStore, num_queries: int = 1000) -> None:
+    book_nums = list(store.book_rows.keys())
+    start = time.perf_counter()
+    for qi in range(num_queries):
+        store.query(book_num=book_nums[qi % len(book_nums)], limit=10)
+    elapsed = time.perf_counter() - start
+    print(f"{num_queries} lookups by goodreads_book_num, {1000 * elapsed / num_queries:.3f} ms per lookup")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query the linked multilingual/ImpFic reviews.')
+    parser.add_argument('--reviews', default='../data/multilingual_books-impfic_reviews.tsv.gz')
+    parser.add_argument('--serve', action='store_true', help='start the HTTP endpoint')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--benchmark', action='store_true', help='time lookups by book')
+    for param in QUERY_PARAMS:
+        parser.add_argument(f"--{param.replace('_', '-')}", dest=param)
+    parser.add_argument('--offset', type=int, default=0)
+    parser.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args()
+    store = open_review_store(args.reviews)
+    if args.serve:
+        serve(store, port=args.port)
+    elif args.benchmark:
+        benchmark_lookups(store)
+    else:
+        query = {param: getattr(args, param) for param in QUERY_PARAMS if getattr(args, param) is not None}
+        print(json.dumps(store.query(offset=args.offset, limit=args.limit, **query), default=str, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+import argparse
+import glob
+import importlib.util
+import json
+import multiprocessing
+import os
+import time
+from typing import Iterable, Iterator, List
+
+import pandas as pd
+
+
+# terms are words and punctuation marks, words are runs of word characters. The ImpFic
+# review_num_terms and review_num_words columns come from another tokenizer (and from the
+# untruncated texts), so these counts are comparable to them but not the same
+TERM_PATTERN = r"\w+|[^\w\s]"
+WORD_PATTERN = r"\w+"
+# a sentence ends with one or more sentence-final punctuation marks (including CJK full stops)
+SENTENCE_END_PATTERN = r"[.!?。！？؟।]+(?:\s|$)"
+
+# the threshold used in the language sorting of the Goodreads review dump
+MIN_LANG_PROB = 0.7
+
+STATS_COLUMNS = ['review_num_terms', 'review_num_words', 'num_sentences', 'detected_lang', 'detected_lang_prob']
+ID_COLUMNS = ['review_url', 'user_url', 'userurl', 'book_id', 'goodreads_book_id', 'review_lang', 'crawl_date']
+
+
+def get_text_counts(texts: pd.Series) -> pd.DataFrame:
+    """Count the terms, words and sentences of a chunk of review texts. A non-empty text
+    without sentence-final punctuation counts as one sentence."""
+    texts = texts.fillna('')
+    num_terms = texts.str.count(TERM_PATTERN)
+    num_sentences = texts.str.rstrip().str.count(SENTENCE_END_PATTERN)
+    no_end = (num_sentences == 0) & (num_terms > 0)
+    num_sentences[no_end] = 1
+    return pd.DataFrame({
+        'review_num_terms': num_terms,
+        'review_num_words': texts.str.count(WORD_PATTERN),
+        'num_sentences': num_sentences,
+    }, index=texts.index)
+
+
+def detect_languages(texts: pd.Series, min_prob: float = MIN_LANG_PROB) -> pd.DataFrame:
+    """Identify the language of each text with langdetect. Texts for which the most likely
+    language has a probability below min_prob get 'unknown', texts without any letters get
+    'no_features'."""
+    from langdetect import DetectorFactory, detect_langs
+    from langdetect.lang_detect_exception import LangDetectException
+    # make the detection deterministic, so reruns give the same languages
+    DetectorFactory.seed = 0
+    langs, probs = [], []
+    for text in texts.fillna(''):
+        try:
+            lang_prob = detect_langs(text)[0]
+            langs.append(lang_prob.lang if lang_prob.prob >= min_prob else 'unknown')
+            probs.append(lang_prob.prob)
+        except LangDetectException:
+            langs.append('no_features')
+            probs.append(0.0)
+    return pd.DataFrame({'detected_lang': langs, 'detected_lang_prob': probs}, index=texts.index)
+
+
+def compute_review_stats(reviews: pd.DataFrame, detect_lang: bool = True) -> pd.DataFrame:
+    """Return the ID columns of a chunk of reviews with the text statistics (and the detected language) added."""
+    id_columns = [column for column in ID_COLUMNS if column in reviews.columns]
+    stats = pd.concat([reviews[id_columns], get_text_counts(reviews['review_text'])], axis=1)
+    if detect_lang:
+        stats = pd.concat([stats, detect_languages(reviews['review_text'])], axis=1)
+    return stats
+
+
+def _compute_chunk_stats(job):
+    reviews, detect_lang = job
+    return compute_review_stats(reviews, detect_lang=detect_lang)
+
+
+def iter_json_reviews(review_files: List[str], chunk_size: int) -> Iterator[pd.DataFrame]:
+    """Read reviews in chunks from JSON files with a list of reviews (as written by
+    extract_goodreads_reviews) or JSONL files with a review per line."""
+    chunk = []
+    for review_file in review_files:
+        with open(review_file, 'rt') as fh:
+            if review_file.endswith('.jsonl'):
+                reviews = (json.loads(line) for line in fh if line.strip() != '')
+            else:
+                reviews = json.load(fh)
+            for review in reviews:
+                chunk.append(review)
+                if len(chunk) == chunk_size:
+                    yield pd.DataFrame(chunk)
+                    chunk = []
+    if len(chunk) > 0:
+        yield pd.DataFrame(chunk)
+
+
+def iter_parquet_reviews(dataset_dir: str, chunk_size: int, langs: List[str] = None) -> Iterator[pd.DataFrame]:
+    """Read reviews in chunks from a partitioned Parquet dataset (see parquet_sink)."""
+    import pyarrow.dataset as ds
+    from parquet_sink import get_partitioning, REVIEW_PARTITION_COLS
+    dataset = ds.dataset(dataset_dir, format='parquet', partitioning=get_partitioning(REVIEW_PARTITION_COLS))
+    columns = [column for column in ID_COLUMNS + ['review_text'] if column in dataset.schema.names]
+    filter_expr = ds.field('review_lang').isin(langs) if langs is not None else None
+    for batch in dataset.to_batches(columns=columns, filter=filter_expr, batch_size=chunk_size):
+        if batch.num_rows > 0:
+            yield batch.to_pandas()
+
+
+def compute_stats_parallel(review_chunks: Iterable[pd.DataFrame], num_workers: int = None,
+                           detect_lang: bool = True, report_every: int = 100000) -> Iterator[pd.DataFrame]:
+    """Compute the review statistics of chunks of reviews across a pool of worker processes,
+    yielding the statistics per chunk (in order) and reporting the throughput."""
+    if num_workers is None:
+        num_workers = max(1, multiprocessing.cpu_count() - 1)
+    jobs = ((chunk, detect_lang) for chunk in review_chunks)
+    start = time.perf_counter()
+    num_reviews, next_report = 0, report_every
+    with multiprocessing.Pool(num_workers) as pool:
+        for stats in pool.imap(_compute_chunk_stats, jobs):
+            num_reviews += len(stats)
+            if num_reviews >= next_report:
+                elapsed = time.perf_counter() - start
+                print(f"{num_reviews} reviews processed, {num_reviews / elapsed:.1f} reviews/s")
+                next_report += report_every
+            yield stats
+    elapsed = time.perf_counter() - start
+    print(f"{num_reviews} reviews processed in {elapsed:.1f}s ({num_reviews / max(elapsed, 1e-9):.1f} reviews/s, "
+          f"{num_workers} workers)")
+
+
+def get_stats_schema(columns: List[str]):
+    """Return the Parquet schema of the statistics columns, so that the schema does not depend
+    on the values of the first chunk (an all-null column would get the null type)."""
+    import pyarrow as pa
+    stats_types = {
+        'review_num_terms': pa.int64(),
+        'review_num_words': pa.int64(),
+        'num_sentences': pa.int64(),
+        'detected_lang': pa.string(),
+        'detected_lang_prob': pa.float64(),
+    }
+    # the ID columns are all strings
+    return pa.schema([(column, stats_types.get(column, pa.string())) for column in columns])
+
+
+def write_review_stats(stats_chunks: Iterable[pd.DataFrame], output_file: str) -> int:
+    """Write review statistics to a Parquet file (.parquet) or a gzipped TSV file. Returns
+    the number of written rows."""
+    num_rows = 0
+    if output_file.endswith('.parquet'):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        writer = None
+        for stats in stats_chunks:
+            if writer is None:
+                writer = pq.ParquetWriter(output_file, get_stats_schema(list(stats.columns)))
+            writer.write_table(pa.Table.from_pandas(stats, schema=writer.schema, preserve_index=False))
+            num_rows += len(stats)
+        if writer is not None:
+            writer.close()
+    else:
+        for ci, stats in enumerate(stats_chunks):
+            stats.to_csv(output_file, sep='\t', index=False, compression='gzip', mode='w' if ci == 0 else 'a',
+                         header=ci == 0)
+            num_rows += len(stats)
+    return num_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compute text statistics and the language of reviews.')
+    parser.add_argument('input', help='a Parquet review dataset directory or a directory with JSON/JSONL review files')
+    parser.add_argument('output_file', help='output file, .parquet or .tsv.gz')
+    parser.add_argument('--langs', nargs='+', help='only process these review languages (Parquet input)')
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--no-lang-detect', action='store_true', help='only compute the text statistics')
+    args = parser.parse_args()
+    if not args.no_lang_detect and importlib.util.find_spec('langdetect') is None:
+        parser.error('language detection needs langdetect (pip install langdetect), or use --no-lang-detect')
+    review_files = sorted(glob.glob(os.path.join(args.input, '**', '*.json'), recursive=True) +
+                          glob.glob(os.path.join(args.input, '**', '*.jsonl'), recursive=True))
+    if len(review_files) > 0:
+        review_chunks = iter_json_reviews(review_files, args.chunk_size)
+    else:
+        review_chunks = iter_parquet_reviews(args.input, args.chunk_size, langs=args.langs)
+    stats_chunks = compute_stats_parallel(review_chunks, num_workers=args.workers,
+                                          detect_lang=not args.no_lang_detect)
+    num_rows = write_review_stats(stats_chunks, args.output_file)
+    print(f"{num_rows} review statistics written to {args.output_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import argparse
+import bisect
+import hashlib
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple, Union
+
+
+# points per shard on the hash ring, more points give a more even split
+SHARD_VNODES = 128
+
+
+def hash_key(key: str) -> int:
+    """A 64-bit hash of a string that is the same in every process and on every machine
+    (unlike the built-in hash, which is randomized per process)."""
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def get_shard_key(book_id: str, lang: str) -> str:
+    """Return the key of a book page. Book ids are reduced to their leading number, so
+    '1234.Title', '1234-title' and '1234' are the same book."""
+    match = re.match(r"(\d+)", book_id)
+    book_num = match.group(1) if match else book_id
+    return f"{book_num}|{lang}"
+
+
+def get_path_book_lang(path: str) -> Tuple[str, str]:
+    """Return the book_id and language of a page in the <lang>/<book_id>.html layout. For the
+    canonical pages the 'language' is the name of their directory, as in extraction."""
+    page_dir, filename = os.path.split(path)
+    return filename.replace('.html', ''), os.path.basename(page_dir)
+
+
+class Shard:
+    """One of `count` shards of the crawl and extraction work. Every (book, language) key is
+    assigned to a shard by consistent hashing, so each worker, on any machine, can decide
+    which pages are its own without a coordinator, and changing the number of shards only
+    moves about 1/count of the keys to another shard.
+
+    As the language of a page is the name of its directory, a page that is crawled into
+    <lang>/<book_id>.html by a shard is also extracted by that shard."""
+
+    def __init__(self, index: int, count: int, vnodes: int = SHARD_VNODES):
+        if count < 1 or not 0 <= index < count:
+            raise ValueError(f"invalid shard {index} of {count}, index must be in 0..{count - 1}")
+        self.index = index
+        self.count = count
+        ring = sorted((hash_key(f"shard-{si}-{vi}"), si) for si in range(count) for vi in range(vnodes))
+        self.ring_points = [point for point, _ in ring]
+        self.ring_shards = [si for _, si in ring]
+
+    def __repr__(self):
+        return f"Shard({self.index}, {self.count})"
+
+    def get_key_shard_index(self, key: str) -> int:
+        """Return the shard of a key: the first ring point after its hash."""
+        ri = bisect.bisect(self.ring_points, hash_key(key))
+        return self.ring_shards[ri % len(self.ring_shards)]
+
+    def get_shard_index(self, book_id: str, lang: str) -> int:
+        return self.get_key_shard_index(get_shard_key(book_id, lang))
+
+    def owns(self, book_id: str, lang: str) -> bool:
+        return self.get_shard_index(book_id, lang) == self.index
+
+    def owns_path(self, path: str) -> bool:
+        return self.owns(*get_path_book_lang(path))
+
+    def owns_file(self, path: str) -> bool:
+        """Whether a file that is not a book page (e.g. a book list) belongs to this shard,
+        by its full filename, as the leading number of e.g. '100 Best ...' is not a book id."""
+        return self.get_key_shard_index(os.path.basename(path)) == self.index
+
+    def filter_jobs(self, jobs: Iterable[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """Keep the (url, output file) crawl jobs of this shard."""
+        return [(url, output_file) for url, output_file in jobs if self.owns_path(output_file)]
+
+    def filter_book_files(self, book_files: Dict[str, List[str]]) -> Dict[str, List[str]]:
+        """Keep the files of this shard of a {book_id: [html files]} map."""
+        shard_files = {}
+        for book_id, html_files in book_files.items():
+            html_files = [html_file for html_file in html_files if self.owns_path(html_file)]
+            if len(html_files) > 0:
+                shard_files[book_id] = html_files
+        return shard_files
+
+    def get_file(self, path: str) -> str:
+        """Return the shard-specific version of a state or output file, e.g. a crawl frontier
+        'crawl_frontier.sqlite' becomes 'crawl_frontier.shard-1-of-4.sqlite'."""
+        root, ext = os.path.splitext(path)
+        return f"{root}.shard-{self.index}-of-{self.count}{ext}"
+
+
+def get_shard_file(path: str, shard: Union[Shard, None]) -> str:
+    return path if shard is None else shard.get_file(path)
+
+
+def add_shard_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--shard-index', type=int, help='the shard of the work this process does (0-based)')
+    parser.add_argument('--num-shards', type=int, help='the total number of shards')
+
+
+def get_shard(args: argparse.Namespace) -> Union[Shard, None]:
+    """Return the shard given on the command line, or None to do all the work."""
+    if args.shard_index is None and args.num_shards is None:
+        return None
+    if args.shard_index is None or args.num_shards is None:
+        raise ValueError('--shard-index and --num-shards must be given together')
+    return Shard(args.shard_index, args.num_shards)
+
+
+def launch_shards(command: List[str], num_shards: int, log_dir: str = '.') -> List[int]:
+    """Run a crawl or extraction script as `num_shards` local processes, each with its own
+    --shard-index, and wait for all of them. The output of each shard goes to its own
+    log file. Returns the exit codes of the shards."""
+    start = time.perf_counter()
+    script_name = os.path.splitext(os.path.basename(command[1] if len(command) > 1 else command[0]))[0]
+    processes = []
+    for si in range(num_shards):
+        log_file = os.path.join(log_dir, f"{script_name}.shard-{si}-of-{num_shards}.log")
+        with open(log_file, 'wt') as fh_log:
+            process = subprocess.Popen(command + ['--shard-index', str(si), '--num-shards', str(num_shards)],
+                                       stdout=fh_log, stderr=subprocess.STDOUT)
+        print(f"shard {si}: pid {process.pid}, log {log_file}")
+        processes.append(process)
+    exit_codes = [process.wait() for process in processes]
+    for si, exit_code in enumerate(exit_codes):
+        print(f"shard {si}: exit code {exit_code}")
+    print(f"{num_shards} shards finished in {time.perf_counter() - start:.1f}s")
+    return exit_codes
+
+
+def get_shard_counts(html_dir: str, num_shards: int) -> Dict[int, int]:
+    """Count the pages per shard in a crawl directory, to check the balance of the split."""
+    shard = Shard(0, num_shards)
+    counts = Counter()
+    with os.scandir(html_dir) as lang_dirs:
+        for lang_dir in lang_dirs:
+            if not lang_dir.is_dir():
+                continue
+            with os.scandir(lang_dir.path) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.html'):
+                        counts[shard.get_shard_index(*get_path_book_lang(entry.path))] += 1
+    return {si: counts[si] for si in range(num_shards)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run sharded crawls and extractions and merge their outputs.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    launch_parser = subparsers.add_parser('launch', help='run a script as local shard processes')
+    launch_parser.add_argument('--num-shards', type=int, required=True)
+    launch_parser.add_argument('--log-dir', default='.')
+    launch_parser.add_argument('script', nargs=argparse.REMAINDER,
+                               help='the script and its arguments, e.g. extract_goodreads_reviews.py')
+    catalog_parser = subparsers.add_parser('merge-catalogs', help='merge shard book catalogs into one')
+    catalog_parser.add_argument('catalog', help='the merged catalog file')
+    catalog_parser.add_argument('shard_catalogs', nargs='+')
+    manifest_parser = subparsers.add_parser('merge-manifests', help='merge shard extraction manifests into one')
+    manifest_parser.add_argument('manifest', help='the merged manifest file')
+    manifest_parser.add_argument('shard_manifests', nargs='+')
+    books_parser = subparsers.add_parser('merge-books', help='merge shard book maps of the book list crawl')
+    books_parser.add_argument('book_map', help='the merged book map file')
+    books_parser.add_argument('shard_book_maps', nargs='+')
+    counts_parser = subparsers.add_parser('counts', help='show the pages per shard in a crawl directory')
+    counts_parser.add_argument('html_dir')
+    counts_parser.add_argument('--num-shards', type=int, required=True)
+    args = parser.parse_args()
+    if args.command == 'launch':
+        exit_codes = launch_shards([sys.executable] + args.script, args.num_shards, log_dir=args.log_dir)
+        sys.exit(1 if any(exit_codes) else 0)
+    elif args.command == 'merge-catalogs':
+        from book_catalog import merge_catalogs
+        print(f"merged: {merge_catalogs(args.catalog, args.shard_catalogs)}")
+    elif args.command == 'merge-manifests':
+        from extraction_manifest import merge_manifests
+        print(f"merged: {merge_manifests(args.manifest, args.shard_manifests)}")
+    elif args.command == 'merge-books':
+        from crawl_book_list_pages import merge_book_maps
+        print(f"merged: {merge_book_maps(args.book_map, args.shard_book_maps)} books")
+    elif args.command == 'counts':
+        for si, count in get_shard_counts(args.html_dir, args.num_shards).items():
+            print(f"\tshard: {si}\tpages: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+import glob
+import hashlib
+import os
+import sqlite3
+from typing import Iterator, List, Tuple, Union
+
+import zstandard
+
+from parse import get_crawl_date
+
+
+STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    content_hash TEXT PRIMARY KEY,
+    segment INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    raw_size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    book_id TEXT NOT NULL,
+    lang TEXT NOT NULL,
+    crawl_date TEXT NOT NULL,
+    content_hash TEXT NOT NULL REFERENCES blobs (content_hash),
+    PRIMARY KEY (book_id, lang, crawl_date)
+);
+CREATE INDEX IF NOT EXISTS pages_crawl_date ON pages (crawl_date, lang);
+"""
+
+DICTIONARY_FILENAME = 'dictionary.zstd'
+
+
+class SnapshotStore:
+    """A content-addressed store of crawled HTML pages.
+
+    Each distinct page is compressed with zstd and appended to a segment file,
+    and an SQLite index maps (book_id, lang, crawl_date) to the SHA-256 hash of the
+    page content and the hash to its position in a segment. A page that is
+    identical across crawl dates or languages is stored only once. When the store
+    directory contains a zstd dictionary (see train_dictionary) it is used for all
+    pages, which compresses small, similar HTML pages much better."""
+
+    def __init__(self, store_dir: str, level: int = 10, max_segment_size: int = 256 * 1024 * 1024):
+        self.store_dir = store_dir
+        self.max_segment_size = max_segment_size
+        if not os.path.isdir(store_dir):
+            os.makedirs(store_dir)
+        self.conn = sqlite3.connect(os.path.join(store_dir, 'index.sqlite'))
+        self.conn.executescript(STORE_SCHEMA)
+        dict_data = None
+        dict_file = os.path.join(store_dir, DICTIONARY_FILENAME)
+        if os.path.exists(dict_file):
+            with open(dict_file, 'rb') as fh:
+                dict_data = zstandard.ZstdCompressionDict(fh.read())
+        self.compressor = zstandard.ZstdCompressor(level=level, dict_data=dict_data)
+        self.decompressor = zstandard.ZstdDecompressor(dict_data=dict_data)
+        self.segment, self.segment_fh = self._open_last_segment()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        self.segment_fh.close()
+        self.conn.commit()
+        self.conn.close()
+
+    def get_segment_file(self, segment: int) -> str:
+        return os.path.join(self.store_dir, f'segment-{segment:06d}.zst')
+
+    def _open_last_segment(self):
+        row = self.conn.execute('SELECT MAX(segment) FROM blobs').fetchone()
+        segment = row[0] if row[0] is not None else 0
+        return segment, open(self.get_segment_file(segment), 'ab')
+
+    def _append_blob(self, data: bytes) -> Tuple[int, int]:
+        """Append compressed data to the current segment, starting a new one when it is full."""
+        offset = self.segment_fh.tell()
+        if offset > 0 and offset + len(data) > self.max_segment_size:
+            self.segment_fh.close()
+            self.segment += 1
+            self.segment_fh = open(self.get_segment_file(self.segment), 'ab')
+            offset = 0
+        self.segment_fh.write(data)
+        return self.segment, offset
+
+    def put(self, book_id: str, lang: str, crawl_date: str, html: str) -> str:
+        """Add a page to the store and return its content hash. The page content
+        is only written if no identical page is stored yet."""
+        raw = html.encode('utf-8')
+        content_hash = hashlib.sha256(raw).hexdigest()
+        row = self.conn.execute('SELECT 1 FROM blobs WHERE content_hash = ?', (content_hash,)).fetchone()
+        if row is None:
+            data = self.compressor.compress(raw)
+            segment, offset = self._append_blob(data)
+            self.conn.execute('INSERT INTO blobs (content_hash, segment, offset, length, raw_size) '
+                              'VALUES (?, ?, ?, ?, ?)', (content_hash, segment, offset, len(data), len(raw)))
+        self.conn.execute('INSERT OR REPLACE INTO pages (book_id, lang, crawl_date, content_hash) '
+                          'VALUES (?, ?, ?, ?)', (book_id, lang, crawl_date, content_hash))
+        return content_hash
+
+    def commit(self) -> None:
+        """Flush the segment data and commit the index, so the added pages survive a crash."""
+        self.segment_fh.flush()
+        os.fsync(self.segment_fh.fileno())
+        self.conn.commit()
+
+    def _read_blob(self, fh, offset: int, length: int) -> str:
+        fh.seek(offset)
+        return self.decompressor.decompress(fh.read(length)).decode('utf-8')
+
+    def get(self, book_id: str, lang: str, crawl_date: str) -> Union[str, None]:
+        """Return the HTML of a page, or None if the page is not in the store."""
+        row = self.conn.execute(
+            'SELECT segment, offset, length FROM pages JOIN blobs USING (content_hash) '
+            'WHERE book_id = ? AND lang = ? AND crawl_date = ?', (book_id, lang, crawl_date)).fetchone()
+        if row is None:
+            return None
+        segment, offset, length = row
+        self.segment_fh.flush()
+        with open(self.get_segment_file(segment), 'rb') as fh:
+            return self._read_blob(fh, offset, length)
+
+    def iter_pages(self, lang: str = None, crawl_date: str = None,
+                   latest: bool = False) -> Iterator[Tuple[str, str, str, str]]:
+        """Iterate over (book_id, lang, crawl_date, html) for all pages, optionally filtered by
+        language and crawl date, or only the latest crawl of each book and language if `latest`
+        is True. Pages are read in segment order, so each segment is read sequentially."""
+        self.segment_fh.flush()
+        rows = self.conn.execute(
+            'SELECT book_id, lang, crawl_date, content_hash, segment, offset, length '
+            'FROM pages p JOIN blobs USING (content_hash) '
+            'WHERE (? IS NULL OR lang = ?) AND (? IS NULL OR crawl_date = ?) '
+            'AND (NOT ? OR crawl_date = (SELECT MAX(crawl_date) FROM pages l '
+            'WHERE l.book_id = p.book_id AND l.lang = p.lang)) '
+            'ORDER BY segment, offset', (lang, lang, crawl_date, crawl_date, latest))
+        fh = None
+        current_segment = None
+        current_hash, current_html = None, None
+        try:
+            for book_id, page_lang, page_crawl_date, content_hash, segment, offset, length in rows:
+                if segment != current_segment:
+                    if fh is not None:
+                        fh.close()
+                    fh = open(self.get_segment_file(segment), 'rb')
+                    current_segment = segment
+                if content_hash != current_hash:
+                    current_hash, current_html = content_hash, self._read_blob(fh, offset, length)
+                yield book_id, page_lang, page_crawl_date, current_html
+        finally:
+            if fh is not None:
+                fh.close()
+
+    def get_stats(self) -> dict:
+        num_pages, = self.conn.execute('SELECT COUNT(*) FROM pages').fetchone()
+        num_blobs, raw_size, compressed_size = self.conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(raw_size), 0), COALESCE(SUM(length), 0) FROM blobs').fetchone()
+        return {
+            'pages': num_pages,
+            'distinct_pages': num_blobs,
+            'raw_size': raw_size,
+            'compressed_size': compressed_size,
+        }
+
+
+def train_dictionary(store_dir: str, html_files: List[str], dict_size: int = 256 * 1024) -> None:
+    """Train a zstd dictionary on a sample of HTML files and save it in a new, empty store directory."""
+    dict_file = os.path.join(store_dir, DICTIONARY_FILENAME)
+    if os.path.exists(os.path.join(store_dir, 'index.sqlite')):
+        raise ValueError(f"cannot add a dictionary to existing store {store_dir}")
+    samples = []
+    for html_file in html_files:
+        with open(html_file, 'rb') as fh:
+            samples.append(fh.read())
+    dict_data = zstandard.train_dictionary(dict_size, samples)
+    if not os.path.isdir(store_dir):
+        os.makedirs(store_dir)
+    with open(dict_file, 'wb') as fh:
+        fh.write(dict_data.as_bytes())
+
+
+def import_html_dir(store: SnapshotStore, html_dir: str, crawl_date: str = None,
+                    commit_every: int = 1000) -> int:
+    """Add all pages of a crawl directory with per-language directories
+    (<html_dir>/<lang>/<book_id>.html) to the store. Returns the number of imported pages."""
+    if crawl_date is None:
+        crawl_date = get_crawl_date(html_dir)
+    if crawl_date is None:
+        raise ValueError(f"cannot determine the crawl date of {html_dir}, pass it as crawl_date")
+    html_files = glob.glob(os.path.join(html_dir, '*', '*.html'))
+    for fi, html_file in enumerate(html_files):
+        lang_dir, filename = os.path.split(html_file)
+        _, lang = os.path.split(lang_dir)
+        book_id = filename.replace('.html', '')
+        with open(html_file, 'rt') as fh:
+            store.put(book_id, lang, crawl_date, fh.read())
+        if (fi+1) % commit_every == 0:
+            store.commit()
+            print(f"{fi+1} of {len(html_files)} files imported")
+    store.commit()
+    return len(html_files)
+
+
+def main():
+    html_dir = '../../data/reviews/Multilingual/Goodreads/HTML-2025-10-23/'
+    store_dir = '../../data/reviews/Multilingual/Goodreads/HTML-snapshots/'
+    with SnapshotStore(store_dir) as store:
+        num_files = import_html_dir(store, html_dir)
+        print(f"imported {num_files} files, store stats: {store.get_stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+import argparse
+import json
+import os
+import random
+from html import escape
+from typing import Dict, List, Tuple
+
+
+WORDS = [
+    'book', 'story', 'character', 'ending', 'plot', 'writing', 'boek', 'verhaal', 'personage', 'Buch',
+    'Geschichte', 'Handlung', 'libro', 'storia', 'finale', 'lettura', 'roman', 'über', 'più', 'façade',
+    '소설', '이야기', '小说', '故事', 'книга', 'история',
+]
+
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September',
+          'October', 'November', 'December']
+
+PAGE_KINDS = ['old_style', 'new_style', 'book_list']
+
+
+def make_sentence(rng: random.Random) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(4, 14))]
+    return ' '.join(words).capitalize() + '.'
+
+
+def make_paragraphs(rng: random.Random) -> List[str]:
+    return [' '.join(make_sentence(rng) for _ in range(rng.randint(1, 5))) for _ in range(rng.randint(1, 4))]
+
+
+def make_page_head(book_id: str, title: str, author_url: str, langs: List[str]) -> Tuple[str, Dict[str, any]]:
+    """Generate the head of a book page, with its expected metadata fields and language links."""
+    book_url = f"https://www.goodreads.com/book/show/{book_id}"
+    meta = {
+        'book_title': title,
+        'book_description': f"A synthetic description of {title}.",
+        'book_url': book_url,
+        'book_image': f"https://images.example.org/{book_id}.jpg",
+        'book_type': 'books.book',
+        'book_author': author_url,
+        'book_isbn': '9780000000002',
+        'book_page_count': '321',
+    }
+    properties = {
+        'og:title': 'book_title', 'og:description': 'book_description', 'og:url': 'book_url',
+        'og:image': 'book_image', 'og:type': 'book_type', 'books:author': 'book_author',
+        'books:isbn': 'book_isbn', 'books:page_count': 'book_page_count',
+    }
+    lines = ['<head>', f'<title>{escape(title)}</title>', '<meta charset="utf-8"/>',
+             '<meta name="viewport" content="width=device-width"/>']
+    for prop, field in properties.items():
+        lines.append(f'<meta property="{prop}" content="{escape(meta[field])}"/>')
+    lines.append(f'<link rel="canonical" href="{book_url}"/>')
+    lines.append('<link rel="stylesheet" href="/assets/goodreads.css"/>')
+    language_links = []
+    for lang in langs:
+        lang_url = f"https://www.goodreads.com/{lang}/book/show/{book_id}"
+        lines.append(f'<link rel="alternate" hreflang="{lang}" href="{lang_url}"/>')
+        language_links.append({'rel': 'alternate', 'hreflang': lang, 'href': lang_url})
+    lines.append('</head>')
+    return '\n'.join(lines), {'meta': meta, 'canonical_url': book_url, 'language_links': language_links}
+
+
+def make_old_style_review(rng: random.Random, book_id: str, lang: str, ri: int) -> Tuple[str, Dict[str, any]]:
+    """Generate a div.review element and the output expected from parse_review."""
+    user_id = rng.randint(1, 10 ** 8)
+    user_name = f"Reader {user_id}"
+    user_url = f"/user/show/{user_id}-reader"
+    review_date = f"{MONTHS[rng.randint(0, 11)][:3]} {rng.randint(1, 28)}, {rng.randint(2008, 2024)}"
+    rating = rng.randint(0, 5)
+    edition = f"Paperback edition {rng.randint(1000000000, 9999999999)}" if rng.random() < 0.5 else None
+    paragraphs = make_paragraphs(rng)
+    edition_html = f'<a class="lightGreyText" href="/book/show/{ri}" title="{escape(edition)}">edition</a>' \
+        if edition is not None else ''
+    stars = ''.join('<span class="staticStar p10" size="15x15"></span>' for _ in range(rating))
+    html = (
+        f'<div id="review_{ri}" class="friendReviews elementListBrown">'
+        f'<div class="section firstReview"><div class="review" id="review_{user_id}_{ri}">'
+        f'<a class="left imgcol" href="{user_url}"><img alt="{escape(user_name)}" src="/u.jpg"/></a>'
+        f'<div class="left bodycol"><div class="reviewHeader uitext stacked">'
+        f'<a class="reviewDate createdAt right" href="/review/show/{ri}">{review_date}</a>'
+        f'<span itemprop="author"><a class="user" href="{user_url}" name="{escape(user_name)}">'
+        f'{escape(user_name)}</a></span> rated it {stars} {edition_html}</div>'
+        f'<div class="reviewText stacked"><span class="readable" id="reviewTextContainer{ri}">'
+        f'<span id="freeTextContainer{ri}">{escape(paragraphs[0][:50])}</span>'
+        f'<span id="freeText{ri}" style="display:none">{"<br/><br/>".join(escape(p) for p in paragraphs)}</span>'
+        f'</span></div></div></div></div></div>'
+    )
+    expected = {
+        'username': user_name,
+        'userurl': user_url,
+        'goodreads_book_id': book_id,
+        'goodreads_book_num': book_id.split('.')[0],
+        'review_date': review_date,
+        'rating': rating,
+        'edition': edition,
+        'review_lang': lang,
+        'review_text': '\n\n'.join(paragraphs),
+    }
+    return html, expected
+
+
+def make_old_style_page(num_reviews: int, seed: int = 0, lang: str = 'de') -> Tuple[str, Dict[str, any]]:
+    """Generate an old style Goodreads book page with div.review elements, and the expected
+    output of get_book_metadata, get_review_text and parse_review for it."""
+    rng = random.Random(seed)
+    book_id = f"{rng.randint(1, 10 ** 7)}.Synthetic_Book"
+    title = f"Synthetic Book {seed}"
+    author_name = f"Author {seed}"
+    author_url = f"https://www.goodreads.com/author/show/{seed}.Author"
+    head, head_expected = make_page_head(book_id, title, author_url, ['de', 'it', 'nl', 'ko', 'zh'])
+    genres = [(['Fiction'], '1,234 users'), (['Fantasy', 'Epic Fantasy'], '567 users'), (['Classics'], '89 users')]
+    genre_html = []
+    for genre_names, users in genres:
+        links = ' &gt; '.join(f'<a class="actionLinkLite bookPageGenreLink" href="/genres/{name}">{name}</a>'
+                              for name in genre_names)
+        genre_html.append(f'<div class="elementList"><div class="left">{links}</div>'
+                          f'<div class="right"><div class="smallText bookPageGenreLink" title="{users}">'
+                          f'{users}</div></div></div>')
+    reviews_html = []
+    reviews_expected = []
+    for ri in range(num_reviews):
+        review_html, review_expected = make_old_style_review(rng, book_id, lang, ri)
+        reviews_html.append(review_html)
+        reviews_expected.append(review_expected)
+    body = (
+        '<body><div class="content"><div id="metacol" class="last col">'
+        f'<h1 id="bookTitle">{escape(title)}</h1>'
+        f'<div id="bookAuthors"><div class="authorName__container"><a class="authorName" href="{author_url}">'
+        f'<span itemprop="name">{escape(author_name)}</span></a></div></div>'
+        '<div id="bookMeta"><span itemprop="ratingValue">4.12</span>'
+        '<meta itemprop="ratingCount" content="98765"/><meta itemprop="reviewCount" content="4321"/></div>'
+        '</div>'
+        f'<div class="rightContainer">{"".join(genre_html)}</div>'
+        f'<div id="bookReviews">{"".join(reviews_html)}</div>'
+        '</div></body>'
+    )
+    html = f'<html lang="{lang}">\n{head}\n{body}\n</html>\n'
+    book_metadata = {
+        'goodreads_book_id': book_id,
+        'goodreads_book_num': book_id.split('.')[0],
+        'source_url': head_expected['canonical_url'],
+        'review_file_language': lang,
+    }
+    book_metadata.update(head_expected['meta'])
+    book_metadata.update({
+        'author_name': [author_name],
+        'avg_rating': 4.12,
+        'num_ratings': 98765,
+        'num_reviews': 4321,
+        'genres': [{'genre': ' -- '.join(names), 'users': users} for names, users in genres],
+    })
+    expected = {
+        'book_id': book_id,
+        'lang': lang,
+        'get_book_metadata': book_metadata,
+        'get_canonical_url': head_expected['canonical_url'],
+        'get_language_links': head_expected['language_links'],
+        'get_review_text': [review['review_text'].split('\n\n') for review in reviews_expected],
+        'parse_review': reviews_expected,
+    }
+    return html, expected
+
+
+def make_review_card(rng: random.Random, ri: int) -> Tuple[str, Dict[str, any]]:
+    """Generate an article.ReviewCard element and the output expected from extract_review."""
+    user_id = rng.randint(1, 10 ** 8)
+    user_name = f"Reader {user_id}"
+    user_url = f"https://www.goodreads.com/user/show/{user_id}-reader"
+    review_url = f"https://www.goodreads.com/review/show/{rng.randint(1, 10 ** 9)}" if rng.random() < 0.9 else None
+    review_date = f"{MONTHS[rng.randint(0, 11)]} {rng.randint(1, 28)}, {rng.randint(2008, 2024)}"
+    rating = rng.randint(1, 5) if rng.random() < 0.9 else None
+    paragraphs = make_paragraphs(rng)
+    rating_html = f'<span aria-label="Rating {rating} out of 5" role="img" class="RatingStars RatingStars__small">' \
+                  f'<span class="baseClass RatingStar--small"></span></span>' if rating is not None else ''
+    link_attrs = f' href="{review_url}"' if review_url is not None else ''
+    html = (
+        f'<article class="ReviewCard" aria-label="Review by {escape(user_name)}">'
+        f'<div class="ReviewCard__reviewer"><div class="ReviewerProfile"><div class="ReviewerProfile__name">'
+        f'<a href="{user_url}">{escape(user_name)}</a></div></div></div>'
+        f'<section class="ReviewCard__content"><section class="ReviewCard__row">'
+        f'<div class="ShelfStatus">{rating_html}</div>'
+        f'<span class="Text Text__body3"><a{link_attrs}>{review_date}</a></span></section>'
+        f'<section class="ReviewText"><section class="ReviewText__content"><div class="TruncatedContent">'
+        f'<span class="Formatted">{"<br/>".join(escape(p) for p in paragraphs)}</span></div></section></section>'
+        f'</section></article>'
+    )
+    expected = {
+        'review_text': ''.join(paragraphs),
+        'user_url': user_url,
+        'user_name': user_name,
+        'review_url': review_url,
+        'review_date': review_date,
+        'rating': rating,
+    }
+    return html, expected
+
+
+def make_new_style_page(num_reviews: int, seed: int = 0, lang: str = 'it') -> Tuple[str, Dict[str, any]]:
+    """Generate a new style Goodreads book page with article.ReviewCard elements and a carousel
+    of similar books, and the expected output of extract_review and extract_enjoyed_books."""
+    rng = random.Random(seed)
+    book_id = f"{rng.randint(1, 10 ** 7)}-synthetic-book"
+    title = f"Synthetic Book {seed}"
+    author_url = f"https://www.goodreads.com/author/show/{seed}.Author"
+    head, head_expected = make_page_head(book_id, title, author_url, ['de', 'it', 'nl', 'ko', 'zh'])
+    cards_html = []
+    cards_expected = []
+    for ri in range(num_reviews):
+        card_html, card_expected = make_review_card(rng, ri)
+        cards_html.append(card_html)
+        cards_expected.append(card_expected)
+    enjoyed_urls = [f"https://www.goodreads.com/book/show/{rng.randint(1, 10 ** 7)}-similar" for _ in range(10)]
+    book_cards = ''.join(f'<div class="BookCard"><a class="BookCard__clickCardTarget" href="{url}">'
+                         f'<span>Similar</span></a></div>' for url in enjoyed_urls)
+    body = (
+        '<body><div id="__next"><main class="PageFrame">'
+        f'<h1 class="Text Text__title1" data-testid="bookTitle">{escape(title)}</h1>'
+        f'<section class="Carousel"><div class="Carousel__items">{book_cards}</div></section>'
+        f'<div class="ReviewsList">{"".join(cards_html)}</div>'
+        '</main></div></body>'
+    )
+    html = f'<html lang="{lang}">\n{head}\n{body}\n</html>\n'
+    expected = {
+        'book_id': book_id,
+        'lang': lang,
+        'get_canonical_url': head_expected['canonical_url'],
+        'get_language_links': head_expected['language_links'],
+        'extract_review': cards_expected,
+        'extract_enjoyed_books': enjoyed_urls,
+    }
+    return html, expected
+
+
+def make_book_list_page(num_books: int, seed: int = 0, num_pages: int = 12) -> Tuple[str, Dict[str, any]]:
+    """Generate a Goodreads book list page and the expected output of get_book_list_books
+    and get_book_list_pagination_urls."""
+    rng = random.Random(seed)
+    book_list = f"Synthetic List {seed}"
+    list_url = f"/list/show/{seed}.Synthetic_List"
+    rows = []
+    books = []
+    for bi in range(num_books):
+        book_num = rng.randint(1, 10 ** 7)
+        book_url = f"/book/show/{book_num}.Book_{bi}"
+        title = f"Book {bi} {rng.choice(WORDS)}"
+        author_name = f"Author {rng.randint(1, 10 ** 5)}"
+        author_url = f"https://www.goodreads.com/author/show/{bi}.Author"
+        rows.append(
+            f'<tr itemscope="" itemtype="http://schema.org/Book"><td valign="top" class="number">{bi + 1}</td>'
+            f'<td width="5%" valign="top"><div id="{book_num}" class="js-tooltipTrigger tooltipTrigger" '
+            f'data-resource-type="Book" data-resource-id="{book_num}"><a href="{book_url}">'
+            f'<img alt="{escape(title)}" src="/cover.jpg"/></a></div></td>'
+            f'<td width="100%" valign="top"><a class="bookTitle" href="{book_url}">'
+            f'<span itemprop="name">{escape(title)}</span></a><br/><span class="by">by</span> '
+            f'<span itemprop="author"><div class="authorName__container"><a class="authorName" href="{author_url}">'
+            f'<span itemprop="name">{escape(author_name)}</span></a></div></span></td></tr>'
+        )
+        books.append({
+            'book_id': str(book_num),
+            'book_title': title,
+            'book_url': book_url,
+            'author_name': author_name,
+            'author_url': author_url,
+            'book_lists': [book_list],
+        })
+    page_links = ' '.join(f'<a href="{list_url}?page={page_num}">{page_num}</a>'
+                          for page_num in range(2, num_pages + 1))
+    pagination = (f'<div class="pagination"><span class="previous_page disabled">previous</span> '
+                  f'<em class="current">1</em> {page_links} '
+                  f'<a class="next_page" rel="next" href="{list_url}?page=2">next</a></div>')
+    body = (f'<body><div class="mainContent"><h1>{escape(book_list)}</h1>'
+            f'<table class="tableList js-dataTooltip">{"".join(rows)}</table>{pagination}</div></body>')
+    html = f'<html>\n<head><title>{escape(book_list)}</title></head>\n{body}\n</html>\n'
+    expected = {
+        'book_list': book_list,
+        'get_book_list_books': books,
+        'get_book_list_pagination_urls': [f"{list_url}?page={page_num}" for page_num in range(2, num_pages + 1)],
+    }
+    return html, expected
+
+
+def make_page(page_kind: str, size: int, seed: int = 0) -> Tuple[str, Dict[str, any]]:
+    """Generate a synthetic page of the given kind with `size` reviews or books."""
+    if page_kind == 'old_style':
+        return make_old_style_page(size, seed=seed)
+    elif page_kind == 'new_style':
+        return make_new_style_page(size, seed=seed)
+    elif page_kind == 'book_list':
+        return make_book_list_page(size, seed=seed)
+    raise ValueError(f"unknown page kind '{page_kind}', must be one of {PAGE_KINDS}")
+
+
+def get_fixture_files(fixture_dir: str, page_kind: str, size: int) -> Tuple[str, str]:
+    fixture_base = os.path.join(fixture_dir, f'{page_kind}-{size}')
+    return f'{fixture_base}.html', f'{fixture_base}.json'
+
+
+def write_fixtures(fixture_dir: str, size: int = 5, seed: int = 0) -> None:
+    """Write a small page of every kind and its expected extractor output as golden fixtures."""
+    if not os.path.isdir(fixture_dir):
+        os.makedirs(fixture_dir)
+    for page_kind in PAGE_KINDS:
+        html, expected = make_page(page_kind, size, seed=seed)
+        html_file, json_file = get_fixture_files(fixture_dir, page_kind, size)
+        with open(html_file, 'wt', encoding='utf-8') as fh:
+            fh.write(html)
+        with open(json_file, 'wt', encoding='utf-8') as fh:
+            json.dump(expected, fh, indent=2, ensure_ascii=False)
+            fh.write('\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic Goodreads pages as golden fixtures.')
+    parser.add_argument('fixture_dir', help='output directory for the fixtures')
+    parser.add_argument('--size', type=int, default=5, help='number of reviews or books per page')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    write_fixtures(args.fixture_dir, size=args.size, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import asyncio
+import email.utils
+import random
+import threading
+import time
+from typing import Dict, Union
+from urllib.parse import urlparse
+
+import metrics
+
+
+# HTTP statuses that mean the server wants us to slow down
+THROTTLE_STATUSES = {429, 500, 502, 503, 504}
+# text fragments of the (short) pages served instead of the requested page when a crawler is blocked
+BLOCK_PAGE_MARKERS = ['captcha', 'request unsuccessful', 'access denied', 'unusual traffic']
+MAX_BLOCK_PAGE_SIZE = 20000
+
+# requests per second, the initial rate and the minimum are in line with the random 10-20 s sleeps
+# this replaces, the maximum keeps the crawl polite when the server responds fine
+THROTTLE_DEFAULTS = {
+    'rate': 0.1,
+    'min_rate': 0.05,
+    'max_rate': 1.0,
+    'increase': 0.01,
+    'decrease': 0.5,
+    'jitter': 0.2,
+}
+
+
+def parse_retry_after(value: Union[str, None]) -> Union[float, None]:
+    """Parse the value of a Retry-After header (seconds or an HTTP date) into seconds."""
+    if value is None:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_date.timestamp() - time.time())
+
+
+def is_block_page(html: Union[str, None]) -> bool:
+    if html is None or len(html) > MAX_BLOCK_PAGE_SIZE:
+        return False
+    html = html.lower()
+    return any(marker in html for marker in BLOCK_PAGE_MARKERS)
+
+
+class AdaptiveThrottle:
+    """An AIMD (additive increase, multiplicative decrease) rate controller for the requests
+    to a single host. Every healthy response raises the rate by `increase` requests per
+    second up to `max_rate`, every throttled response (429/5xx, timeouts, block pages)
+    multiplies the rate by `decrease` down to `min_rate` and pauses all requests for the
+    Retry-After time or for one interval at the new rate.
+
+    Requests reserve the next free slot, so the throttle can be shared by threads and by
+    coroutines (use wait() in synchronous code and `await acquire()` in async code)."""
+
+    def __init__(self, rate: float = THROTTLE_DEFAULTS['rate'], min_rate: float = THROTTLE_DEFAULTS['min_rate'],
+                 max_rate: float = THROTTLE_DEFAULTS['max_rate'], increase: float = THROTTLE_DEFAULTS['increase'],
+                 decrease: float = THROTTLE_DEFAULTS['decrease'], jitter: float = THROTTLE_DEFAULTS['jitter']):
+        if not 0 < min_rate <= max_rate:
+            raise ValueError(f"expected 0 < min_rate <= max_rate, got {min_rate} and {max_rate}")
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate = min(max(rate, min_rate), max_rate)
+        self.increase = increase
+        self.decrease = decrease
+        self.jitter = jitter
+        self.next_time = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Reserve the next request slot and return the number of seconds until it."""
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_time, self.blocked_until)
+            interval = random.uniform(1 - self.jitter, 1 + self.jitter) / self.rate
+            self.next_time = slot + interval
+        wait_time = slot - now
+        metrics.counter('throttle.wait_seconds').inc(wait_time)
+        return wait_time
+
+    def wait(self) -> None:
+        time.sleep(self._reserve())
+
+    async def acquire(self) -> None:
+        await asyncio.sleep(self._reserve())
+
+    def on_success(self) -> None:
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+        metrics.histogram('throttle.rate').observe(self.rate)
+
+    def on_throttle(self, retry_after: float = None) -> None:
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            pause = retry_after if retry_after is not None else 1 / self.rate
+            self.blocked_until = max(self.blocked_until, time.monotonic() + pause)
+        metrics.counter('throttle.backoffs').inc()
+        metrics.histogram('throttle.rate').observe(self.rate)
+
+    def on_response(self, status: int, html: str = None, retry_after: float = None) -> bool:
+        """Update the rate for a response and return whether the response was throttled
+        (a throttling status or a block page), in which case it should be retried."""
+        if status in THROTTLE_STATUSES or is_block_page(html):
+            self.on_throttle(retry_after)
+            return True
+        self.on_success()
+        return False
+
+
+HOST_THROTTLES: Dict[str, AdaptiveThrottle] = {}
+HOST_THROTTLES_LOCK = threading.Lock()
+
+
+def get_throttle(url: str, **throttle_kwargs) -> AdaptiveThrottle:
+    """Return the throttle of the host of a URL, shared by all crawlers in the process. The
+    keyword arguments (see THROTTLE_DEFAULTS) only apply when the throttle is created."""
+    host = urlparse(url).netloc
+    with HOST_THROTTLES_LOCK:
+        if host not in HOST_THROTTLES:
+            HOST_THROTTLES[host] = AdaptiveThrottle(**{**THROTTLE_DEFAULTS, **throttle_kwargs})
+        return HOST_THROTTLES[host]